@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Benchmark of the report rendering
+
+Summary :
+    Measure the cost of loading the report templates and rendering a report
+    The templates are cached in memory, so only repeated loads within one
+    process (check-many, library use) are cached - every command line run
+    still compiles the templates it uses once.
+Use Case :
+    As a maintainer I want to track the startup and render time of reports
+    So that regressions in the report path are visible
+
+Testable Statements :
+    Can I measure first (compile) and repeated (in-process cached) template loads
+    Can I measure rendering a large directory table
+"""
+import sys
+import timeit
+
+import click
+
+import cataloger.commands as commands
+import cataloger.reports as reports
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+class _FakeEnv(object):
+    """The minimum of a Cataloger needed to render a check report"""
+    def __init__(self, directories):
+        self._directories = directories
+
+    @property
+    def catalog_summary_by_directory(self):
+        for index in range(self._directories):
+            yield {'path': 'dir{:05d}'.format(index), 'added': 0,
+                   'processed': index % 7, 'excluded': index % 3, 'missing': index % 5,
+                   'mismatch': 0, 'extra': index % 2}
+
+
+def _render(env):
+    return commands.get_renderer('final_check.tmpl').from_context(
+        {'processed_count': 0},
+        {'report_excluded': True, 'excluded_files': []},
+        {'report_extension': False, 'extensions': []},
+        {'report_mismatch': True, 'mismatched': []},
+        {'report_missing': True, 'missing': []},
+        {'report_extra': True, 'extra': []},
+        {'verbose': 3},
+        {'by_directory': reports.directory_rows(env, reports.CHECK_COLUMNS)})
+
+
+@click.command()
+@click.option('-d', '--directories', default=1000, help='Number of directory rows to render')
+@click.option('-n', '--number', default=20, help='Number of repetitions of each measurement')
+def main(directories, number):
+    """Report the template load and render times - within one process"""
+    start = timeit.default_timer()
+    commands.get_renderer('final_check.tmpl')
+    first_load = timeit.default_timer() - start
+
+    cached_load = timeit.timeit(lambda: commands.get_renderer('final_check.tmpl'), number=number) / number
+    uncached_load = timeit.timeit(lambda: commands.get_renderer.__wrapped__('final_check.tmpl'),
+                                  number=number) / number
+
+    env = _FakeEnv(directories)
+    render = timeit.timeit(lambda: _render(env), number=number) / number
+
+    click.echo('First template load   : {:10.3f} ms'.format(first_load * 1000))
+    click.echo('Uncached compile      : {:10.3f} ms'.format(uncached_load * 1000))
+    click.echo('In-process cached load: {:10.3f} ms'.format(cached_load * 1000))
+    click.echo('Render {:6d} rows     : {:10.3f} ms'.format(directories, render * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Benchmark of sparse file hashing
+
+Summary :
+    Measure hashing sparse files with and without skipping their holes
+Use Case :
+    As a maintainer I want to know the saving from sparse aware hashing
+    So that catalogs of disk images and preallocated files stay fast
+
+Testable Statements :
+    Can I create sparse files with a given proportion of data
+    Are the signatures the same with and without skipping the holes
+    Can I measure the time and the bytes read from the disk for each
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import click
+
+import cataloger.readers as readers
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+def make_sparse_file(path, size, data_fraction, regions=16):
+    """Create a sparse file of size bytes - with data_fraction of it written in evenly spaced regions"""
+    region = max(1, int(size * data_fraction / regions))
+    with open(path, 'wb') as fp:
+        for index in range(regions):
+            fp.seek(index * (size // regions))
+            fp.write(os.urandom(min(region, 1024 * 1024)) * (region // (1024 * 1024) or 1))
+        fp.truncate(size)
+
+
+def _digest(path, sparse):
+    digest = hashlib.sha224()
+    readers.hash_file(path, digest.update, sparse=sparse)
+    return digest.hexdigest()
+
+
+def _data_bytes(path):
+    """The bytes in the data regions of the file - those read when skipping the holes"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return sum(length for _, length, is_data in readers.regions(fd) if is_data)
+    finally:
+        os.close(fd)
+
+
+@click.command()
+@click.option('-s', '--size', default=256, help='Size of each sparse file in MB')
+@click.option('-d', '--data', 'data_fraction', default=0.05, help='Fraction of each file which is data')
+@click.option('-f', '--files', default=4, help='Number of sparse files')
+@click.option('-n', '--number', default=3, help='Number of timed runs to take the best of')
+@click.option('--directory', default=None, help='Where to create the files - default a temporary directory')
+def main(size, data_fraction, files, number, directory):
+    """Compare hashing sparse files with a full read and with the holes skipped"""
+    tmp = tempfile.mkdtemp(dir=directory)
+    try:
+        paths = [os.path.join(tmp, 'sparse{}.img'.format(index)) for index in range(files)]
+        for path in paths:
+            make_sparse_file(path, size * 1024 * 1024, data_fraction)
+
+        fd = os.open(paths[0], os.O_RDONLY)
+        try:
+            sparse_supported = readers.is_sparse(fd)
+        finally:
+            os.close(fd)
+        if not sparse_supported:
+            click.echo('The files in {} are not sparse - the file system does not support holes'.format(tmp))
+
+        for path in paths:
+            if _digest(path, sparse=False) != _digest(path, sparse=True):
+                click.echo('Signature mismatch for {}'.format(path))
+                return 1
+
+        total = files * size
+        data = sum(_data_bytes(path) for path in paths) / (1024 * 1024)
+        for label, sparse in (('full read', False), ('holes skipped', True)):
+            best = min(timeit.repeat(lambda: [_digest(path, sparse) for path in paths], number=1, repeat=number))
+            click.echo('{:<14} : {:8.3f} s  {:9.1f} MB/s  ({:.1f} MB read from disk)'.format(
+                label, best, total / best, data if sparse else total))
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(standalone_mode=False))
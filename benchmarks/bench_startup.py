@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Benchmark of the command line startup
+
+Summary :
+    Measure the import time of the command line, using python -X importtime
+Use Case :
+    As a maintainer I want to track the startup cost of the catalog command
+    So that health probes which run it thousands of times a day stay cheap
+
+Testable Statements :
+    Can I measure the cumulative import time of cataloger.main
+    Can I list the slowest imports
+    Does the run fail when the startup budget is exceeded
+"""
+import re
+import statistics
+import subprocess
+import sys
+
+import click
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+# The budget for importing the command line (cataloger.main) in milliseconds
+STARTUP_BUDGET_MS = 40.0
+
+# Modules which must not be imported just to load the command line
+LAZY_MODULES = ['hashlib', 'templatelite', 'importlib.metadata', 'six',
+                'cataloger.processor', 'cataloger.commands']
+
+_importtime_re = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def import_times(statement):
+    """Run the statement in a fresh interpreter and return the import times
+
+       Returns a list of (module, self us, cumulative us, depth)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        m = _importtime_re.match(line)
+        if m:
+            times.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    return times
+
+
+@click.command()
+@click.option('-n', '--number', default=10, help='Number of interpreter runs to take the median of')
+@click.option('-t', '--top', default=10, help='Number of the slowest imports to list')
+@click.option('-b', '--budget', default=STARTUP_BUDGET_MS, help='Startup budget in milliseconds')
+def main(number, top, budget):
+    """Report the import time of the catalog command line against a budget"""
+    statement = 'import cataloger.main'
+    runs = [import_times(statement) for _ in range(number)]
+
+    totals = [next(cumulative for module, _, cumulative, depth in run
+                   if module == 'cataloger.main') / 1000 for run in runs]
+    median = statistics.median(totals)
+
+    last = runs[-1]
+    click.echo('Slowest imports (cumulative, last run):')
+    for module, _, cumulative, depth in sorted(last, key=lambda t: -t[2])[:top]:
+        click.echo('    {:<40} {:8.2f} ms'.format(module, cumulative / 1000))
+
+    imported = {module for module, _, _, _ in last}
+    eager = [module for module in LAZY_MODULES if module in imported]
+
+    click.echo('import cataloger.main : median {:.2f} ms over {} runs (budget {:.2f} ms)'.format(
+        median, number, budget))
+    if eager:
+        click.echo('Eagerly imported : {}'.format(', '.join(eager)))
+
+    return 1 if median > budget or eager else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(standalone_mode=False))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of aio.py
+
+Summary :
+    An asyncio API for checking and creating catalogs
+Use Case :
+    As a developer of an asyncio service I want to check catalogs without
+    blocking the event loop So that many roots can be checked concurrently
+
+Testable Statements :
+    Can I iterate the results of a check or create with async for
+    Is the blocking stat and hash work run in a shared, bounded executor
+    Is the number of files being hashed at once limited across all checks
+    Are the results yielded in the same order as iter_check/iter_create
+    Are the Cataloger's timeouts, deadline and fail fast honoured
+"""
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cataloger import defaults
+from cataloger.processor import Cataloger
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+class HashPool(object):
+    """A bounded executor for the blocking work of async checks and creates
+
+        :param max_workers: The number of worker threads - each running check
+                or create is driven from one of them, so this is also the
+                number which run at once
+        :param max_in_flight: The maximum number of files being hashed at
+                once - across every check or create using this pool
+
+        The executor and the limit are shared by every acheck and acreate
+        using the pool, so concurrent checks of many roots share the I/O
+        capacity of the host rather than each adding its own threads.
+    """
+
+    def __init__(self, max_workers=defaults.DEFAULT_ASYNC_WORKERS,
+                 max_in_flight=defaults.DEFAULT_ASYNC_IN_FLIGHT):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='cataloger')
+        self._max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    @property
+    def max_in_flight(self):
+        """The maximum number of files being hashed at once"""
+        return self._max_in_flight
+
+    async def run(self, func, *args):
+        """Run a blocking call in the executor"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args))
+
+    async def hash(self, func, *args):
+        """Run a blocking hash in the executor - within the in flight limit"""
+        return await self.run(self._limited(func), *args)
+
+    def _limited(self, func):
+        """The blocking call - waiting for a place within the in flight limit"""
+        @functools.wraps(func)
+        def limited(*args, **kwargs):
+            with self._in_flight:
+                return func(*args, **kwargs)
+        return limited
+
+    def shutdown(self, wait=True):
+        """Shutdown the executor - the pool can't be used afterwards"""
+        self._executor.shutdown(wait=wait)
+
+
+_shared_pool = None
+
+
+def shared_pool():
+    """The HashPool used when acheck or acreate is not given a pool"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = HashPool()
+    return _shared_pool
+
+
+_DONE = object()    # Marks the end of a run in the queue of results
+
+
+@contextlib.contextmanager
+def _in_flight_limited(env, pool):
+    """Count every file the Cataloger hashes against the pool's in flight limit"""
+    own = '_file_signature' in vars(env)
+    file_signature = env._file_signature
+    env._file_signature = pool._limited(file_signature)
+    try:
+        yield
+    finally:
+        if own:
+            env._file_signature = file_signature
+        else:
+            del env._file_signature
+
+
+def _run(results, hand_over, slots, stopped):
+    """Iterate the results of a run in an executor thread - handing each over
+
+        A place in slots is taken for each result, and given back as the
+        result is consumed - so a slow consumer holds back the run rather than
+        the results piling up.
+    """
+    try:
+        for result in results:
+            slots.acquire()
+            if stopped.is_set():
+                break
+            hand_over(result)
+    finally:
+        # Cancels the hashing which hasn't started if the run stopped early
+        results.close()
+
+
+async def _aiter_results(iter_results, env, pool, retain):
+    """Run a check or create on the pool, yielding each Result in order
+
+        The run is iter_check or iter_create - with every option of the
+        Cataloger (timeouts, deadline, fail fast, schedule, batching and
+        prefetching) - driven from one of the pool's threads. The results are
+        handed over to the event loop through a queue, with at most
+        max_in_flight of them waiting there.
+    """
+    pool = pool if pool is not None else shared_pool()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots, stopped = threading.Semaphore(pool.max_in_flight), threading.Event()
+
+    def run():
+        try:
+            with _in_flight_limited(env, pool):
+                _run(iter_results(retain), functools.partial(loop.call_soon_threadsafe, queue.put_nowait),
+                     slots, stopped)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+    runner = asyncio.ensure_future(pool.run(run))
+    try:
+        while True:
+            result = await queue.get()
+            if result is _DONE:
+                break
+            slots.release()
+            yield result
+        # Raises any error from the run
+        await runner
+    finally:
+        if not runner.done():
+            # The run can't be abandoned while it is running in the executor
+            stopped.set()
+            slots.release()
+            await asyncio.wait([runner])
+
+
+async def _cataloger(action, cataloger, pool, kwargs):
+    """The Cataloger to run - loading the catalog in the executor"""
+    if cataloger is not None:
+        return cataloger
+    pool = pool if pool is not None else shared_pool()
+    return await pool.run(functools.partial(Cataloger, action=action, **kwargs))
+
+
+async def acheck(cataloger=None, pool=None, retain=False, **kwargs):
+    """Check the local tree against the catalog - yielding each Result
+
+        :param cataloger: An existing Cataloger created with action='check'
+                - if None a Cataloger is created from the keyword arguments
+        :param pool: The HashPool to run the blocking work on - default is
+                the shared pool (see shared_pool)
+        :param retain: Boolean - as for Cataloger.iter_check
+        :param kwargs: The arguments for the Cataloger
+
+        An async generator; the results are the same, and in the same order,
+        as those from Cataloger.iter_check. Errors are raised as exceptions.
+    """
+    env = await _cataloger('check', cataloger, pool, kwargs)
+    if env._action != 'check':
+        raise ValueError('acheck needs a Cataloger created with action=\'check\'')
+    # Closed here, so that an abandoned run is stopped before this returns
+    async with contextlib.aclosing(_aiter_results(env.iter_check, env, pool, retain)) as results:
+        async for result in results:
+            yield result
+
+
+async def acreate(cataloger=None, pool=None, retain=False, **kwargs):
+    """Create the catalog from the local tree - yielding each Result
+
+        :param cataloger: An existing Cataloger created with action='create'
+                - if None a Cataloger is created from the keyword arguments
+        :param pool: The HashPool to run the blocking work on - default is
+                the shared pool (see shared_pool)
+        :param retain: Boolean - as for Cataloger.iter_create
+        :param kwargs: The arguments for the Cataloger
+
+        An async generator; the catalog file is written once every result has
+        been yielded. Errors are raised as exceptions.
+    """
+    env = await _cataloger('create', cataloger, pool, kwargs)
+    if env._action != 'create':
+        raise ValueError('acreate needs a Cataloger created with action=\'create\'')
+    async with contextlib.aclosing(_aiter_results(env.iter_create, env, pool, retain)) as results:
+        async for result in results:
+            yield result
@@ -14,46 +14,128 @@ Testable Statements :
 import os
 import os.path
 import sys
+import functools
+import contextlib
+import collections
 import click
 
-import cataloger.processor as processor
 import cataloger.defaults as defaults
 
-from importlib.resources import files
-
-from templatelite import Renderer, registerModifier, UnexpectedFilterArguments
+# The processor, templatelite and the reporting modules are imported by the
+# functions which need them, so that loading the command line is cheap.
 
 __version__ = "0.1"
 __author__ = 'Tony Flury : anthony.flury@btinternet.com'
 __created__ = '09 Feb 2016'
 
+@functools.lru_cache(maxsize=None)
 def find_template_path( name):
-    content = files('cataloger').iterdir()
-    for i in content:
+    from importlib.resources import files
+    templates = files('cataloger') / 'templates'
+    return templates / name if templates.is_dir() else None
 
-        if 'templates' in str(i):
-            return i / name
-    else:
-        return None
+@functools.lru_cache(maxsize=None)
+def get_renderer(name):
+    """Return the compiled Renderer for the named template
+
+       Each template is read and compiled at most once per process, so that
+       repeated API calls or report renders only pay for the render itself.
+    """
+    from templatelite import Renderer, registerModifier
+    registerModifier('format')(format)
+    return Renderer(template_file=find_template_path(name), remove_indentation=False)
+
+def _phase(env, name):
+    """Time a block as the named phase - if statistics are enabled"""
+    return env.stats.phase(name) if env.stats is not None else contextlib.nullcontext()
+
+def _run_options(options):
+    """The Cataloger options for a command
+
+       Statistics are needed for metrics. Progress is tracked when it is
+       displayed, or so that the live statistics can be dumped with SIGUSR1
+       on headless runs - when the handler can be installed.
+    """
+    import cataloger.progress as progress
+    display = bool(options.get('progress'))
+    options = dict(options, progress=progress.ProgressReporter(display=display)
+                   if display or progress.can_dump() else None)
+    if options.get('metrics_file'):
+        options['stats'] = True
+    return options
+
+def report_stats(env, options):
+    """Write the statistics table to stderr, and the metrics file - if requested"""
+    if options.get('stats') and env.stats is not None:
+        env.stats.stop()
+        sys.stderr.write(env.stats.summary_table())
+
+    # The throughput of a throttled run is always reported with the text output
+    limiter = getattr(env, 'read_limiter', None)
+    if limiter is not None and options.get('output_format', defaults.DEFAULT_FORMAT) == 'text':
+        sys.stderr.write(limiter.summary_line())
+
+    if options.get('metrics_file'):
+        write_metrics_file(env, options.get('command', ''), options['metrics_file'])
+
+def write_metrics_file(env, command, path):
+    """Write the metrics file - env is a Cataloger, or a list of them for a check-many"""
+    import cataloger.metrics as metrics
+    try:
+        metrics.write_metrics(env, command, path)
+    except (IOError, OSError) as e:
+        sys.stderr.write("Unable to write metrics file '{}' : {}\n".format(path, e))
+
+def report_options(command):
+    """The report options common to the check commands"""
+    for option in reversed([
+        click.option('-m/-M', 'report_mismatch', is_flag=True, default='report_mismatch' in defaults.DEFAULT_REPORTON,
+                help='Whether or not to report on files with mismatched checksums  - default Enabled.'),
+        click.option('-i/-I', 'report_missing', is_flag=True, default='report_missing' in defaults.DEFAULT_REPORTON,
+                help='Whether or not to report on files with mismatched checksums - default Enabled.'),
+        click.option('-x/-X', 'report_extra', is_flag=True, default='report_extra' in defaults.DEFAULT_REPORTON,
+                help='Whether or not to report on record_extra files - default Enabled.')]):
+        command = option(command)
+    return command
+
+def has_failures(env):
+    """True if the check found any reportable anomalies - or any file timed out,
+       or a check with a deadline verified too little of the catalog"""
+    return (env.report_category('mismatch') and env.status_count('mismatch') >0) or \
+            (env.report_category('missing') and env.status_count('missing') > 0) or \
+            (env.report_category('extra') and env.status_count('extra') > 0) or \
+            env.status_count('timeout') > 0 or env.below_min_coverage
 
 @click.command('check', help='Check local files against catalog')
-@click.option('-m/-M', 'report_mismatch', is_flag=True, default='report_mismatch' in defaults.DEFAULT_REPORTON,
-                help='Whether or not to report on files with mismatched checksums  - default Enabled.')
-@click.option('-i/-I', 'report_missing', is_flag=True, default='report_missing' in defaults.DEFAULT_REPORTON,
-                help='Whether or not to report on files with mismatched checksums - default Enabled.')
-@click.option('-x/-X', 'report_extra', is_flag=True, default='report_extra' in defaults.DEFAULT_REPORTON,
-                help='Whether or not to report on record_extra files - default Enabled.')
+@report_options
 @click.pass_context
 def check(ctx, **kwargs ):
+    import cataloger.reports as reports
     ctx.obj.update(kwargs)
+    options = _run_options(ctx.obj)
 
-    env = check_catalog(**ctx.obj)    # Indirect method to allow for API call
+    if ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'ndjson':
+        writer = reports.NDJSONWriter(kwargs.get('output', sys.stdout))
+        env = check_catalog(on_result=writer.write_result, retain_results=False, **options)
+        writer.write_summary(env)
+        writer.close()
+    else:
+        env = check_catalog(**options)    # Indirect method to allow for API call
 
-    if env.verbose > 0:
+    if env.first_failure is not None and ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'text':
+        if env.verbose > 0:
+            failure = env.first_failure
+            report = get_renderer('final_fail_fast.tmpl').from_context(
+                                {'status': failure.status, 'path': failure.path,
+                                 'expected': failure.expected, 'actual': failure.actual},
+                                {'verbose': env.verbose})
+            kwargs.get('output', sys.stdout).write(report)
+    elif env.verbose > 0 and ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'text':
+        from importlib.resources import files
         dist_files = files('cataloger')
         print(f"Using templates from {dist_files}")
-        report = Renderer( template_file=find_template_path('final_check.tmpl'),
-                           remove_indentation=False).from_context(
+        with _phase(env, 'render'):
+            report = get_renderer('final_check.tmpl').from_context(
                                 {'processed_count':env.processed_count},
                                {'report_excluded': env.report_category('excluded'),
                                 'excluded_files':env.excluded_files},
@@ -65,91 +147,326 @@ def check(ctx, **kwargs ):
                                  'missing': env.missing_files},
                                 {'report_extra': env.report_category('extra'),
                                     'extra': env.extra_files},
+                                {'timed_out': env.timed_out_files},
+                                {'deadline': env.deadline,
+                                 'coverage': '{:.1%}'.format(env.coverage or 0),
+                                 'unverified_count': env.status_count('unverified'),
+                                 'resume_token': env.resume_token,
+                                 'below_min_coverage': env.below_min_coverage},
                                 {'verbose': env.verbose},
-                                {'by_directory': env.catalog_summary_by_directory},
+                                {'by_directory': reports.directory_rows(env, reports.CHECK_COLUMNS)},
                             )
         kwargs.get('output', sys.stdout).write(report)
 
-    if (env.report_category('mismatch') and len(env.mismatched_files) >0) or \
-            (env.report_category('missing') and len(env.missing_files) > 0) or \
-            (env.report_category('extra') and len(env.extra_files) > 0):
+    report_stats(env, dict(ctx.obj, command='check',
+                           stats=ctx.obj.get('stats') and ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'text'))
+
+    if has_failures(env):
         sys.exit(1)
 
 def check_catalog(**kwargs):
+    import cataloger.processor as processor
     try:
         env = processor.Cataloger(action='check', **kwargs)
+    except processor.ResumeError as e:
+        sys.stderr.write("Invalid --resume token : {}\n".format(e))
+        sys.exit(1)
     except processor.CatalogError as e:
         sys.stderr.write("Unable to read catalog file '{}' : {}\n".format(
                 kwargs.get('catalog',defaults.DEFAULT_CATALOG_FILE), e))
         sys.exit(1)
 
-    for directory, files in env.walk():
+    # Consume the results - they are recorded on the Cataloger instance
+    for _ in env.iter_check(retain=kwargs.get('retain_results', True)):
+        pass
 
-        for file in files:
+    return env
 
-            # If there is no signature for this file in the catalog, then mark this as record_extra file
-            if not env.is_file_in_catalog(file_path=
-                                          os.path.join(directory,file)):
-                env.record_extra(rel_path=os.path.join(directory, file))
-                continue
+# The outcome of checking a single root - see check_many_catalogs
+#   root, catalog : The root and catalog as given
+#   cataloger : The Cataloger after the check - None if the root couldn't be checked
+#   error : The CatalogError or ConfigError raised - None if the check ran
+RootCheck = collections.namedtuple('RootCheck', ['root', 'catalog', 'cataloger', 'error'])
 
-            catalog_signature = env.get_signature(rel_path=os.path.join(directory, file), from_catalog=True)
-            file_signature =  env.get_signature(rel_path=os.path.join(directory, file), from_catalog=False)
+def read_manifest(manifest):
+    """Read the (root, catalog) pairs from a check-many manifest
 
-            # If the signatures don't match - mark this as a mismatch
-            if catalog_signature != file_signature:
-                env.record_mismatch(rel_path=os.path.join(directory, file))
-                continue
+       Each line is a root directory, optionally followed by a tab and the
+       catalog file; blank lines and lines starting with # are ignored. If
+       no catalog is given, it is defaults.DEFAULT_CATALOG_FILE in the root.
+    """
+    pairs = []
+    for line in manifest:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        root, _, catalog = line.partition('\t')
+        root = root.strip()
+        pairs.append((root, catalog.strip() or os.path.join(root, defaults.DEFAULT_CATALOG_FILE)))
+    return pairs
 
-            env.record_ok(rel_path=os.path.join(directory, file))
+@click.command('check-many', help='Check several roots against their catalogs in one process')
+@click.option('-p', '--pair', 'pairs', type=(str, str), multiple=True, metavar='ROOT CATALOG',
+              help='A root directory and the catalog to check it against - can be repeated')
+@click.option('--manifest', type=click.File('r'), default=None,
+              help='A file listing the roots to check - one per line, each optionally followed by a tab and the catalog')
+@report_options
+@click.pass_context
+def check_many(ctx, pairs, manifest, **kwargs):
+    import cataloger.reports as reports
+    ctx.obj.update(kwargs)
+    options = _run_options(ctx.obj)
+    for single in ('root', 'catalog'):
+        options.pop(single, None)
 
-        # Have processed all the files in the directory
-        # so all non-processed files in this directory must be missing locally
-        if env.is_directory_in_catalog(directory=directory):
-            for file in env.get_non_processed(directory):
-                env.record_missing(os.path.join(directory, file))
+    pairs = list(pairs) + (read_manifest(manifest) if manifest is not None else [])
+    if not pairs:
+        raise click.UsageError('Give at least one root to check with --pair or --manifest')
+    if options.pop('resume', None):
+        raise click.UsageError('A resume token is for a single catalog - use it with check')
+    if options.pop('deadline', None):
+        raise click.UsageError('A deadline is for a single catalog - use it with check')
 
-    return env
+    output = kwargs.get('output', sys.stdout)
+    if ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'ndjson':
+        writer = reports.NDJSONWriter(output)
+        checks = check_many_catalogs(pairs, on_result=writer.write_result, retain_results=False, **options)
+        for check in checks:
+            if check.cataloger is not None:
+                writer.write_summary(check.cataloger, root=check.root)
+            else:
+                writer.write_error(check.root, check.catalog, check.error)
+        writer.write_batch_summary(checks)
+        writer.close()
+    else:
+        checks = check_many_catalogs(pairs, **options)
+        roots = [dict(summary, row=row, catalog=check.catalog, error=check.error,
+                      mismatched=check.cataloger.mismatched_files if check.cataloger else [],
+                      missing=check.cataloger.missing_files if check.cataloger else [],
+                      extra=check.cataloger.extra_files if check.cataloger else [],
+                      timed_out=check.cataloger.timed_out_files if check.cataloger else [])
+                 for check, (summary, row) in zip(checks, reports.root_rows(checks, reports.CHECK_COLUMNS))]
+        report = get_renderer('final_check_many.tmpl').from_context(
+                           {'roots': roots},
+                           {'errors': [root for root in roots if root['error'] is not None]},
+                           {'failed_count': sum(1 for check in checks
+                                                if check.cataloger is None or has_failures(check.cataloger))},
+                           {'report_mismatch': kwargs.get('report_mismatch'),
+                            'report_missing': kwargs.get('report_missing'),
+                            'report_extra': kwargs.get('report_extra')},
+                           {'verbose': int(ctx.obj.get('verbose', defaults.DEFAULT_VERBOSE))},
+                        )
+        output.write(report)
+
+    checked = [check.cataloger for check in checks if check.cataloger is not None]
+    if ctx.obj.get('stats') and ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'text':
+        for env in checked:
+            sys.stderr.write('{}\n'.format(env.root))
+            report_stats(env, dict(ctx.obj, stats=True, metrics_file=None, output_format=None))
+        timed = [env.stats for env in checked if env.stats is not None]
+        if len(timed) > 1:
+            import cataloger.stats as stats
+            sys.stderr.write('All roots\n')
+            sys.stderr.write(stats.RunStats.merge(timed).summary_table())
+    if ctx.obj.get('metrics_file') and checked:
+        write_metrics_file(checked, 'check-many', ctx.obj['metrics_file'])
+    if checked and checked[0].read_limiter is not None and \
+            ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'text':
+        sys.stderr.write(checked[0].read_limiter.summary_line())
 
-@registerModifier('format')
+    if any(check.cataloger is None or has_failures(check.cataloger) for check in checks):
+        sys.exit(1)
+
+def check_many_catalogs(pairs, **kwargs):
+    """Check several roots, each against its own catalog, in this process
+
+       :param pairs: An iterable of (root, catalog) pairs
+       :param kwargs: The arguments for each Cataloger (apart from root and
+                catalog). If on_result is given it is called with the result
+                dictionary and the root (as root=).
+
+       All of the roots share one WorkerPool (of ``jobs`` threads with the
+       given ``schedule``, unless a ``pool`` is given) and one SignatureCache,
+       so a file reached from more than one root is only hashed once. The
+       read limits and the limit on bytes in flight are shared by all of the
+       roots too. The roots are checked in order and a root which can't be
+       checked (one which isn't a directory, or whose catalog can't be read)
+       doesn't stop the others - but with ``fail_fast`` the first
+       root with a failure stops the check, and the rest aren't checked.
+
+       Returns a list of RootCheck - one for each pair.
+    """
+    import cataloger.processor as processor
+    import cataloger.pipeline as pipeline
+
+    pool = kwargs.pop('pool', None)
+    own_pool = pool is None
+    if own_pool:
+        jobs = kwargs.pop('jobs', None) or defaults.DEFAULT_JOBS
+        pool = pipeline.WorkerPool(jobs=jobs if jobs == 'auto' else int(jobs),
+                                   schedule=kwargs.pop('schedule', None) or defaults.DEFAULT_SCHEDULE,
+                                   lookahead=kwargs.pop('lookahead', None))
+    for option in ('jobs', 'schedule', 'lookahead'):
+        kwargs.pop(option, None)
+    signature_cache = kwargs.pop('signature_cache', None)
+    if signature_cache is None:
+        signature_cache = pipeline.SignatureCache()
+    if kwargs.get('read_limiter') is None and (kwargs.get('max_read_rate') or kwargs.get('max_file_rate')):
+        import cataloger.throttle as throttle
+        kwargs['read_limiter'] = throttle.ReadLimiter(bytes_per_second=kwargs.get('max_read_rate'),
+                                                      files_per_second=kwargs.get('max_file_rate'),
+                                                      burst=kwargs.get('read_burst'))
+    on_result = kwargs.pop('on_result', None)
+
+    checks = []
+    try:
+        for root, catalog in pairs:
+            options = dict(kwargs, root=root, catalog=catalog, pool=pool,
+                           signature_cache=signature_cache)
+            if on_result is not None:
+                options['on_result'] = functools.partial(on_result, root=root)
+            try:
+                # The Cataloger can't tell an empty root from one which doesn't exist
+                if not os.path.isdir(root):
+                    raise processor.CatalogError('The root is not an existing directory')
+                env = processor.Cataloger(action='check', **options)
+                if kwargs.get('buffer_pool') is None and env.buffer_pool is not None:
+                    # The first root's BufferPool - sized for the chunk_size of its config - is shared
+                    kwargs['buffer_pool'] = env.buffer_pool
+                for _ in env.iter_check(retain=kwargs.get('retain_results', True)):
+                    pass
+            except (processor.CatalogError, processor.ConfigError) as e:
+                checks.append(RootCheck(root, catalog, None, e))
+                continue
+            checks.append(RootCheck(root, catalog, env, None))
+            if env.first_failure is not None:
+                break
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    return checks
+
+# Registered as the templatelite 'format' modifier by get_renderer
 def format(var, *args, **kwargs):
     if len(args) > 1 or len(kwargs) >0:
+        from templatelite import UnexpectedFilterArguments
         raise UnexpectedFilterArguments
     if var:
         return '{value:{format}}'.format(value=var, format=args[0])
     else:
         return '{value:{format}}'.format(value=' ', format=args[0] if args[0][-1] == 's' else (args[0][:-1]+'s' if args[0][-1]=='d' else args[0]))
 
+def _validate_each(validate):
+    """A click callback which applies validate to each value of a multiple option"""
+    def callback(ctx, param, values):
+        return tuple(validate(ctx, param, value) for value in values)
+    return callback
+
+def _validate_hashes(ctx, param, values):
+    from cataloger.main import validate_hash
+    return tuple(name for value in _validate_each(validate_hash)(ctx, param, values) for name in value.split(','))
+
+def _validate_sizes(ctx, param, values):
+    from cataloger.main import validate_size
+    return _validate_each(validate_size)(ctx, param, values)
+
+@click.command('bench-hash', help='Measure the throughput of the hash algorithms on this host')
+@click.option('-a', '--algorithm', 'algorithms', multiple=True, metavar='HASH_FUNCTION', callback=_validate_hashes,
+              help='An algorithm to measure - can be repeated. Default is every algorithm available')
+@click.option('--file-size', 'file_sizes', multiple=True, metavar='BYTES', callback=_validate_sizes,
+              help='A file size to measure - can be repeated. Default 4K, 256K and 16M')
+@click.option('--chunk-size', 'chunk_sizes', multiple=True, metavar='BYTES', callback=_validate_sizes,
+              help='A read chunk size to measure - can be repeated. Default 64K, 1M and 4M')
+@click.option('--threads', 'threads', type=click.IntRange(min=1), default=None, metavar='N',
+              help='The number of threads for the multi-threaded measurements - default the number of CPUs '
+                   'available. 1 only measures a single thread')
+@click.option('--duration', 'duration', type=click.FloatRange(min=0, min_open=True),
+              default=defaults.DEFAULT_BENCH_DURATION, metavar='SECONDS',
+              help='The time spent on each measurement - default {}'.format(defaults.DEFAULT_BENCH_DURATION))
+@click.option('--directory', 'directory', default=None, metavar='DIRECTORY',
+              help='Where to create the files - default is a tmpfs mount (/dev/shm) if there is one')
+@click.option('--allow-weak', 'allow_weak', is_flag=True, default=False,
+              help='Allow md5 and sha1 to be recommended')
+@click.option('--write-config', 'write_config', is_flag=True, default=False,
+              help='Write the recommended hash and chunk size into the [catalog] section of the config file')
+@click.pass_context
+def bench_hash(ctx, algorithms, file_sizes, chunk_sizes, threads, duration, directory, allow_weak, write_config):
+    import cataloger.hashbench as hashbench
+    file_sizes = list(file_sizes) or defaults.DEFAULT_BENCH_FILE_SIZES
+    chunk_sizes = list(chunk_sizes) or defaults.DEFAULT_BENCH_CHUNK_SIZES
+    if threads is None:
+        import cataloger.tuning as tuning
+        threads = tuning.available_cpus()
+
+    def progress(measurement):
+        if ctx.obj.get('progress'):
+            sys.stderr.write('{0.algorithm} {0.file_size} bytes, {0.chunk_size} byte chunks, {0.threads} '
+                             'threads : {1:.1f} MB/s\n'.format(measurement, measurement.bytes_per_second / 1e6))
+
+    measurements = hashbench.run_benchmark(algorithms=algorithms or None, file_sizes=file_sizes,
+                                           chunk_sizes=chunk_sizes, threads=sorted({1, threads}),
+                                           duration=duration, directory=directory, on_measurement=progress)
+    rankings = hashbench.rank(measurements)
+    recommended = hashbench.recommend(rankings, allow_weak=allow_weak)
+    output = sys.stdout
+    output.write(hashbench.format_table(rankings, recommended))
+
+    if write_config and recommended is not None:
+        config_file = ctx.obj.get('config') or defaults.DEFAULT_CONFIG_FILE
+        try:
+            hashbench.write_recommendation(config_file, recommended.algorithm, recommended.chunk_size)
+        except (IOError, OSError) as e:
+            sys.stderr.write("Unable to write config file '{}' : {}\n".format(config_file, e))
+            sys.exit(1)
+        output.write("Recommendation written to '{}'\n".format(config_file))
+
 @click.command('create', help='Create a new catalog')
 @click.pass_context
 def create(ctx, **kwargs):
+    import cataloger.reports as reports
     ctx.obj.update(kwargs)
-    env = create_catalog(**ctx.obj)
+    options = _run_options(ctx.obj)
+
+    if ctx.obj.get('output_format', defaults.DEFAULT_FORMAT) == 'ndjson':
+        writer = reports.NDJSONWriter(kwargs.get('output', sys.stdout))
+        env = create_catalog(on_result=writer.write_result, retain_results=False, **options)
+        writer.write_summary(env)
+        writer.close()
+        report_stats(env, dict(ctx.obj, command='create', stats=False))
+        if env.status_count('timeout') > 0:
+            sys.exit(1)
+        return
+
+    env = create_catalog(**options)
 
-    report = Renderer( template_file=find_template_path('final_create.tmpl'),
-                       remove_indentation=False).from_context(
+    with _phase(env, 'render'):
+        report = get_renderer('final_create.tmpl').from_context(
                            {'processed_count': env.processed_count},
                            {'report_excluded': env.report_category('excluded'),
                             'excluded_files':env.excluded_files},
                            {'report_extension': env.report_category('extension'),
                             'extensions':[ (e,c) for e,c in env.extension_counts.items()] },
+                           {'timed_out': env.timed_out_files},
                            {'verbose': env.verbose},
-                            {'by_directory': env.catalog_summary_by_directory},
+                            {'by_directory': reports.directory_rows(env, reports.CREATE_COLUMNS)},
                         )
 
     kwargs.get('output', sys.stdout).write(report)
+    report_stats(env, dict(ctx.obj, command='create'))
+
+    # The files which timed out aren't in the catalog - it is incomplete
+    if env.status_count('timeout') > 0:
+        sys.exit(1)
 
 
 def create_catalog(**kwargs):
+    import cataloger.processor as processor
 
     env = processor.Cataloger(action='create', **kwargs)
 
-    for directory, files in env.walk():
-        for file in files:
-            signature = env.get_signature( rel_path=os.path.join(directory, file) )
-            if signature:
-                env.add_to_catalog(rel_path=os.path.join(directory, file), signature=signature)
-
-    env.write_catalog()
+    # Consume the results - the catalog is written once all are recorded
+    for _ in env.iter_create(retain=kwargs.get('retain_results', True)):
+        pass
 
     return env
@@ -17,15 +17,45 @@ __version__ = "0.1"
 __author__ = 'Tony Flury : anthony.flury@btinternet.com'
 __created__ = '22 Mar 2016'
 
-import hashlib
-
 DEFAULT_EXTENSIONS = {u'.py', u'.html', u'.txt', u'.css', u'.svg', u'.js', u'.gif', u'.png', u'.jpg', u'.jpeg'}
 DEFAULT_IGNOREDIRECTORY = {u'static', u'htmlcov', u'media',u'build', u'dist', u'docs'}
 DEFAULT_CATALOG_FILE = 'catalog.cat'
 DEFAULT_CONFIG_FILE = 'catalog.cfg'
-DEFAULT_HASH = 'sha224' if 'sha224' in hashlib.algorithms_available else list(hashlib.algorithms_available)[0]
+# sha224 is in hashlib.algorithms_guaranteed - so hashlib isn't imported here
+DEFAULT_HASH = 'sha224'
 DEFAULT_REPORTON = ['report_missing','report_extra','report_mismatch','report_excluded']
 DEFAULT_VERBOSE = '1'
 DEFAULT_REPORT_EXTENSIONS = True
 DEFAULT_REPORT_GROUP = True
 ALL_REPORTON_OPTIONS = ['report_missing','report_extra','report_mismatch', 'report_excluded']
+DEFAULT_FORMAT = 'text'
+ALL_FORMATS = ['text', 'ndjson']
+ALL_STATUSES = ['added', 'processed', 'excluded', 'missing', 'mismatch', 'extra', 'timeout', 'unverified']
+DEFAULT_NDJSON_CHUNK_SIZE = 64 * 1024
+DEFAULT_PROGRESS_INTERVAL = 0.5
+DEFAULT_ASYNC_WORKERS = 4
+DEFAULT_ASYNC_IN_FLIGHT = 16
+DEFAULT_JOBS = 1
+DEFAULT_WINDOW_PER_JOB = 8
+DEFAULT_IO_POLICY = 'normal'
+ALL_IO_POLICIES = ['normal', 'nocache']
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_PREFETCH_FILES = 4
+DEFAULT_AUTO_MAX_JOBS = 32
+DEFAULT_AUTO_INTERVAL = 0.5
+DEFAULT_AUTO_TOLERANCE = 0.05
+DEFAULT_AUTO_LATENCY_FACTOR = 4.0
+DEFAULT_SCHEDULE = 'walk'
+ALL_SCHEDULES = ['walk', 'largest', 'inode', 'physical']
+DEFAULT_LOOKAHEAD_PER_JOB = 32
+DEFAULT_BATCH_THRESHOLD = 64 * 1024
+DEFAULT_BATCH_BYTES = 1024 * 1024
+DEFAULT_BATCH_FILES = 256
+DEFAULT_BENCH_FILE_SIZES = [4 * 1024, 256 * 1024, 16 * 1024 * 1024]
+DEFAULT_BENCH_CHUNK_SIZES = [64 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+DEFAULT_BENCH_DURATION = 0.05
+DEFAULT_FINGERPRINT_POLICY = 'full'
+ALL_FINGERPRINT_POLICIES = ['full', 'partial', 'stat']
+DEFAULT_PARTIAL_SAMPLES = 8
+DEFAULT_PARTIAL_BLOCK_SIZE = 64 * 1024
+DEFAULT_PRIORITY_EXTENSIONS = {u'.py', u'.js', u'.html', u'.css'}
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of hashbench.py
+
+Summary :
+    Measuring the throughput of the hash algorithms on this host
+Use Case :
+    As an operator I want to know which hash algorithm and chunk size are
+    fastest on my hosts So that catalogs are created and checked as quickly
+    as the hardware allows
+
+Testable Statements :
+    Can I list the hash algorithms which can be benchmarked
+    Can I measure the throughput of an algorithm for a file size, chunk size and number of threads
+    Are the files hashed from tmpfs where it is available - so the disks don't skew the results
+    Can I rank the algorithms, and recommend an algorithm and a chunk size
+    Can I write the recommendation into the config file
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from cataloger import defaults
+from cataloger import readers
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+# A single measurement - see measure
+#   algorithm, file_size, chunk_size, threads : What was measured
+#   bytes_per_second : The throughput across all of the threads
+Measurement = namedtuple('Measurement', ['algorithm', 'file_size', 'chunk_size', 'threads', 'bytes_per_second'])
+
+# The ranking of one algorithm - see rank
+#   single : The best throughput with one thread
+#   multi : The best throughput with several threads (the same as single if only one thread was measured)
+#   chunk_size : The chunk size which gave the best throughput
+Ranking = namedtuple('Ranking', ['algorithm', 'single', 'multi', 'chunk_size'])
+
+# Algorithms which are fast but no longer collision resistant - they are
+# ranked, but only recommended if they are explicitly allowed
+WEAK_HASHES = {'md4', 'md5', 'md5-sha1', 'mdc2', 'sha1'}
+
+# The tmpfs mounts which are tried (in order) for the benchmark files
+TMPFS_DIRECTORIES = ['/dev/shm', '/run/shm']
+
+
+def candidate_algorithms():
+    """The algorithms which can be benchmarked - sorted by name
+
+       Algorithms with a variable length digest (the shake algorithms) can't
+       be used for a catalog, and names which hashlib lists but can't create
+       are skipped.
+    """
+    names = []
+    for name in sorted(hashlib.algorithms_available):
+        try:
+            hashlib.new(name).hexdigest()
+        except (TypeError, ValueError):
+            continue
+        names.append(name)
+    return names
+
+
+def scratch_directory(directory=None):
+    """A new temporary directory for the benchmark files - on tmpfs if possible
+
+       :param directory: Where to create the directory - by default the
+                first writable tmpfs mount, or the system temporary directory
+    """
+    if directory is None:
+        directory = next((path for path in TMPFS_DIRECTORIES
+                          if os.path.isdir(path) and os.access(path, os.W_OK)), None)
+    return tempfile.mkdtemp(prefix='catalog-bench-', dir=directory)
+
+
+def measure(algorithm, path, chunk_size, threads=1, duration=defaults.DEFAULT_BENCH_DURATION):
+    """The throughput of hashing the file with the algorithm - a Measurement
+
+       Each thread hashes the file repeatedly, reading it in chunks, until
+       duration seconds have passed (each thread hashes it at least once).
+    """
+    totals = [0] * threads
+
+    def worker(index):
+        end = time.perf_counter() + duration
+        while True:
+            totals[index] += readers.hash_file(path, hashlib.new(algorithm).update, chunk_size=chunk_size)
+            if time.perf_counter() >= end:
+                return
+
+    started = time.perf_counter()
+    if threads == 1:
+        worker(0)
+    else:
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    return Measurement(algorithm, os.path.getsize(path), chunk_size, threads, sum(totals) / elapsed)
+
+
+def run_benchmark(algorithms=None, file_sizes=defaults.DEFAULT_BENCH_FILE_SIZES,
+                  chunk_sizes=defaults.DEFAULT_BENCH_CHUNK_SIZES, threads=(1,),
+                  duration=defaults.DEFAULT_BENCH_DURATION, directory=None, on_measurement=None):
+    """Measure every combination of algorithm, file size, chunk size and threads
+
+       :param algorithms: The algorithms to measure - default candidate_algorithms()
+       :param directory: Where the files are created - see scratch_directory
+       :param on_measurement: Called with each Measurement as it is made
+
+       A chunk size larger than a file is only measured if it is the
+       smallest chunk size - it would read the file in one go, the same as
+       the smallest chunk which is larger than the file. Returns a list of
+       Measurement.
+    """
+    algorithms = candidate_algorithms() if algorithms is None else list(algorithms)
+    scratch = scratch_directory(directory)
+    results = []
+    try:
+        for file_size in file_sizes:
+            path = os.path.join(scratch, 'bench{}.dat'.format(file_size))
+            with open(path, 'wb') as fp:
+                fp.write(os.urandom(file_size))
+            sizes = sorted(chunk_sizes)
+            sizes = [size for index, size in enumerate(sizes)
+                     if index == 0 or sizes[index - 1] < file_size]
+            for algorithm in algorithms:
+                for chunk_size in sizes:
+                    for count in threads:
+                        measurement = measure(algorithm, path, chunk_size, count, duration)
+                        results.append(measurement)
+                        if on_measurement is not None:
+                            on_measurement(measurement)
+            os.remove(path)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def rank(measurements):
+    """Rank the algorithms by their best throughput - fastest first
+
+       Each algorithm is judged on its mean throughput over the file sizes,
+       for its best chunk size and number of threads. Returns a list of
+       Ranking.
+    """
+    # (algorithm, chunk_size, threads) -> [bytes per second for each file size]
+    grouped = {}
+    for m in measurements:
+        grouped.setdefault((m.algorithm, m.chunk_size, m.threads), []).append(m.bytes_per_second)
+
+    best = {}
+    for (algorithm, chunk_size, threads), rates in grouped.items():
+        rate = sum(rates) / len(rates)
+        single, multi, best_chunk, best_rate = best.get(algorithm, (0.0, 0.0, None, 0.0))
+        if threads == 1:
+            single = max(single, rate)
+        else:
+            multi = max(multi, rate)
+        if rate > best_rate:
+            best_chunk, best_rate = chunk_size, rate
+        best[algorithm] = (single, multi, best_chunk, best_rate)
+
+    rankings = [Ranking(algorithm, single, multi or single, chunk_size)
+                for algorithm, (single, multi, chunk_size, _) in best.items()]
+    return sorted(rankings, key=lambda r: (-max(r.single, r.multi), r.algorithm))
+
+
+def recommend(rankings, allow_weak=False):
+    """The Ranking to recommend - the fastest which isn't weak, unless weak is allowed
+
+       None if there is nothing to recommend.
+    """
+    return next((r for r in rankings if allow_weak or r.algorithm not in WEAK_HASHES), None)
+
+
+def format_table(rankings, recommended=None):
+    """The rankings as a printable table"""
+    lines = ['{:<4} {:<16} {:>16} {:>16} {:>10}'.format('Rank', 'Algorithm', '1 thread MB/s',
+                                                         'threads MB/s', 'Chunk'),
+             '-' * 66]
+    for index, r in enumerate(rankings, 1):
+        lines.append('{:<4} {:<16} {:>16.1f} {:>16.1f} {:>10}{}'.format(
+            index, r.algorithm, r.single / 1e6, r.multi / 1e6, format_size(r.chunk_size),
+            '  *' if recommended is not None and r.algorithm == recommended.algorithm else ''))
+    if recommended is not None:
+        lines.append('')
+        lines.append('Recommended : hash = {}, chunk_size = {}'.format(recommended.algorithm,
+                                                                     format_size(recommended.chunk_size)))
+    return '\n'.join(lines) + '\n'
+
+
+def format_size(size):
+    """The size in bytes with a K or M suffix where it is exact"""
+    for suffix, scale in (('M', 1024 ** 2), ('K', 1024)):
+        if size % scale == 0:
+            return '{}{}'.format(size // scale, suffix)
+    return str(size)
+
+
+_section_re = re.compile(r'^\s*\[(.*?)\]\s*$')
+
+
+def write_recommendation(config_file, algorithm, chunk_size):
+    """Set the hash and chunk_size options in the [catalog] section of the config file
+
+       The rest of the file is kept as it is - the section is added if the
+       file (or the section) doesn't exist yet.
+    """
+    try:
+        with open(config_file, 'r') as fp:
+            lines = fp.read().splitlines()
+    except IOError:
+        lines = []
+
+    values = {'hash': algorithm, 'chunk_size': str(chunk_size)}
+    section, start, end = None, None, len(lines)
+    for index, line in enumerate(lines):
+        title = _section_re.match(line)
+        if title:
+            if section == 'catalog':
+                end = index
+                break
+            section = title.group(1)
+            if section == 'catalog':
+                start = index
+            continue
+        if section == 'catalog' and not line.strip().startswith('#'):
+            option = line.partition('=')[0].strip()
+            if option in values:
+                lines[index] = '{} = {}'.format(option, values.pop(option))
+
+    new_lines = ['{} = {}'.format(option, value) for option, value in sorted(values.items())]
+    if start is None:
+        if lines and lines[-1].strip():
+            lines.append('')
+        lines.extend(['[catalog]'] + new_lines)
+    else:
+        while end > start + 1 and not lines[end - 1].strip():
+            end -= 1
+        lines[end:end] = new_lines
+
+    with open(config_file, 'w') as fp:
+        fp.write('\n'.join(lines) + '\n')
@@ -9,14 +9,34 @@ The main CLI interface - implemented using the click framework.
 """
 import sys
 import os
+import importlib
 import click
-import hashlib
 from . import defaults
-from importlib.metadata import version
-from importlib.resources import files
 
 from cataloger import version as version_data
-from . import commands
+
+# Heavy modules (hashlib, templatelite, the processor etc) are only imported
+# when a subcommand needs them - see LazyGroup and cataloger.commands
+
+
+class LazyGroup(click.Group):
+    """A click Group whose subcommands are imported only when they are invoked
+
+        :param lazy_commands: A dictionary of command name to
+                    'module:attribute' of the click command.
+    """
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self._lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super(LazyGroup, self).list_commands(ctx)) | set(self._lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self._lazy_commands:
+            module_name, _, attr = self._lazy_commands[cmd_name].partition(':')
+            return getattr(importlib.import_module(module_name), attr)
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
 
 
 def validate_report_out(ctx, param, value):
@@ -37,7 +57,7 @@ def validate_root(ctx, param, value):
 def get_version(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
-    click.echo('catalog : version {}'.format(version('cataloger')))
+    click.echo('catalog : version {}'.format(version_data.__version__))
     ctx.exit()
 
 
@@ -47,22 +67,64 @@ def validate_extension(ctx, param, value):
 
     return value
 
+_size_suffixes = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def validate_size(ctx, param, value):
+    """A number of bytes - with an optional K, M, G or T suffix (powers of 1024)"""
+    if value is None:
+        return None
+    text = value.strip().upper()
+    if text.endswith('B'):
+        text = text[:-1]
+    number, suffix = (text[:-1], text[-1]) if text and text[-1] in _size_suffixes else (text, '')
+    try:
+        size = float(number) * _size_suffixes[suffix]
+    except ValueError:
+        raise click.BadParameter('must be a number of bytes, optionally followed by K, M, G or T')
+    if size <= 0:
+        raise click.BadParameter('must be greater than 0')
+    return int(size)
+
+def validate_jobs(ctx, param, value):
+    """A number of jobs (at least 1) or auto"""
+    if value == 'auto':
+        return value
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise click.BadParameter('must be a number or auto')
+    if jobs < 1:
+        raise click.BadParameter('must be at least 1')
+    return jobs
+
 def validate_hash(ctx,param,value):
-    if value not in hashlib.algorithms_available:
-        raise click.BadParameter('{} must be one of {}'.format(param.metavar,
-                                                 ' | '.join(hashlib.algorithms_available)))
-    else:
+    # The default is always available - so avoid importing hashlib for it
+    if value is None or value == defaults.DEFAULT_HASH:
         return value
 
-@click.group(name=sys.argv[0])
+    import hashlib
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    if not names or any(name not in hashlib.algorithms_available for name in names):
+        raise click.BadParameter('{} must be one or more (separated by commas) of {}'.format(
+            param.metavar, ' | '.join(hashlib.algorithms_available)))
+    else:
+        return ','.join(names)
+
+@click.group(name=sys.argv[0], cls=LazyGroup,
+             lazy_commands={'bench-hash': 'cataloger.commands:bench_hash',
+                            'check': 'cataloger.commands:check',
+                            'check-many': 'cataloger.commands:check_many',
+                            'create': 'cataloger.commands:create'})
 @click.pass_context
 @click.option('--version', is_flag=True, callback=get_version, expose_value=False, is_eager=True)
 @click.option('-v', '--verbose', type=click.Choice(['0', '1', '2','3']), default=defaults.DEFAULT_VERBOSE)
 
 @click.option('-h', '--hash',
               type=str,
-              default=defaults.DEFAULT_HASH, metavar = 'HASH_FUNCTION',
-              help='The hash algorithm to use in order to compare file contents.',
+              default=None, metavar = 'HASH_FUNCTION',
+              help='The hash algorithm to use in order to compare file contents - or several separated by '
+                   'commas (e.g. sha224,blake2b), which are all computed from one read of each file. '
+                   'Default {}, or the hash in the config file.'.format(defaults.DEFAULT_HASH),
               callback = validate_hash)
 
 @click.option('-m', '--catalog', metavar='CATALOG',
@@ -97,6 +159,92 @@ def validate_hash(ctx,param,value):
 @click.option('-t/-T', 'report_extensions', is_flag=True, default=defaults.DEFAULT_REPORT_EXTENSIONS,
               help='Whether or not to report (in summary) on checked file extensions')
 
+@click.option('--format', 'output_format', type=click.Choice(defaults.ALL_FORMATS), default=defaults.DEFAULT_FORMAT,
+              help='The format of the results - text (the default) or ndjson : one JSON object per file result followed by a summary object')
+
+@click.option('--stats', 'stats', is_flag=True, default=False,
+              help='Record per phase timings and throughput - reported to stderr, or in the ndjson summary')
+
+@click.option('--metrics-file', 'metrics_file', metavar='PATH', default=None,
+              help='Atomically write the results and timings of the run to PATH in the Prometheus textfile format')
+
+@click.option('--progress', 'progress', is_flag=True, default=False,
+              help='Show the files and bytes done, the current MB/s and the ETA on stderr. '
+                   'The same statistics are written to stderr on SIGUSR1.')
+
+@click.option('-j', '--jobs', 'jobs', default=str(defaults.DEFAULT_JOBS), metavar='N|auto', callback=validate_jobs,
+              help='The number of threads used to hash files, or auto to tune the number of threads to the host '
+                   '- default {}'.format(defaults.DEFAULT_JOBS))
+
+@click.option('--schedule', 'schedule', type=click.Choice(defaults.ALL_SCHEDULES), default=defaults.DEFAULT_SCHEDULE,
+              help='The order in which files are hashed - walk (as they are found), largest (the largest first, from '
+                   'the files in the lookahead), inode or physical (the files in the lookahead in inode order, or in '
+                   'the order of their data on disk - for spinning disks). The output is the same whatever the order.')
+
+@click.option('--lookahead', 'lookahead', type=click.IntRange(min=1), default=None, metavar='N',
+              help='The number of files to choose from with --schedule largest, inode or physical '
+                   '- default {} per job'.format(defaults.DEFAULT_LOOKAHEAD_PER_JOB))
+
+@click.option('--batch-threshold', 'batch_threshold', default=None, metavar='BYTES', callback=validate_size,
+              help='With more than one job, files smaller than this are hashed in batches by a single thread '
+                   '- default 64K')
+
+@click.option('--batch-bytes', 'batch_bytes', default=None, metavar='BYTES', callback=validate_size,
+              help='The total size of the files in a batch - default 1M')
+
+@click.option('--batch-files', 'batch_files', type=click.IntRange(min=1), default=None, metavar='N',
+              help='The most files in a batch - default {}; 1 turns batching off'.format(defaults.DEFAULT_BATCH_FILES))
+
+@click.option('--file-timeout', 'file_timeout', type=click.FloatRange(min=0, min_open=True), default=None,
+              metavar='SECONDS',
+              help='The time a file may take to be hashed - a file which takes longer is abandoned and reported as '
+                   'timed out, and the rest of the tree is processed')
+
+@click.option('--run-timeout', 'run_timeout', type=click.FloatRange(min=0, min_open=True), default=None,
+              metavar='SECONDS',
+              help='The time the whole run may take - once it has passed the files not yet hashed are reported '
+                   'as timed out')
+
+@click.option('--deadline', 'deadline', type=click.FloatRange(min=0, min_open=True), default=None,
+              metavar='SECONDS',
+              help='The time a check may take - the files are checked code first, then the most recently modified. '
+                   'At the deadline the check stops, and reports the fraction of the catalog verified and a token '
+                   'to resume from')
+
+@click.option('--resume', 'resume', default=None, metavar='TOKEN',
+              help='Resume a check with a --deadline - skipping the files verified by the check which gave the token')
+
+@click.option('--min-coverage', 'min_coverage', type=click.FloatRange(min=0, max=100), default=None,
+              metavar='PERCENT', callback=lambda ctx, param, value: None if value is None else value / 100.0,
+              help='The percentage of the catalog a check with a --deadline must verify - by default a check '
+                   'fails only if it verified none of the catalog')
+
+@click.option('--fail-fast', 'fail_fast', is_flag=True, default=False,
+              help='Stop a check at the first mismatched, missing or extra file - the hashing still pending is '
+                   'cancelled, and only that file is reported')
+
+@click.option('--max-inflight-bytes', 'max_inflight_bytes', default=None, metavar='BYTES', callback=validate_size,
+              help='The most memory used for reading files, across all jobs - e.g. 64M. Files are read in chunks '
+                   'into a shared pool of buffers')
+
+@click.option('--dedup-links/--no-dedup-links', 'dedup_links', default=True,
+              help='Whether a file with several hard links is only hashed once per run - default enabled')
+
+@click.option('--sparse', 'sparse', is_flag=True, default=False,
+              help='Skip the holes in sparse files - only their data is read from the disk, and the holes are '
+                   'hashed as zeros, so the signatures are unchanged')
+
+@click.option('--io-policy', 'io_policy', type=click.Choice(defaults.ALL_IO_POLICIES), default=None,
+              help='How files are read for hashing - normal (the default), or nocache : files are read without '
+                   'updating their access time and are dropped from the page cache once hashed')
+
+@click.option('--max-read-rate', 'max_read_rate', metavar='BYTES', default=None, callback=validate_size,
+              help='The maximum rate (per second) at which files are read for hashing, across all jobs - e.g. 50M')
+@click.option('--max-file-rate', 'max_file_rate', metavar='FILES', type=click.FloatRange(min=0, min_open=True),
+              default=None, help='The maximum number of files opened for hashing per second')
+@click.option('--read-burst', 'read_burst', metavar='BYTES', default=None, callback=validate_size,
+              help='The largest burst allowed above --max-read-rate - default is one second\'s worth')
+
 @click.option('-c', 'config', is_flag=False, default='',
               help='The file name of the config file')
 @click.option('-N' 'no_config', is_flag=True, default = False,
@@ -149,13 +297,12 @@ def main(ctx, **kwargs):
 @click.command('test')
 @click.pass_context
 def test(ctx,**kwargs):
+    from importlib.resources import files
     print([i for i in files('cataloger').iterdir()])
     for k, v in ctx.obj.items():
         print(k, v)
 
 main.add_command(test)
-main.add_command(commands.check)
-main.add_command(commands.create)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
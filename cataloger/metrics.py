@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of metrics.py
+
+Summary :
+    Export the results of a create or check as a Prometheus textfile
+Use Case :
+    As an operator I want the results of every check in my metrics system
+    So that I can alert on drift, and on regressions of the check itself
+
+Testable Statements :
+    Can I write counts per status and per extension
+    Can I write the duration, bytes hashed, throughput and load time
+    Is the metrics file replaced atomically
+"""
+import os
+import tempfile
+import time
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+def _escape(value):
+    """Escape a label value as required by the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def format_metrics(env, command):
+    """Return the Prometheus text format metrics for a completed run
+
+       :param env: The Cataloger instance for the run - or a list of them
+                (one per root) for a check-many
+       :param command: The command which was run - create, check or check-many
+    """
+    envs = list(env) if isinstance(env, (list, tuple)) else [env]
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} gauge'.format(name))
+        for env in envs:
+            common = {'command': command, 'root': env.root}
+            for labels, value in samples(env):
+                merged = dict(common, **labels)
+                lines.append('{}{} {}'.format(name, _labels(**merged), value))
+
+    metric('catalog_files', 'Number of files with each status in the last run',
+           lambda env: [({'status': status}, env.status_count(status))
+                        for status in defaults.ALL_STATUSES])
+    metric('catalog_extension_files', 'Number of files with each extension in the last run',
+           lambda env: [({'extension': ext}, count)
+                        for ext, count in sorted(env.extension_counts.items())])
+    finished = '{:.3f}'.format(time.time())
+    metric('catalog_last_run_timestamp_seconds', 'Time the last run finished',
+           lambda env: [({}, finished)])
+
+    timed = [env for env in envs if env.stats is not None]
+    if timed:
+        envs = timed
+        for env in envs:
+            env.stats.stop()
+        metric('catalog_run_duration_seconds', 'Wall time of the last run',
+               lambda env: [({}, '{:.6f}'.format(env.stats.elapsed))])
+        metric('catalog_load_duration_seconds', 'Time taken to load the catalog in the last run',
+               lambda env: [({}, '{:.6f}'.format(env.stats.phase_time('_load_catalog')))])
+        metric('catalog_bytes_hashed', 'Bytes read to create signatures in the last run',
+               lambda env: [({}, env.stats.bytes_read)])
+        metric('catalog_files_hashed', 'Files hashed in the last run',
+               lambda env: [({}, env.stats.files_hashed)])
+        metric('catalog_bytes_deduplicated', 'Bytes not read because the inode was already hashed in the last run',
+               lambda env: [({}, env.stats.bytes_deduplicated)])
+        metric('catalog_hash_throughput_bytes_per_second', 'Hashing throughput of the last run',
+               lambda env: [({}, '{:.1f}'.format(env.stats.hash_rate * 1e6))])
+        metric('catalog_hash_jobs', 'Hashing threads active at the end of the last run',
+               lambda env: [({'mode': 'auto' if env.stats.settings.get('jobs') == 'auto' else 'fixed'},
+                             env.stats.settings.get('final_jobs', env.stats.settings.get('jobs', 1)))])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(env, command, path):
+    """Atomically write the metrics for a completed run to the given path
+
+       :param env: The Cataloger instance - or a list of them, as for format_metrics
+
+       The metrics are written to a temporary file in the same directory, and
+       then renamed over the target, so that a collector never reads a
+       partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-metrics.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(format_metrics(env, command))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
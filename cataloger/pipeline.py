@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of pipeline.py
+
+Summary :
+    The signature pipeline - hashing files in parallel, in a bounded window
+Use Case :
+    As an operator checking large trees I want files hashed in parallel
+    So that a check is limited by the disks rather than by a single thread
+
+Testable Statements :
+    Are the results yielded in the same order as the work was given
+    Is the amount of work ahead of the consumer bounded
+    Can one pool of workers be shared by many runs
+    Is a file which is unchanged hashed only once by runs sharing a cache
+    Can the largest files in the lookahead be hashed first - without
+    changing the order of the results
+    Can the files in the lookahead be read in the order they are on disk
+    Is work which runs past its timeout (or the run's deadline) abandoned -
+    without holding up the rest of the work
+"""
+import functools
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+class _TimedOut(object):
+    def __repr__(self):
+        return 'TIMED_OUT'
+
+# The result of work abandoned by WorkerPool.imap - because it ran past its
+# timeout, or it wasn't done by the deadline for the run
+TIMED_OUT = _TimedOut()
+
+
+class _Executor(object):
+    """A minimal thread pool executor - whose workers can be abandoned
+
+        Unlike concurrent.futures.ThreadPoolExecutor, a worker stuck in a
+        read which never returns (e.g. on a hung network mount) can be
+        abandoned : it is replaced by a new worker, and as a daemon thread it
+        can't stop the process from exiting. Each Future has a ``started``
+        attribute - the time.monotonic() at which its work started.
+    """
+    _names = itertools.count()
+
+    def __init__(self, max_workers, name='cataloger'):
+        self._max_workers = max_workers
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._running = {}      # The thread running each Future
+        self.abandoned = 0
+
+    def submit(self, func):
+        future = Future()
+        self._queue.put((future, func))
+        with self._lock:
+            if len(self._workers) < self._max_workers:
+                self._start_worker()
+        return future
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._work, daemon=True,
+                                  name='{}_{}'.format(self._name, next(self._names)))
+        self._workers.add(thread)
+        thread.start()
+
+    def _work(self):
+        thread = threading.current_thread()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            future, func = job
+            future.started = time.monotonic()
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._running[future] = thread
+            try:
+                result = func()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._lock:
+                del self._running[future]
+                if thread not in self._workers:
+                    return      # Abandoned while it was running
+
+    def abandon(self, future):
+        """Give up on the future - replacing its worker if it has started"""
+        if future.cancel():
+            return
+        with self._lock:
+            thread = self._running.get(future)
+            if thread is None or thread not in self._workers:
+                return
+            self._workers.discard(thread)
+            self.abandoned += 1
+            if not self._queue.empty():
+                self._start_worker()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            workers = list(self._workers)
+        for _ in workers:
+            self._queue.put(None)
+        if wait:
+            for thread in workers:
+                thread.join()
+
+
+class ActiveLimit(object):
+    """A limit on the number of active workers - which can be changed in use"""
+
+    def __init__(self, limit):
+        self._condition = threading.Condition()
+        self._limit = limit
+        self._active = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def set_limit(self, limit):
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    def __enter__(self):
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+
+class WorkerPool(object):
+    """A bounded pool of hashing workers - which can be shared by many runs
+
+        :param jobs: The number of worker threads. With a single job all of
+                the work is done in the consumer's thread. With 'auto' the
+                number of active workers is tuned as the work progresses
+                (see tuning.AutoTuner), up to
+                defaults.DEFAULT_AUTO_MAX_JOBS.
+        :param window: The maximum number of items which can be in progress
+                ahead of the consumer - default is
+                defaults.DEFAULT_WINDOW_PER_JOB per job.
+        :param schedule: The order in which the work is started - one of
+                defaults.ALL_SCHEDULES :
+                walk - in the order it is given
+                largest - the largest first, from the work in the lookahead
+                (longest processing time first), so that a few large files
+                found late don't leave the other workers idle at the end
+                inode, physical - each lookahead of work is started in the
+                order of its position on disk (see imap), so that a
+                spinning disk reads it with few seeks. These apply with a
+                single job too.
+        :param lookahead: The number of items read ahead of the consumer to
+                choose from with the largest, inode and physical schedules -
+                default is defaults.DEFAULT_LOOKAHEAD_PER_JOB per job.
+
+        The threads are only started when there is work for them, and are
+        stopped by shutdown - the pool can be used again afterwards. A thread
+        which is abandoned (see imap) is replaced.
+    """
+
+    def __init__(self, jobs=defaults.DEFAULT_JOBS, window=None,
+                 schedule=defaults.DEFAULT_SCHEDULE, lookahead=None):
+        if schedule not in defaults.ALL_SCHEDULES:
+            raise ValueError('Invalid schedule: {}'.format(schedule))
+        self._tuner = None
+        self._active = None
+        if jobs == 'auto':
+            from cataloger.tuning import AutoTuner, available_cpus
+            cpus = available_cpus()
+            self._tuner = AutoTuner(min(defaults.DEFAULT_AUTO_MAX_JOBS, max(4, cpus * 4)), cpus=cpus)
+            self._active = ActiveLimit(self._tuner.jobs)
+            self._tuner.on_change(self._active.set_limit)
+            jobs = self._tuner.max_jobs
+        if jobs < 1:
+            raise ValueError('jobs must be at least 1')
+        self._jobs = jobs
+        self._window = window if window else jobs * defaults.DEFAULT_WINDOW_PER_JOB
+        self._schedule = schedule
+        self._lookahead = lookahead if lookahead else jobs * defaults.DEFAULT_LOOKAHEAD_PER_JOB
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def jobs(self):
+        """The number of worker threads"""
+        return self._jobs
+
+    @property
+    def window(self):
+        """The maximum number of items in progress ahead of the consumer"""
+        return self._window
+
+    @property
+    def schedule(self):
+        """The order in which the work is started - walk or largest"""
+        return self._schedule
+
+    @property
+    def lookahead(self):
+        """The number of items read ahead to choose from with the largest schedule"""
+        return self._lookahead
+
+    @property
+    def tuner(self):
+        """The AutoTuner - None unless the number of jobs is 'auto'"""
+        return self._tuner
+
+    def record_file(self, bytes_read, latency):
+        """Record a single hashed file - used to tune the number of workers"""
+        if self._tuner is not None:
+            self._tuner.record(bytes_read, latency)
+
+    def settings(self):
+        """The settings of the pool - as a dictionary for the run statistics"""
+        settings = self._tuner.summary() if self._tuner is not None else {'jobs': self._jobs}
+        settings['schedule'] = self._schedule
+        if self._schedule == 'largest':
+            settings['lookahead'] = self._lookahead
+        return settings
+
+    def _submit(self, executor, func):
+        """Submit func - within the limit on active workers if there is one"""
+        if self._active is not None:
+            func = functools.partial(self._gated, func)
+        return executor.submit(func)
+
+    def _gated(self, func):
+        """Run func within the limit on the number of active workers"""
+        with self._active:
+            return func()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = _Executor(max_workers=self._jobs)
+            return self._executor
+
+    def imap(self, work, size=None, timeout=None, deadline=None, position=None):
+        """Do the work - yielding (item, result) in the order of the work
+
+            :param work: An iterable of (item, func) - where func is a callable
+                    taking no arguments, or None for an item which needs no
+                    work (its result is None).
+            :param size: A callable giving the size of an item's work - used
+                    by the largest schedule, and only called for items with
+                    a func. Without it the work is started in order.
+            :param timeout: A callable giving the seconds an item's work may
+                    run for once it has started - None for no limit.
+            :param deadline: The time.monotonic() by which all of the work
+                    must be done - None for no limit.
+            :param position: A callable giving the position on disk of an
+                    item's data - used by the inode and physical schedules,
+                    and only called for items with a func.
+
+            Up to ``window`` items are in progress at once (``lookahead``
+            with the other schedules). If the consumer stops early, the work
+            which hasn't started is cancelled.
+
+            Work which runs past its timeout or the deadline is abandoned and
+            its result is TIMED_OUT - its thread is replaced, so a read which
+            never returns doesn't hold up the rest of the work. Once the
+            deadline has passed no more work is started.
+        """
+        timed = timeout is not None or deadline is not None
+        sweep = self._schedule in ('inode', 'physical') and position is not None
+        if self._jobs == 1 and not timed:
+            results = self._imap_sweep(work, position) if sweep else \
+                ((item, func() if func is not None else None) for item, func in work)
+            for item, result in results:
+                yield item, result
+            return
+
+        if sweep or self._schedule == 'largest' and size is not None:
+            priority = position if sweep else (lambda item: -(size(item) or 0))
+            for item, result in self._imap_ordered(work, priority, sweep, timeout, deadline):
+                yield item, result
+            return
+
+        executor = self._get_executor()
+        in_progress = deque()
+        try:
+            for item, func in work:
+                if func is None:
+                    in_progress.append((item, None))
+                elif deadline is not None and time.monotonic() >= deadline:
+                    in_progress.append((item, TIMED_OUT))
+                else:
+                    in_progress.append((item, self._submit(executor, func)))
+
+                # Yield in order - waiting only when the window is full
+                while in_progress and (len(in_progress) >= self._window or
+                                       not isinstance(in_progress[0][1], Future) or
+                                       in_progress[0][1].done()):
+                    item, future = in_progress.popleft()
+                    yield item, self._outcome(executor, item, future, timeout, deadline)
+
+            while in_progress:
+                item, future = in_progress.popleft()
+                yield item, self._outcome(executor, item, future, timeout, deadline)
+        finally:
+            for _, future in in_progress:
+                if isinstance(future, Future):
+                    future.cancel()
+
+    @staticmethod
+    def _expiry(item, future, timeout, deadline):
+        """The time.monotonic() at which the item's work is abandoned - None if not yet known"""
+        limits = [deadline] if deadline is not None else []
+        started = getattr(future, 'started', None)
+        if timeout is not None and started is not None:
+            limits.append(started + timeout(item))
+        return min(limits) if limits else None
+
+    def _outcome(self, executor, item, future, timeout, deadline):
+        """The result of the item's work - waiting no longer than its timeout or the deadline"""
+        if not isinstance(future, Future):
+            return future
+        if timeout is None and deadline is None:
+            return future.result()
+        while True:
+            expiry = self._expiry(item, future, timeout, deadline)
+            now = time.monotonic()
+            if expiry is not None and now >= expiry and not future.done():
+                executor.abandon(future)
+                return TIMED_OUT
+            try:
+                # Until the work has started its timeout is only a poll interval
+                return future.result(timeout=expiry - now if expiry is not None else timeout(item))
+            except FutureTimeout:
+                continue
+
+    def _imap_sweep(self, work, position):
+        """imap for the inode and physical schedules in the caller's thread
+
+            Each lookahead of work is done in the order of its position, and
+            then yielded in the order of the work.
+        """
+        work = iter(work)
+        while True:
+            chunk = list(itertools.islice(work, self._lookahead))
+            if not chunk:
+                return
+            results = [None] * len(chunk)
+            for index in sorted((index for index, (_, func) in enumerate(chunk) if func is not None),
+                                key=lambda index: position(chunk[index][0])):
+                results[index] = chunk[index][1]()
+            for (item, _), result in zip(chunk, results):
+                yield item, result
+
+    def _imap_ordered(self, work, priority, sweep=False, timeout=None, deadline=None):
+        """imap for the largest, inode and physical schedules - the results are still in order
+
+            Up to ``lookahead`` items are read ahead; whenever a worker is
+            free the item with the lowest priority value not yet started is
+            submitted. With sweep, no more work is read until every item read
+            has been started - so the positions are swept in one direction
+            rather than jumping back for work read later.
+        """
+        executor = self._get_executor()
+        work = iter(work)
+        ahead = deque()     # [item, func, future] in the order of the work
+        waiting = []        # A heap of (priority, sequence, entry) not yet started
+        running = set()
+        sequence = 0
+        exhausted = False
+        try:
+            while True:
+                filling = not (sweep and waiting)
+                while filling and not exhausted and len(ahead) < self._lookahead:
+                    try:
+                        item, func = next(work)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    entry = [item, func, None]
+                    ahead.append(entry)
+                    if func is not None:
+                        heapq.heappush(waiting, (priority(item), sequence, entry))
+                        sequence += 1
+
+                running = {future for future in running if not future.done()}
+                expired = deadline is not None and time.monotonic() >= deadline
+                while waiting and len(running) < self._jobs and not expired:
+                    entry = heapq.heappop(waiting)[2]
+                    entry[2] = self._submit(executor, entry[1])
+                    running.add(entry[2])
+
+                if not ahead:
+                    return
+
+                item, func, future = ahead[0]
+                if func is None or future is not None and future.done():
+                    ahead.popleft()
+                    yield item, future.result() if future is not None else None
+                    continue
+
+                expiry = self._expiry(item, future, timeout, deadline)
+                now = time.monotonic()
+                if expiry is not None and now >= expiry:
+                    if future is not None:
+                        executor.abandon(future)
+                        running.discard(future)
+                    ahead.popleft()
+                    yield item, TIMED_OUT
+                elif expiry is not None:
+                    wait(running, timeout=expiry - now, return_when=FIRST_COMPLETED)
+                else:
+                    wait(running, timeout=timeout(item) if timeout is not None else None,
+                         return_when=FIRST_COMPLETED)
+        finally:
+            for future in running:
+                future.cancel()
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads - they are restarted if there is more work"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class SignatureCache(object):
+    """File signatures keyed by the identity and state of the file
+
+        The key is the hash algorithm and the file's device, inode, size and
+        modification time - so a file which is reached by more than one path
+        (a hard link, or more than one run sharing the cache) is only hashed
+        once, while a file which has changed is hashed again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._computing = {}    # An Event for each key being hashed by a worker
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(hash_name, abs_path):
+        """The cache key for the file - None if the file can't be stat'd"""
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            return None
+        return SignatureCache.stat_key(hash_name, stat)
+
+    @staticmethod
+    def stat_key(hash_name, stat):
+        """The cache key for a file from its os.stat result"""
+        return hash_name, stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self, key):
+        """The cached signature for the key - None if not cached"""
+        with self._lock:
+            signature = self._signatures.get(key)
+            if signature is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return signature
+
+    def put(self, key, signature):
+        """Cache the signature for the key"""
+        with self._lock:
+            self._signatures[key] = signature
+
+    def signature(self, key, compute, timeout=None):
+        """The signature for the key - calling compute() if it isn't cached
+
+            Returns (signature, computed). If another worker is already
+            computing the signature for the key this waits for it rather than
+            hashing the file again - so each file is hashed once however many
+            paths lead to it. A signature of None (the file couldn't be read)
+            isn't cached.
+
+            :param timeout: The most seconds to wait for another worker -
+                    the signature is TIMED_OUT if it hasn't finished by then.
+                    None waits for as long as it takes.
+        """
+        with self._lock:
+            signature = self._signatures.get(key)
+            if signature is not None:
+                self.hits += 1
+                return signature, False
+            computing = self._computing.get(key)
+            if computing is None:
+                computing = self._computing[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            if not computing.wait(timeout):
+                return TIMED_OUT, False
+            with self._lock:
+                signature = self._signatures.get(key)
+                if signature is not None:
+                    self.hits += 1
+                    return signature, False
+            # The other worker couldn't hash the file - so try again here
+            return compute(), True
+
+        signature = None
+        try:
+            signature = compute()
+        finally:
+            with self._lock:
+                self.misses += 1
+                if signature is not None:
+                    self._signatures[key] = signature
+                del self._computing[key]
+            computing.set()
+        return signature, True
+
+    def __len__(self):
+        return len(self._signatures)
@@ -16,16 +16,26 @@ Testable Statements :
 
 import sys
 import os
+import time
 import hashlib
 import six
 import string
 import fnmatch
+import functools
 import errno
+import zlib
 import click
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple, deque
 
 import re
 from cataloger import defaults
+from cataloger.stats import RunStats
+from cataloger.progress import ProgressReporter
+from cataloger.pipeline import WorkerPool, SignatureCache, TIMED_OUT
+from cataloger import readers
+from cataloger import resume
+from cataloger.throttle import ReadLimiter
+from cataloger.readers import BufferPool
 
 __version__ = "0.1"
 _author__ = 'Tony Flury : anthony.flury@btinternet.com'
@@ -42,6 +52,100 @@ class ConfigError(Exception):
     pass
 
 
+class ResumeError(CatalogError):
+    """An Error in a resume token - it is damaged, or is for another catalog"""
+    pass
+
+
+# A single file result - yielded by Cataloger.iter_check and iter_create
+#   path : The path of the file relative to the root
+#   status : One of added, processed, excluded, missing, mismatch, extra, timeout or unverified
+#   expected : The signature from the catalog (None if not in the catalog)
+#   actual : The signature of the local file (None if not hashed)
+Result = namedtuple('Result', ['path', 'status', 'expected', 'actual'])
+
+# A single unit of work in a run - generated in walk order by Cataloger._tasks
+#   kind : 'hash' (a file to be hashed), 'extra' (a file not in the catalog),
+#          'directory' (the end of a directory), 'missing' (a file in the
+#          catalog which wasn't found - only for a fail fast check) or 'excluded'
+#   path : The path relative to the root - for excluded files the walked path
+Task = namedtuple('Task', ['kind', 'path'])
+
+# Consecutive Tasks sent to a hashing worker as one unit - see Cataloger._batched
+#   tasks : The Tasks in walk order - only the 'hash' tasks are small files
+#   size : The total size of the files to be hashed
+Batch = namedtuple('Batch', ['tasks', 'size'])
+
+
+def hash_names(value):
+    """The hash algorithm names in a comma separated value - e.g. 'sha224,blake2b'"""
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def format_signature(digests):
+    """The signature for a list of (algorithm name, hex digest) pairs
+
+       A single digest is just the hex digest - the original catalog format.
+       Several digests are written as name:digest pairs separated by commas,
+       so that one catalog can carry a signature for each algorithm.
+    """
+    if len(digests) == 1:
+        return digests[0][1]
+    return ','.join('{}:{}'.format(name, digest) for name, digest in digests)
+
+
+def parse_signature(signature):
+    """The (algorithm name, hex digest) pairs of a signature from a catalog
+
+       The name is None for a plain hex digest. Raises ValueError if the
+       signature isn't valid.
+    """
+    if ':' not in signature:
+        pairs = [(None, signature)]
+    else:
+        pairs = [tuple(x.strip() for x in part.partition(':')[::2]) for part in signature.split(',')]
+    for name, digest in pairs:
+        if name == '' or not digest or any(x not in string.hexdigits for x in digest):
+            raise ValueError('Invalid signature : {}'.format(signature))
+    return pairs
+
+
+def normalise_policy(spec):
+    """The canonical form of a fingerprint policy - raises ValueError if it isn't valid
+
+       A policy is one of :
+           full - the digest of the whole file
+           partial or partial/N - the digest of the size of the file, and its
+                head, its tail and N sampled blocks (by default
+                defaults.DEFAULT_PARTIAL_SAMPLES)
+           stat - the digest of the size and the modification time only
+       The canonical form of a partial policy always includes N.
+    """
+    name, separator, samples = spec.strip().partition('/')
+    if name not in defaults.ALL_FINGERPRINT_POLICIES or \
+            (separator and (name != 'partial' or not samples.isdigit())):
+        raise ValueError('Invalid fingerprint policy : {}'.format(spec))
+    if name != 'partial':
+        return name
+    return 'partial/{}'.format(int(samples) if samples else defaults.DEFAULT_PARTIAL_SAMPLES)
+
+
+def split_policy(signature):
+    """The fingerprint policy and the digests of a signature - (policy, digests)
+
+       A signature made with any policy other than full is prefixed with the
+       policy and an '=' - e.g. 'partial/8=<digest>'.
+    """
+    policy, _, digests = signature.rpartition('=')
+    return policy or defaults.DEFAULT_FINGERPRINT_POLICY, digests
+
+
+def _update_all(updates, chunk):
+    """Feed the chunk to each of the hashes - so several digests cost one read"""
+    for update in updates:
+        update(chunk)
+
+
 class Cataloger(object):
     """General class for processing the catalog file
 
@@ -68,7 +172,11 @@ class Cataloger(object):
         {'catalog':
              {'catalog': ('_catalog_name', defaults.DEFAULT_CATALOG_FILE),
               'root': ('_root', '.'),
-              'hash': ('_hash', defaults.DEFAULT_HASH)},
+              'hash': ('_hash', defaults.DEFAULT_HASH),
+              'io_policy': ('_io_policy', defaults.DEFAULT_IO_POLICY),
+              'chunk_size': ('_chunk_size', None)},
+         'policies':
+             {'policies': ('_policies', {})},
          'extensions':
              {'extensions': ('_extensions', defaults.DEFAULT_EXTENSIONS)},
          'directories':
@@ -108,11 +216,31 @@ class Cataloger(object):
 
             :param catalog: The name of the catalog file to use
                     Defaults to catalog.cat
-            :param hash: The name of the hash algorithm to use
+            :param hash: The name of the hash algorithm to use - or several
+                    names separated by commas (e.g. 'sha224,blake2b'), which
+                    are all computed from a single read of each file. On a
+                    check the algorithms recorded in the catalog are used.
                     Defaults to sha224
             :param root: The root directory to start the cataloguing
                             Can be an absolute path or relative path
                     Defaults to '.'
+            :param policies: A dictionary of extension to fingerprint policy
+                    (full, partial, partial/N or stat - see
+                    normalise_policy), added to those from the [policies]
+                    section of the config. Files with other extensions get a
+                    full digest. The policy is recorded in each catalog
+                    entry, and a check uses the recorded policy.
+                    Default - {}
+            :param chunk_size: The size of the chunks in which files are read
+                    (see readers.hash_file). If it is given (or set in the
+                    config file) every file is read in chunks of this size -
+                    otherwise files are read in one go, unless they must be
+                    read in chunks (when the chunks are 1M).
+                    Default - None
+            :param io_policy: How files are read for hashing - one of normal
+                    or nocache (see readers.hash_file). With nocache the next
+                    few files to be hashed are also prefetched.
+                    Defaults to normal
 
             :param extensions: A list or set of file extensions - where files
                     with this extensions are catalogued.
@@ -169,6 +297,128 @@ class Cataloger(object):
             :param verbose: The level of detail to report during cataloguing
                     Default - 1
 
+            :param on_result: A callable which is called with a result
+                    dictionary (path, status, expected, actual, size) as each
+                    file result is recorded. Default - None
+
+            :param retain_results: Boolean - Whether files which are not in
+                    the catalog (i.e. extra and excluded files) are retained
+                    for the file lists. If False only the per directory and
+                    per status counts are kept. Default - True
+
+            :param stats: Boolean or a RunStats instance - Whether to record
+                    per phase timings and throughput (see the stats
+                    attribute). Default - False
+
+            :param progress: Boolean or a ProgressReporter instance - Whether
+                    to report live progress (files and bytes done, MB/s
+                    and ETA) to stderr. Default - False
+
+            :param jobs: The number of threads used to hash files, or 'auto'
+                    to tune the number of threads to the host as the run
+                    progresses. The results are recorded in the same order
+                    whatever the number of jobs. Default - 1
+
+            :param schedule: The order in which files are hashed - walk (the
+                    order they are found), largest (the largest first from the
+                    next ``lookahead`` files, with more than one job), inode
+                    or physical (each ``lookahead`` of files in inode order,
+                    or in the order of their data on the disk where FIEMAP is
+                    available). The results are recorded in walk order
+                    whatever the schedule. Default - walk
+
+            :param lookahead: The number of files to choose from with the
+                    largest, inode and physical schedules. Default - 32 per job
+
+            :param batch_threshold: With more than one job, files smaller
+                    than this (in bytes) are hashed in batches - each batch
+                    is hashed by one thread, saving the cost of handing every
+                    small file to a thread. Default - 64K
+
+            :param batch_bytes: A batch is closed once its files total this
+                    many bytes. Default - 1M
+
+            :param batch_files: A batch is closed once it holds this many
+                    files - 1 turns batching off. Default - 256
+
+            :param file_timeout: The seconds a file may take to be hashed -
+                    a file which takes longer (e.g. a read which hangs on a
+                    network mount) is abandoned and recorded as timeout, and
+                    the rest of the tree is processed. Small files are not
+                    batched when there is a file timeout. Default - None (no
+                    limit)
+
+            :param run_timeout: The seconds the whole run may take - once
+                    it has passed every file not yet hashed is recorded as
+                    timeout. Default - None (no limit)
+
+            :param deadline: The seconds a check may take - the files are
+                    hashed in priority order (see priority_extensions) and
+                    once the deadline has passed every file not yet hashed is
+                    recorded as unverified (which isn't a failure). The
+                    coverage and resume_token properties give the fraction of
+                    the catalog verified, and a token for the rest. Ignored
+                    by a create. Default - None (no limit)
+
+            :param resume: A resume_token from an earlier check with a
+                    deadline - the files it verified are skipped.
+                    Default - None
+
+            :param min_coverage: The fraction (0 to 1) of the catalog a
+                    check with a deadline must verify - see below_min_coverage.
+                    Default - None (only a check which verifies none of the
+                    catalog falls short)
+
+            :param priority_extensions: The extensions of the files hashed
+                    first by a check with a deadline - the files are then
+                    taken most recently modified first.
+                    Default - defaults.DEFAULT_PRIORITY_EXTENSIONS
+
+            :param fail_fast: Boolean - Whether a check stops at the first
+                    failure (a reportable mismatched, missing or extra file,
+                    or a timeout). The extra and missing files are found
+                    before any file is hashed, and the hashing still pending
+                    is cancelled. Ignored by a create. Default - False
+
+            :param pool: A WorkerPool to hash files with - allowing a pool to
+                    be shared by several Catalogers. If given, jobs, schedule
+                    and lookahead are ignored. Default - None
+
+            :param max_read_rate: The maximum rate (bytes per second) at which
+                    files are read for hashing - across all of the hashing
+                    threads. Default - None (no limit)
+
+            :param max_file_rate: The maximum rate (files per second) at which
+                    files are opened for hashing. Default - None (no limit)
+
+            :param read_burst: The largest burst (in bytes) allowed above the
+                    max_read_rate. Default - one second's worth
+
+            :param read_limiter: A ReadLimiter shared by several Catalogers -
+                    if given, the three arguments above are ignored.
+                    Default - None
+
+            :param sparse: Boolean - whether the holes in sparse files are
+                    skipped rather than read (see readers.hash_file). The
+                    signatures are the same either way. Default - False
+
+            :param max_inflight_bytes: The most bytes held in read buffers
+                    at once across all of the hashing threads - each file is
+                    read in chunks into buffers from a shared BufferPool.
+                    Default - None (no limit; a file is read in one go)
+
+            :param buffer_pool: A BufferPool shared by several Catalogers -
+                    if given, max_inflight_bytes is ignored. Default - None
+
+            :param signature_cache: A SignatureCache shared by several
+                    Catalogers, so that a file reached from more than one of
+                    them is only hashed once. Default - None
+
+            :param dedup_links: Boolean - whether a file with more than one
+                    hard link is hashed only once per run, its signature
+                    being reused for every path which links to it. The bytes
+                    saved are recorded in the stats. Default - True
+
             Config file processing :
             ------------------------
 
@@ -199,7 +449,7 @@ class Cataloger(object):
         #      for opt, n_d in
         #      self.config_sections_and_attrs[section].items()])
 
-        self._config = kwargs.get('conifg', defaults.DEFAULT_CONFIG_FILE)
+        self._config = kwargs.get('config', defaults.DEFAULT_CONFIG_FILE)
         self._config = defaults.DEFAULT_CONFIG_FILE if not self._config else self._config
 
         self._noconfig = kwargs.get('no_config', False)
@@ -210,8 +460,20 @@ class Cataloger(object):
 
         # The catalog section - override defaults with kwargs if they exist
         self._catalog_name = kwargs.get('catalog', self._catalog_name)
-        self._hash = kwargs.get('hash', self._hash)
+        self._hash = kwargs.get('hash', None) or self._hash
         self._root = kwargs.get('root', self._root)
+        self._io_policy = kwargs.get('io_policy', None) or self._io_policy
+        self._chunk_size = int(kwargs.get('chunk_size', None) or self._chunk_size or 0) or None
+
+        # Fingerprint policies by extension - the config's, updated by kwargs
+        try:
+            self._policies = dict(self._policies, **{ext: normalise_policy(spec) for ext, spec in
+                                                     (kwargs.get('policies', None) or {}).items()})
+        except ValueError as e:
+            six.raise_from(ValueError(str(e)), None)
+        if self._io_policy not in defaults.ALL_IO_POLICIES:
+            six.raise_from(ValueError(
+                'Invalid value for io_policy: {}'.format(self._io_policy)), None)
 
         # The report section
         self._verbose = kwargs.get('verbose', self._verbose)
@@ -247,6 +509,10 @@ class Cataloger(object):
         if 'exclude_filter' in kwargs and kwargs['exclude_filter']:
             self._exclude_filter = kwargs['exclude_filter']
 
+        # Compile the filters once - each is a single regex or None
+        self._include_re = self._compile_filter(self._include_filter)
+        self._exclude_re = self._compile_filter(self._exclude_filter)
+
         # ToDO Remove Report Grouping probably
         # Turns on grouped reporting - Do we need this.
         self._group = kwargs.get('group', defaults.DEFAULT_REPORT_GROUP)
@@ -259,16 +525,98 @@ class Cataloger(object):
         self._extension_counts = {}  # Count of each file extension
         self._excluded_files = []
 
+        # Streaming of results - see record_* methods
+        self._on_result = kwargs.get('on_result', None)
+        self._retain_results = kwargs.get('retain_results', True)
+
+        # directory_counts is a 2 level dictionary:
+        # top level of directories, key = directory, value is dictionary
+        # 2nd level key = status, value is count of files with that status
+        self._directory_counts = OrderedDict()
+        self._status_counts = {}
+
         # catalog_data is a 2 level dictioanry:
         # top level of directories, key = directory, value is dictionary
         # 2nd level key = file name, value is 2-tuple (signature/status)
         self._catalog_data = OrderedDict()
 
         self._catalog_fp = None
+        self._catalog_stamp = None  # (mtime, size) of the loaded catalog
+        self._catalog_hashes = None     # The algorithms named in the loaded catalog
+        self._catalog_checksum = 0      # The checksum of the loaded catalog's entries
+        self._hashes = hash_names(self._hash)   # The algorithms computed for each file
         self._action = None
+        self._pending = None    # Results waiting to be yielded by iter_*
+        self._has_run = False   # Has a check or create been run yet
+        self._saved_retain = self._retain_results
 
         self._error_code = 0
 
+        # Instrumentation - a RunStats instance, or None when disabled
+        stats = kwargs.get('stats', False)
+        self._stats = RunStats() if stats is True else (stats or None)
+        if self._stats is not None:
+            self._instrument()
+
+        # Progress reporting - a ProgressReporter instance, or None
+        progress = kwargs.get('progress', False)
+        self._progress = ProgressReporter() if progress is True else (progress or None)
+
+        # The signature pipeline - the pool is only shut down by its owner
+        self._pool = kwargs.get('pool', None)
+        self._own_pool = self._pool is None
+        if self._own_pool:
+            jobs = kwargs.get('jobs', None) or defaults.DEFAULT_JOBS
+            self._pool = WorkerPool(jobs=jobs if jobs == 'auto' else int(jobs),
+                                    schedule=kwargs.get('schedule', None) or defaults.DEFAULT_SCHEDULE,
+                                    lookahead=kwargs.get('lookahead', None))
+        self._signature_cache = kwargs.get('signature_cache', None)
+
+        # Hard links - the files with more than one link are only hashed
+        # once per run, using a SignatureCache which lasts for the run
+        self._dedup_links = kwargs.get('dedup_links', True)
+        self._link_cache = None
+
+        # Batching of small files - only worthwhile with more than one job
+        self._batch_threshold = kwargs.get('batch_threshold', None) or defaults.DEFAULT_BATCH_THRESHOLD
+        self._batch_bytes = kwargs.get('batch_bytes', None) or defaults.DEFAULT_BATCH_BYTES
+        self._batch_files = kwargs.get('batch_files', None) or defaults.DEFAULT_BATCH_FILES
+        self._batch_counts = [0, 0]     # Batches, and files hashed in batches
+
+        # Deadlines for stragglers - in seconds, or None for no limit
+        self._file_timeout = kwargs.get('file_timeout', None) or None
+        self._run_timeout = kwargs.get('run_timeout', None) or None
+        self._stop_at = None    # The time.monotonic() at which the current run is cut short
+
+        # A time budget for a check - the files are hashed in priority order
+        self._deadline = kwargs.get('deadline', None) or None
+        self._deadline_at = None    # The time.monotonic() of the deadline for the current run
+        self._resume = kwargs.get('resume', None) or None
+        self._resumed_count = 0
+        self._min_coverage = kwargs.get('min_coverage', None)
+        self._priority_extensions = set(kwargs.get('priority_extensions', None) or
+                                        defaults.DEFAULT_PRIORITY_EXTENSIONS)
+
+        # Stop a check at the first failure
+        self._fail_fast = bool(kwargs.get('fail_fast', False))
+        self._first_failure = None  # The Result which stopped the current run
+
+        # Read throttling - a ReadLimiter shared by all the hashing threads, or None
+        self._read_limiter = kwargs.get('read_limiter', None)
+        if self._read_limiter is None and (kwargs.get('max_read_rate') or kwargs.get('max_file_rate')):
+            self._read_limiter = ReadLimiter(bytes_per_second=kwargs.get('max_read_rate'),
+                                             files_per_second=kwargs.get('max_file_rate'),
+                                             burst=kwargs.get('read_burst'))
+
+        # Sparse files - only the data regions are read, the holes are hashed as zeros
+        self._sparse = kwargs.get('sparse', False)
+
+        # Memory backpressure - a BufferPool shared by all the hashing threads, or None
+        self._buffer_pool = kwargs.get('buffer_pool', None)
+        if self._buffer_pool is None and kwargs.get('max_inflight_bytes'):
+            self._buffer_pool = BufferPool(kwargs['max_inflight_bytes'],
+                                           self._chunk_size or defaults.DEFAULT_CHUNK_SIZE)
+
         if not action:
             return
 
@@ -276,6 +624,44 @@ class Cataloger(object):
 
         self._start_command()
 
+        # Reject a resume token for another catalog before any work is done
+        if self._resume and self._action == 'check':
+            self._resumed_entries()
+
+    def _instrument(self):
+        """Replace the phase methods on this instance with timed versions
+
+           Only called when statistics are enabled, so that there is no
+           overhead on the methods otherwise.
+        """
+        for name, phase in [('_load_catalog', '_load_catalog'),
+                            ('_is_file_to_be_processed', '_is_file_to_be_processed'),
+                            ('_file_signature', 'get_signature')]:
+            setattr(self, name, self._stats.timed(phase, getattr(self, name)))
+
+        walk_tree = self._walk_tree
+        self._walk_tree = lambda: self._stats.timed_iter('walk', walk_tree())
+
+    @property
+    def stats(self):
+        """The RunStats for this run - None if statistics are not enabled"""
+        return self._stats
+
+    @property
+    def read_limiter(self):
+        """The ReadLimiter for this run - None if reading is not throttled"""
+        return self._read_limiter
+
+    @property
+    def buffer_pool(self):
+        """The BufferPool for this run - None if the bytes in flight are not limited"""
+        return self._buffer_pool
+
+    @property
+    def progress(self):
+        """The ProgressReporter for this run - None if progress is not enabled"""
+        return self._progress
+
     @property
     def verbose(self):
         return int(self._verbose)
@@ -294,9 +680,15 @@ class Cataloger(object):
         """The file name of the catalog file - provided for completeness"""
         return self._catalog_name
 
+    @property
+    def root(self):
+        """The root directory being catalogued or checked"""
+        return self._root
+
     @property
     def processed_count(self):
-        return self._catalog_data_count
+        """The number of files in the catalog - less those left unverified by a deadline"""
+        return self._catalog_data_count - self.status_count('unverified')
 
     @property
     def excluded_files(self):
@@ -322,18 +714,109 @@ class Cataloger(object):
             those that exist in the catalog but not locally"""
         return self._files_by_status('missing')
 
+    @property
+    def timed_out_files(self):
+        """The list of timed out files
+            those which couldn't be hashed within the file or run timeout"""
+        return self._files_by_status('timeout')
+
+    @property
+    def deadline(self):
+        """The seconds a check may take - None if there is no deadline"""
+        return self._deadline
+
+    @property
+    def first_failure(self):
+        """The Result which stopped a fail fast check - None if the check wasn't stopped"""
+        return self._first_failure
+
+    @property
+    def unverified_files(self):
+        """The list of unverified files
+            those which weren't hashed before the deadline"""
+        return self._files_by_status('unverified')
+
+    @property
+    def coverage(self):
+        """The fraction of the catalog verified by the last check - None if the catalog is empty
+
+            Includes the files verified by the run the resume token came from.
+        """
+        if not self._catalog_data_count:
+            return None
+        verified = sum(self.status_count(status) for status in ('processed', 'mismatch', 'missing'))
+        return (verified + self._resumed_count) / float(self._catalog_data_count)
+
+    @property
+    def below_min_coverage(self):
+        """True if a check with a deadline verified less of the catalog than min_coverage
+
+            Without a min_coverage only a check which verified none of the
+            catalog falls short - so a check which ran out of time before
+            verifying anything can't pass.
+        """
+        coverage = self.coverage
+        if not self._deadline or self._action != 'check' or coverage is None:
+            return False
+        return coverage < self._min_coverage if self._min_coverage else coverage == 0
+
+    @property
+    def resume_token(self):
+        """A token for a check of the files which weren't verified before the deadline
+
+            None unless the last check had a deadline and files were left
+            unverified. Mismatched files aren't counted as verified - so they
+            are checked (and reported) again by the resumed check.
+        """
+        if not self._deadline or self._action != 'check' or not self.status_count('unverified'):
+            return None
+        verified = [index for index, (_, _, entry) in enumerate(self._catalog_entries())
+                    if entry.get('processed') in ('processed', 'resumed')]
+        return resume.encode_token(self._catalog_data_count, self._catalog_checksum, verified)
+
 
     @property
     def catalog_summary_by_directory(self):
-        for directory, files in self._catalog_data.items():
+        for directory, counts in self._directory_counts.items():
             yield {'path':directory,
-                   'added':sum(1 for file, data in files.items() if data['processed'] == 'added'),
-                   'processed': sum(1 for file, data in files.items() if
-                                data['processed'] == 'processed'),
-                   'excluded':sum(1 for file, data in files.items() if data['processed'] == 'excluded'),
-                   'missing': sum(1 for file, data in files.items() if data['processed'] == 'missing'),
-                   'mismatch': sum(1 for file, data in files.items() if data['processed'] == 'mismatch'),
-                   'extra': sum(1 for file, data in files.items() if data['processed'] == 'extra'),}
+                   'added':counts.get('added', 0),
+                   'processed': counts.get('processed', 0),
+                   'excluded':counts.get('excluded', 0),
+                   'missing': counts.get('missing', 0),
+                   'mismatch': counts.get('mismatch', 0),
+                   'extra': counts.get('extra', 0),
+                   'timeout': counts.get('timeout', 0),
+                   'unverified': counts.get('unverified', 0),}
+
+    def status_count(self, status):
+        """The number of files recorded with the given status"""
+        return self._status_counts.get(status, 0)
+
+    def _count_status(self, directory, status, previous=None):
+        """Keep the per directory and per status counts up to date"""
+        counts = self._directory_counts.setdefault(directory, {})
+        if previous:
+            counts[previous] -= 1
+            self._status_counts[previous] -= 1
+        counts[status] = counts.get(status, 0) + 1
+        self._status_counts[status] = self._status_counts.get(status, 0) + 1
+
+    def _notify(self, rel_path, status, expected=None, actual=None):
+        """Pass a single file result to iter_* and the on_result callable"""
+        if self._pending is not None:
+            self._pending.append(Result(os.path.normpath(rel_path), status,
+                                        expected, actual))
+        if self._on_result is None:
+            return
+        try:
+            size = os.stat(self.abs_path(rel_path)).st_size
+        except OSError:
+            size = None
+        self._on_result({'path': os.path.normpath(rel_path),
+                         'status': status,
+                         'expected': expected,
+                         'actual': actual,
+                         'size': size})
 
     def _files_by_status(self, status):
         return [file_name if directory == '.'
@@ -558,6 +1041,29 @@ class Cataloger(object):
         self._config_operator_list_modifiers(
             attr_name, ext, line, line_no, op, 'extension')
 
+    def _config_line_policies_section(self, line, line_no):
+        """Called for each line in the policies section
+
+            Each line is : <extension list> = <policy>
+            e.g. .png, .jpg = partial/16
+
+             :param line: The full line from the config file
+             :param line_no : The line number in the config file
+        """
+        extensions, _, spec = (x.strip() for x in line.partition('='))
+        extensions = [e.strip() for e in extensions.split(',')]
+        try:
+            if any(len(e) <= 1 or e[0] != '.' for e in extensions):
+                raise ValueError(extensions)
+            policy = normalise_policy(spec)
+        except ValueError:
+            six.raise_from(ConfigError(
+                'Invalid value in [policies] section :'
+                ' \'{}\' on line {}'.format(
+                    line, line_no)), None)
+        # A new dictionary - the default is shared by every instance
+        self._policies = dict(self._policies, **{e: policy for e in extensions})
+
     def _config_operator_list_modifiers(self, attr_name, values, line, line_no,
                                         op,
                                         section):
@@ -636,10 +1142,28 @@ class Cataloger(object):
                 ' \'{}\' on line {}'.format(
                     line, line_no)), None)
 
+    @staticmethod
+    def _config_validate_io_policy(line, line_no, value):
+        """Helper function to validate the io_policy"""
+        if value not in defaults.ALL_IO_POLICIES:
+            six.raise_from(ConfigError(
+                'Invalid value for io_policy :'
+                ' \'{}\' on line {} - must be one of {}'.format(
+                    line, line_no, ', '.join(defaults.ALL_IO_POLICIES))), None)
+
+    @staticmethod
+    def _config_validate_chunk_size(line, line_no, value):
+        """Helper function to validate the chunk_size - a number of bytes"""
+        if not value.isdigit() or int(value) < 1:
+            six.raise_from(ConfigError(
+                'Invalid value for chunk_size :'
+                ' \'{}\' on line {} - must be a number of bytes'.format(line, line_no)), None)
+
     @staticmethod
     def _config_validate_hash(line, line_no, value):
-        """Helper funvtion to validate the hash """
-        if value not in hashlib.algorithms_available:
+        """Helper funvtion to validate the hash - one or more names separated by commas"""
+        names = hash_names(value)
+        if not names or any(name not in hashlib.algorithms_available for name in names):
             raise six.raise_from(ConfigError(
                 'Invalid value for hash :'
                 ' \'{}\' on line {}'.format(line, line_no)),None)
@@ -653,6 +1177,9 @@ class Cataloger(object):
         On a create action; the catalog is open to write
         """
         if self._action == 'check':
+            self._catalog_stamp = self._stat_catalog()
+            self._catalog_hashes = None
+            self._catalog_checksum = 0
             try:
                 with open(self._catalog_name, 'r') as self._catalog_fp:
                     self._load_catalog()
@@ -667,6 +1194,83 @@ class Cataloger(object):
         elif self._action != 'create':
             six.raise_from(ValueError(
                 'Invalid value for subcommand: {}'.format(self._action)), None)
+        self._hashes = self._select_hashes()
+
+    def _select_hashes(self):
+        """The names of the hash algorithms computed for each file
+
+            A create computes every algorithm asked for. A check computes
+            those recorded in the catalog which were asked for - or all of
+            those in the catalog if none of them were - and for a catalog of
+            plain digests, the first algorithm asked for.
+        """
+        requested = hash_names(self._hash)
+        if self._action != 'check' or not self._catalog_hashes:
+            names = requested if self._action == 'create' else requested[:1]
+        else:
+            names = [name for name in self._catalog_hashes if name in requested] or self._catalog_hashes
+        unavailable = [name for name in names if name not in hashlib.algorithms_available]
+        if unavailable:
+            six.raise_from(CatalogError(
+                'Hash algorithm not available : {}'.format(', '.join(unavailable))), None)
+        return names
+
+    def _stat_catalog(self):
+        """The (mtime, size) of the catalog file - None if it can't be read"""
+        try:
+            stat = os.stat(self._catalog_name)
+        except (OSError, TypeError, ValueError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _prepare_run(self):
+        """Prepare for a check or create run
+
+            The first run uses the state set up by the constructor. Each later
+            run resets the per run status, and on a check reloads the catalog
+            only if the catalog file has changed (mtime or size) - so repeated
+            checks only pay for the walk and hashing.
+        """
+        if not self._has_run:
+            self._has_run = True
+            return
+
+        stamp = self._stat_catalog() if self._action == 'check' else None
+        if self._action == 'check' and (stamp is None or stamp != self._catalog_stamp):
+            self._catalog_data = OrderedDict()
+            self._catalog_data_count = 0
+            self.reset()
+            self._start_command()
+        else:
+            self.reset()
+
+    def reset(self):
+        """Reset the per run status - keeping the loaded catalog and the config
+
+            Every catalog entry is marked as not processed, and all other
+            recorded files and all counts are discarded.
+        """
+        if self._action == 'create':
+            self._catalog_data = OrderedDict()
+            self._catalog_data_count = 0
+
+        for directory in list(self._catalog_data):
+            files = self._catalog_data[directory]
+            for file_name in list(files):
+                if 'signature' in files[file_name]:
+                    files[file_name]['processed'] = False
+                else:
+                    del files[file_name]
+            if not files:
+                del self._catalog_data[directory]
+
+        self._directory_counts = OrderedDict((directory, {}) for directory in self._catalog_data)
+        self._status_counts = {}
+        self._extension_counts = {}
+        self._excluded_file_count = 0
+
+        if self._stats is not None:
+            self._stats.reset()
 
     def _load_catalog(self):
         """Load the given catalog file, and analyse into a dictionary
@@ -678,6 +1282,7 @@ class Cataloger(object):
 
             if not entry:
                 continue
+            self._catalog_checksum = zlib.crc32(entry.encode('utf-8'), self._catalog_checksum)
 
             if '\t' not in entry:
                 six.raise_from(CatalogError(
@@ -685,19 +1290,28 @@ class Cataloger(object):
                         line_num)), None)
 
             entry_name, signature = entry.strip().split('\t')
+            signature = signature.strip()
 
             directory, file_name = os.path.split(entry_name.strip())
             directory = directory if directory else '.'
             dirlist = self._catalog_data.setdefault(directory, {})
+            self._directory_counts.setdefault(directory, {})
 
-            if any(True for x in signature if x not in string.hexdigits):
+            try:
+                policy, digests = split_policy(signature)
+                pairs = parse_signature(digests)
+                if policy != normalise_policy(policy):
+                    raise ValueError(policy)
+            except ValueError:
                 six.raise_from(CatalogError(
                     'Invalid catalog format -'
                     ' invalid signature on line {}'.format(
                         line_num)), None)
             else:
-                dirlist[file_name] = OrderedDict([('signature', signature.strip()),
-                                      ('processed', False)])
+                if self._catalog_hashes is None and pairs[0][0] is not None:
+                    self._catalog_hashes = [name for name, _ in pairs]
+                dirlist[file_name] = OrderedDict([('signature', signature),
+                                      ('processed', False), ('policy', policy)])
 
             self._catalog_data_count += 1
         else:
@@ -728,15 +1342,14 @@ class Cataloger(object):
             return False
 
         # Check any filters
-        if self._exclude_filter:
+        if self._exclude_re is not None:
 
             # Does the full path match any filter ?
-            if any(fnmatch.fnmatch(full, pat) for pat in self._exclude_filter):
+            if self._exclude_re.match(os.path.normcase(full)):
                 return False
 
-        if self._include_filter:
-            if all(not fnmatch.fnmatch(full, pat) for pat in
-                    self._include_filter):
+        if self._include_re is not None:
+            if not self._include_re.match(os.path.normcase(full)):
                 return False
 
         # check extensions
@@ -748,6 +1361,18 @@ class Cataloger(object):
 
         return True
 
+    @staticmethod
+    def _compile_filter(patterns):
+        """Compile a set of glob patterns into a single regex - None if empty
+
+           A path matches the regex if it would match any of the patterns
+           using fnmatch.fnmatch
+        """
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:{})'.format(
+            fnmatch.translate(os.path.normcase(pat))) for pat in patterns))
+
     def _record_extension(self, path):
         """Record a count of each extension encountered"""
         ext = os.path.splitext(path)[1]
@@ -762,6 +1387,8 @@ class Cataloger(object):
 
         self._catalog_data_count += 1
         self._record_extension(rel_path)
+        self._count_status(directory, 'added')
+        self._notify(rel_path, 'added', actual=signature)
 
     def write_catalog(self):
         """Write the file data into the catalog"""
@@ -792,14 +1419,12 @@ class Cataloger(object):
         windows_hidden = False if not hasattr(file_stat, 'st_file_attributes') else (file_stat.st_file_attributes & os.stat.FILE_ATTRIBUTE_HIDDEN)
         return os.path.basename(path).startswith('.') or windows_hidden
 
-    def walk(self):
-        """ Progress through the directory tree
+    def _walk_tree(self):
+        """Walk the directory tree applying the config rules - without recording
 
-            Filtering out files not required
-            yield the path of the file relative to self._root
-            Used during the check and create process
+            yield (directory, files to be processed, all files) for each
+            directory which isn't ignored or hidden
         """
-
         for directory, sub_directories, files in os.walk(self._root):
 
             # Don't recurse into directories that should be ignored
@@ -816,14 +1441,83 @@ class Cataloger(object):
                              self._is_file_to_be_processed(directory,
                                                            file_name)]
 
+            yield directory, process_files, files
+
+    def count_files(self):
+        """Count the files and bytes which will be processed
+
+            A stat only pass over the tree - used to give progress totals
+        """
+        count, size = 0, 0
+        for directory, process_files, _ in self._walk_tree():
+            for file_name in process_files:
+                try:
+                    size += os.stat(os.path.join(directory, file_name)).st_size
+                except OSError:
+                    continue
+                count += 1
+        return count, size
+
+    def _start_progress(self):
+        """Start the progress reporting with the best cheap estimate of the totals
+
+            On a check the number of files is known from the catalog, and the
+            bytes are estimated as the run progresses. On a create the tree
+            is pre-counted when the progress is being displayed.
+        """
+        if self._action == 'check':
+            self._progress.start(total_files=self._catalog_data_count)
+        elif self._progress.display:
+            self._progress.start(*self.count_files())
+        else:
+            self._progress.start()
+
+    def walk(self):
+        """ Progress through the directory tree
+
+            Filtering out files not required
+            yield the path of the file relative to self._root
+            Used during the check and create process
+        """
+        for directory, process_files, files in self._walk_tree():
+
             if process_files:
                 yield os.path.relpath(directory, self._root), process_files
 
             # After yielding Look at every file and record those as excluded
             # Assumes that the consumer code records each file in some way
-            for file_name in files:
-                if file_name not in process_files:
-                    self.record_excluded(directory, file_name)
+            for file_name in self._excluded_names(process_files, files):
+                self.record_excluded(directory, file_name)
+
+    @staticmethod
+    def _excluded_names(process_files, files):
+        """The names in files which are not in process_files"""
+        selected = set(process_files)
+        return [file_name for file_name in files if file_name not in selected]
+
+    def _tasks(self):
+        """Generate the work for a check or create run - in walk order
+
+            Nothing is recorded here : each Task is recorded by _record_task,
+            so the walk can run ahead of (or in a different thread to) the
+            recording, and only 'hash' tasks need any file content to be read.
+        """
+        check = self._action == 'check'
+        for directory, process_files, files in self._walk_tree():
+            rel_dir = os.path.relpath(directory, self._root)
+
+            for file_name in process_files:
+                rel_path = os.path.join(rel_dir, file_name)
+                if check and not self.is_file_in_catalog(file_path=rel_path):
+                    yield Task('extra', rel_path)
+                else:
+                    yield Task('hash', rel_path)
+
+            if check and process_files:
+                yield Task('directory', rel_dir)
+
+            for file_name in self._excluded_names(process_files, files):
+                yield Task('excluded', os.path.join(directory, file_name))
 
     def is_file_in_catalog(self, file_path):
         """Return True if this directory and file is in the loaded catalog"""
@@ -871,34 +1565,171 @@ class Cataloger(object):
                     self._catalog_data[directory]:
                 return None
 
-            return self._catalog_data[directory][name]['signature'].strip()
+            return self._expected_signature(self._catalog_data[directory][name]['signature'])
+
+        return self._file_signature(self.abs_path(rel_path), self._file_policy(rel_path))
+
+    def _file_policy(self, rel_path):
+        """The fingerprint policy for the file
 
-        abs_path = self.abs_path(rel_path)
+            On a check the policy recorded in the catalog entry is used, so
+            the file is fingerprinted as it was when the catalog was created;
+            otherwise it is the policy for the file's extension.
+        """
+        if self._action == 'check':
+            directory, name = os.path.split(rel_path)
+            entry = self._catalog_data.get(directory, {}).get(name)
+            if entry is not None:
+                return entry.get('policy', defaults.DEFAULT_FINGERPRINT_POLICY)
+        return self._policies.get(os.path.splitext(rel_path)[1], defaults.DEFAULT_FINGERPRINT_POLICY)
+
+    def _expected_signature(self, signature):
+        """The catalog signature in the form of the local signatures - just
+           the digests of the algorithms being computed
+        """
+        if ':' not in signature:
+            return signature
+        policy, digests = split_policy(signature)
+        digests = dict(parse_signature(digests))
+        return self._with_policy(policy, format_signature([(name, digests.get(name, '')) for name in self._hashes]))
+
+    @staticmethod
+    def _with_policy(policy, signature):
+        """The signature prefixed with its fingerprint policy - unless it is full"""
+        if signature is None or policy == defaults.DEFAULT_FINGERPRINT_POLICY:
+            return signature
+        return '{}={}'.format(policy, signature)
+
+    def _file_signature(self, abs_path, policy=defaults.DEFAULT_FINGERPRINT_POLICY):
+        """Generate the signature for the file content at the given path
 
-        m = hashlib.new(self._hash)
+            A file with more than one hard link (or any file, with a shared
+            signature_cache) is looked up by its inode - so each inode is
+            only hashed once, however many paths lead to it.
+
+            :param policy: The fingerprint policy - see normalise_policy
+        """
+        cache, key, size = self._cache_entry(abs_path, policy)
+        if cache is None:
+            return self._hash_file(abs_path, policy)
+
+        signature, computed = cache.signature(key, functools.partial(self._hash_file, abs_path, policy),
+                                              timeout=self._wait_budget())
+        if not computed and signature is not TIMED_OUT:
+            if self._stats is not None:
+                self._stats.count_deduplicated(size)
+            if self._progress is not None:
+                self._progress.update(0)
+        return signature
+
+    def _wait_budget(self):
+        """The seconds a file may wait for another worker hashing the same inode
+
+            The file's timeout, or what is left of the run - None if neither
+            is limited.
+        """
+        limits = [self._file_timeout] if self._file_timeout else []
+        if self._stop_at is not None:
+            limits.append(max(0.0, self._stop_at - time.monotonic()))
+        return min(limits) if limits else None
+
+    def _cache_entry(self, abs_path, policy=defaults.DEFAULT_FINGERPRINT_POLICY):
+        """The SignatureCache, key and size for the file - all None if it isn't cached"""
+        if self._signature_cache is None and self._link_cache is None:
+            return None, None, None
         try:
-            with open(abs_path, 'rb') as f:
-                m.update(f.read())
+            stat = os.stat(abs_path)
+        except OSError:
+            return None, None, None
+        if self._signature_cache is not None:
+            cache = self._signature_cache
+        elif stat.st_nlink > 1:
+            cache = self._link_cache
+        else:
+            return None, None, None
+        return cache, SignatureCache.stat_key(self._with_policy(policy, ','.join(self._hashes)), stat), stat.st_size
+
+    def _hash_file(self, abs_path, policy=defaults.DEFAULT_FINGERPRINT_POLICY):
+        """Read and hash the file content - None if it can't be read
+
+            Every algorithm in use is fed from the same read of the file. The
+            signature is prefixed by the policy if it isn't full.
+        """
+        hashes = [hashlib.new(name) for name in self._hashes]
+        update = hashes[0].update if len(hashes) == 1 else \
+            functools.partial(_update_all, [m.update for m in hashes])
+        started = time.perf_counter() if self._pool.tuner is not None else None
+        try:
+            if policy != defaults.DEFAULT_FINGERPRINT_POLICY:
+                size, read = self._read_fingerprint(abs_path, policy, update)
+            elif self._io_policy == 'normal' and self._read_limiter is None and \
+                    self._buffer_pool is None and not self._sparse and self._chunk_size is None:
+                with open(abs_path, 'rb') as f:
+                    data = f.read()
+                    update(data)
+                size = read = len(data)
+            else:
+                size = read = readers.hash_file(abs_path, update, policy=self._io_policy,
+                                                chunk_size=self._chunk_size or defaults.DEFAULT_CHUNK_SIZE,
+                                                limiter=self._read_limiter,
+                                                buffers=self._buffer_pool, sparse=self._sparse)
+                if self._sparse:
+                    # The holes of a sparse file are hashed but not read
+                    size = max(read, os.path.getsize(abs_path))
         except BaseException as e:
             sys.stderr.write(
                 "Error creating signature for '{}': {}\n".format(abs_path, e))
             return None
-        return m.hexdigest().strip()
+        if started is not None:
+            self._pool.record_file(read, time.perf_counter() - started)
+        if self._stats is not None:
+            self._stats.count_hashed(read, holes=size - read if self._sparse else 0)
+        if self._progress is not None:
+            self._progress.update(size)
+        return self._with_policy(policy, format_signature([(name, m.hexdigest())
+                                                           for name, m in zip(self._hashes, hashes)]))
+
+    def _read_fingerprint(self, abs_path, policy, update):
+        """Feed the fingerprint for a partial or stat policy to update
+
+            Returns the size of the file and the bytes read from it.
+        """
+        name, _, samples = policy.partition('/')
+        if name == 'stat':
+            stat = os.stat(abs_path)
+            update('{} {}\n'.format(stat.st_size, stat.st_mtime_ns).encode('ascii'))
+            return stat.st_size, 0
+        read = readers.hash_fingerprint(abs_path, update, samples=int(samples), policy=self._io_policy,
+                                        limiter=self._read_limiter, buffers=self._buffer_pool)
+        return os.path.getsize(abs_path), read
 
     def _path_rel_to_root(self, abspath):
         return os.path.relpath(abspath, self._root)
 
-    def _mark_processed(self, rel_path, status='processed'):
+    def _mark_processed(self, rel_path, status='processed',
+                        expected=None, actual=None):
         """Mark a file as having been processed"""
-        if status not in ['excluded']:
+        # The file types table counts the files processed - an unverified file wasn't
+        if status not in ['excluded', 'unverified']:
             self._record_extension(rel_path)
         directory, file_name = os.path.split(rel_path)
-        self._catalog_data.setdefault(directory, {})
-        self._catalog_data[directory].setdefault(file_name, {})
-        self._catalog_data[directory][file_name]['processed'] = status
 
-    def record_ok(self, rel_path):
-        self._mark_processed(rel_path=rel_path, status='processed')
+        # Files not in the catalog are only counted unless retained
+        in_catalog = file_name in self._catalog_data.get(directory, {})
+        if in_catalog or self._retain_results:
+            self._catalog_data.setdefault(directory, {})
+            data = self._catalog_data[directory].setdefault(file_name, {})
+            previous = data.get('processed', False)
+            data['processed'] = status
+        else:
+            previous = None
+
+        self._count_status(directory, status, previous)
+        self._notify(rel_path, status, expected=expected, actual=actual)
+
+    def record_ok(self, rel_path, expected=None, actual=None):
+        self._mark_processed(rel_path=rel_path, status='processed',
+                             expected=expected, actual=actual)
 
     def record_excluded(self, directory, file_name):
         """Count and Record the excluded files"""
@@ -916,11 +1747,383 @@ class Cataloger(object):
 
         self._mark_processed(full, 'excluded')
 
-    def record_missing(self, rel_path):
-        self._mark_processed(rel_path, 'missing')
+    def record_missing(self, rel_path, expected=None):
+        self._mark_processed(rel_path, 'missing', expected=expected)
+
+    def record_extra(self, rel_path, actual=None):
+        self._mark_processed(rel_path, 'extra', actual=actual)
+
+    def record_timeout(self, rel_path, expected=None):
+        self._mark_processed(rel_path, 'timeout', expected=expected)
+
+    def record_unverified(self, rel_path, expected=None):
+        self._mark_processed(rel_path, 'unverified', expected=expected)
+
+    def record_mismatch(self, rel_path, expected=None, actual=None):
+        self._mark_processed(rel_path, 'mismatch',
+                             expected=expected, actual=actual)
+
+    def iter_check(self, retain=False):
+        """Check the local tree against the catalog - yielding each result
+
+           :param retain: Boolean - whether extra and excluded files are
+                    retained for the file lists (extra_files etc). By default
+                    nothing is retained beyond the loaded catalog and the
+                    counts, so results can be streamed in constant memory.
+
+           Yields a Result for every file as it is recorded. Errors are
+           raised as exceptions - the process is never exited.
+        """
+        if self._action != 'check':
+            six.raise_from(ValueError(
+                'iter_check needs a Cataloger created with action=\'check\''), None)
+        return self._iter_results(retain)
+
+    def iter_create(self, retain=False):
+        """Create the catalog from the local tree - yielding each result
+
+           :param retain: Boolean - whether excluded files are retained for
+                    the file lists. Default - False
+
+           Yields a Result for every file as it is recorded, and writes the
+           catalog file once the tree has been processed. Errors are raised
+           as exceptions - the process is never exited.
+        """
+        if self._action != 'create':
+            six.raise_from(ValueError(
+                'iter_create needs a Cataloger created with action=\'create\''), None)
+        return self._iter_results(retain)
+
+    def _iter_results(self, retain):
+        """Run the tasks in order, yielding the results recorded by each"""
+        pending = self._begin_run(retain)
+        try:
+            deadline = time.monotonic() + self._run_timeout if self._run_timeout else None
+            tasks = self._tasks()
+            fail_fast = self._fail_fast and self._action == 'check'
+            if self._action == 'check' and (self._deadline or self._resume):
+                if self._deadline:
+                    self._deadline_at = time.monotonic() + self._deadline
+                    deadline = min(deadline, self._deadline_at) if deadline else self._deadline_at
+                tasks = self._prioritised(tasks)
+            self._stop_at = deadline
+            if fail_fast:
+                tasks = self._failures_first(tasks)
+            results = self._pool.imap(self._signature_work(tasks),
+                                      size=self._work_size,
+                                      position=self._work_position,
+                                      timeout=self._work_timeout if self._file_timeout else None,
+                                      deadline=deadline)
+            try:
+                for item, signature in results:
+                    if isinstance(item, Batch):
+                        signatures = [TIMED_OUT] * len(item.tasks) if signature is TIMED_OUT else signature
+                        for task, task_signature in zip(item.tasks, signatures):
+                            self._record_task(task, task_signature)
+                    else:
+                        self._record_task(item, signature)
+                    if fail_fast:
+                        self._first_failure = next((result for result in pending
+                                                    if self._is_failure(result.status)), None)
+                    while pending:
+                        yield pending.popleft()
+                    if self._first_failure is not None:
+                        return
+            finally:
+                # Cancels the hashing which hasn't started if the run stopped early
+                results.close()
+            self._finish_run()
+            while pending:
+                yield pending.popleft()
+        finally:
+            self._end_run()
+
+    def _is_failure(self, status):
+        """Whether a file with this status fails the check - see commands.has_failures"""
+        return status == 'timeout' or \
+            (status in ('mismatch', 'missing', 'extra') and bool(self.report_category(status)))
+
+    def _failures_first(self, tasks):
+        """The tasks for a fail fast check
+
+            The whole tree is walked first, so that the failures which don't
+            need any hashing - the extra files, and the missing files in the
+            directories walked - are recorded before any file is hashed. The
+            rest of the tasks follow in the same order.
+        """
+        tasks = list(tasks)
+        hashed = {task.path for task in tasks if task.kind == 'hash'}
+        extra = [task for task in tasks if task.kind == 'extra']
+        missing = [Task('missing', os.path.join(task.path, file_name))
+                   for task in tasks if task.kind == 'directory'
+                   for file_name in self.get_non_processed(task.path)
+                   if os.path.join(task.path, file_name) not in hashed]
+        return extra + missing + [task for task in tasks if task.kind != 'extra']
+
+    def _prioritised(self, tasks):
+        """The tasks for a check with a deadline
+
+            The whole tree is walked first. The files to be hashed come first
+            - in priority order (see _task_priority) - followed by the other
+            tasks in walk order, so each directory is only finished once all
+            of its files have been hashed (or left unverified). Files verified
+            by the check the resume token came from are skipped.
+        """
+        resumed = self._resumed_entries()
+        hashes, others = [], []
+        for task in tasks:
+            if task.kind != 'hash':
+                others.append(task)
+            elif os.path.split(task.path) in resumed:
+                directory, name = os.path.split(task.path)
+                self._catalog_data[directory][name]['processed'] = 'resumed'
+                self._resumed_count += 1
+            else:
+                hashes.append(task)
+        hashes.sort(key=self._task_priority)
+        return hashes + others
+
+    def _task_priority(self, task):
+        """The sort key for a file to be hashed - files with a priority
+           extension (code) first, then the most recently modified
+        """
+        try:
+            mtime = os.stat(self.abs_path(task.path)).st_mtime
+        except OSError:
+            mtime = 0
+        return os.path.splitext(task.path)[1] not in self._priority_extensions, -mtime
+
+    def _catalog_entries(self):
+        """(directory, file name, entry) for each catalog entry - in catalog order"""
+        for directory, files in self._catalog_data.items():
+            for file_name, entry in files.items():
+                if 'signature' in entry:
+                    yield directory, file_name, entry
+
+    def _resumed_entries(self):
+        """The (directory, file name) of the entries verified according to the resume token
+
+            Raises ResumeError if the token isn't valid for the catalog.
+        """
+        if not self._resume:
+            return set()
+        try:
+            verified = resume.decode_token(self._resume, self._catalog_data_count, self._catalog_checksum)
+        except ValueError as e:
+            six.raise_from(ResumeError(str(e)), None)
+        return {(directory, file_name) for index, (directory, file_name, _) in enumerate(self._catalog_entries())
+                if index in verified}
+
+    def _signature_work(self, tasks):
+        """The work for the WorkerPool - each Task or Batch, and how to get its signature"""
+        if self._io_policy == 'nocache':
+            tasks = self._prefetched(tasks)
+        # A file which hangs would take the rest of its Batch with it - so
+        # with a file_timeout every file is sent on its own. A fail fast
+        # check sends every file on its own too, so it stops at the first
+        # mismatch rather than the end of a Batch.
+        fail_fast = self._fail_fast and self._action == 'check'
+        if self._pool.jobs > 1 and self._batch_files > 1 and not self._file_timeout and not fail_fast:
+            tasks = self._batched(tasks)
+        for task in tasks:
+            if isinstance(task, Batch):
+                yield task, functools.partial(self._batch_signatures, task.tasks)
+            else:
+                yield task, (functools.partial(self.get_signature, rel_path=task.path)
+                             if task.kind == 'hash' else None)
+
+    def _batched(self, tasks):
+        """Group the small files into Batches - passing on the large files as Tasks
+
+            A Batch is closed when its files reach batch_bytes, when it holds
+            batch_files Tasks, or when a large file is found. The other Tasks
+            (extra, directory and excluded) join the open Batch, so that the
+            order is unchanged - they count towards batch_files, so a long run
+            of them can't grow a Batch without limit. A Batch always starts
+            with a small file : the other Tasks are passed on when no Batch is
+            open.
+        """
+        batch, size, files = [], 0, 0
+        for task in tasks:
+            if task.kind == 'hash':
+                task_size = self._task_size(task)
+                if task_size >= self._batch_threshold:
+                    if batch:
+                        yield self._close_batch(batch, size, files)
+                        batch, size, files = [], 0, 0
+                    yield task
+                    continue
+                size += task_size
+                files += 1
+            elif not batch:
+                yield task
+                continue
+            batch.append(task)
+            if size >= self._batch_bytes or len(batch) >= self._batch_files:
+                yield self._close_batch(batch, size, files)
+                batch, size, files = [], 0, 0
+        if batch:
+            yield self._close_batch(batch, size, files)
+
+    def _close_batch(self, tasks, size, files):
+        """A Batch of the tasks - or the single Task if there is nothing to batch"""
+        if files <= 1 and len(tasks) == 1:
+            return tasks[0]
+        self._batch_counts[0] += 1
+        self._batch_counts[1] += files
+        return Batch(tuple(tasks), size)
+
+    def _batch_signatures(self, tasks):
+        """The signatures of the tasks in a Batch - hashed in a tight loop
+
+            Returns a list with an entry for each task - None for the tasks
+            which aren't hashed.
+        """
+        get_signature = self.get_signature
+        signatures = [None] * len(tasks)
+        hashed = [index for index, task in enumerate(tasks) if task.kind == 'hash']
+        if self._pool.schedule in ('inode', 'physical'):
+            hashed.sort(key=lambda index: self._task_position(tasks[index]))
+        for index in hashed:
+            signatures[index] = get_signature(rel_path=tasks[index].path)
+        return signatures
+
+    def _work_timeout(self, item):
+        """The seconds the work for a Task may take - there are no Batches with a file_timeout"""
+        return self._file_timeout
+
+    def _work_position(self, item):
+        """The position on the disk of a Task or Batch - for the inode and physical schedules"""
+        if isinstance(item, Batch):
+            item = next(task for task in item.tasks if task.kind == 'hash')
+        return self._task_position(item)
+
+    def _task_position(self, task):
+        """The position on the disk of the file for a 'hash' task
+
+            The physical offset of its data (from FIEMAP) with the physical
+            schedule where it is available - otherwise its inode number. The
+            files with a physical offset are read first.
+        """
+        abs_path = self.abs_path(task.path)
+        if self._pool.schedule == 'physical':
+            offset = readers.physical_offset(abs_path)
+            if offset is not None:
+                return 0, offset
+        try:
+            return 1, os.stat(abs_path).st_ino
+        except OSError:
+            return 1, 0
+
+    def _work_size(self, item):
+        """The size of the work for a Task or Batch - for the largest schedule"""
+        return item.size if isinstance(item, Batch) else self._task_size(item)
 
-    def record_extra(self, rel_path):
-        self._mark_processed(rel_path, 'extra')
+    def _task_size(self, task):
+        """The size of the file for a 'hash' task - 0 if it can't be stat'd"""
+        try:
+            return os.stat(self.abs_path(task.path)).st_size
+        except OSError:
+            return 0
+
+    def _prefetched(self, tasks):
+        """Pass on the tasks - prefetching the files a few hash tasks ahead"""
+        ahead = deque()
+        for task in tasks:
+            ahead.append(task)
+            if task.kind == 'hash':
+                readers.prefetch(self.abs_path(task.path))
+            if len(ahead) > defaults.DEFAULT_PREFETCH_FILES:
+                yield ahead.popleft()
+        while ahead:
+            yield ahead.popleft()
+
+    def _begin_run(self, retain):
+        """Start a check or create run - returning the queue of pending Results"""
+        self._prepare_run()
+        self._pending = deque()
+        self._batch_counts = [0, 0]
+        self._resumed_count = 0
+        self._deadline_at = None
+        self._stop_at = None
+        self._first_failure = None
+        self._link_cache = SignatureCache() if self._dedup_links else None
+        self._saved_retain, self._retain_results = self._retain_results, retain
+        if self._progress is not None:
+            self._start_progress()
+        return self._pending
+
+    def _finish_run(self):
+        """Complete a run which has recorded every task"""
+        if self._action == 'create':
+            self.write_catalog()
+
+    def _end_run(self):
+        """Tidy up after a run - whether or not it completed"""
+        if self._stats is not None:
+            self._stats.settings.update(self._pool.settings())
+            if self._buffer_pool is not None:
+                self._stats.settings.update(self._buffer_pool.summary())
+            if self._batch_counts[0]:
+                self._stats.settings['batches'] = self._batch_counts[0]
+                self._stats.settings['batched_files'] = self._batch_counts[1]
+        if self._progress is not None:
+            self._progress.finish()
+        if self._own_pool:
+            # Don't wait for the files still being hashed when a fail fast check stopped
+            self._pool.shutdown(wait=self._first_failure is None)
+        self._pending = None
+        self._link_cache = None
+        self._retain_results = self._saved_retain
+
+    def _record_task(self, task, signature=None):
+        """Record the outcome of a single Task
+
+            :param task: A Task from _tasks
+            :param signature: The signature of the local file for a 'hash'
+                    task - None if it couldn't be generated, or TIMED_OUT if
+                    it wasn't generated in time
+        """
+        if task.kind == 'hash' and signature is TIMED_OUT:
+            expected = self.get_signature(rel_path=task.path, from_catalog=True)
+            if self._deadline_at is not None and time.monotonic() >= self._deadline_at:
+                self.record_unverified(rel_path=task.path, expected=expected)
+            else:
+                self.record_timeout(rel_path=task.path, expected=expected)
+
+        elif task.kind == 'hash':
+            if self._action == 'create':
+                if signature:
+                    self.add_to_catalog(rel_path=task.path, signature=signature)
+                return
+
+            catalog_signature = self.get_signature(rel_path=task.path, from_catalog=True)
 
-    def record_mismatch(self, rel_path):
-        self._mark_processed(rel_path, 'mismatch')
\ No newline at end of file
+            # If the signatures don't match - mark this as a mismatch
+            if catalog_signature != signature:
+                self.record_mismatch(rel_path=task.path,
+                                     expected=catalog_signature, actual=signature)
+            else:
+                self.record_ok(rel_path=task.path,
+                               expected=catalog_signature, actual=signature)
+
+        elif task.kind == 'extra':
+            # There is no signature for this file in the catalog
+            self.record_extra(rel_path=task.path)
+
+        elif task.kind == 'missing':
+            self.record_missing(task.path,
+                                expected=self.get_signature(rel_path=task.path, from_catalog=True))
+
+        elif task.kind == 'directory':
+            # Have processed all the files in the directory
+            # so all non-processed files in this directory must be missing locally
+            if self.is_directory_in_catalog(directory=task.path):
+                for file in list(self.get_non_processed(task.path)):
+                    rel_path = os.path.join(task.path, file)
+                    self.record_missing(rel_path,
+                                        expected=self.get_signature(rel_path=rel_path,
+                                                                    from_catalog=True))
+
+        elif task.kind == 'excluded':
+            self.record_excluded(*os.path.split(task.path))
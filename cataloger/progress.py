@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of progress.py
+
+Summary :
+    Live progress of a create or check - files and bytes done, MB/s and ETA
+Use Case :
+    As an operator running a long create or check I want to see progress
+    So that I know the run is alive and when it will finish
+
+Testable Statements :
+    Can I report files and bytes done, throughput and ETA to stderr
+    Is the display throttled so that the hashing loop is not slowed
+    Can I dump the live statistics on SIGUSR1
+    Is a file counted without taking a lock
+"""
+import signal
+import sys
+import threading
+import time
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+def can_dump():
+    """Whether a SIGUSR1 handler can be installed - the platform has SIGUSR1,
+       and this is the main thread"""
+    return hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread()
+
+
+class ProgressReporter(object):
+    """Track and report the progress of a run
+
+        :param stream: Where the progress line is written - default stderr
+        :param display: Whether to display the progress line as the run
+                progresses. If False the progress is only tracked - and
+                can be dumped with SIGUSR1.
+        :param interval: The minimum time in seconds between displays
+
+        The totals are either given by a pre-count (see
+        ``Cataloger.count_files``) or estimated : when only the number of
+        files is known (e.g. from the catalog) the total bytes is estimated
+        from the average size of the files done so far, and both totals are
+        raised if the run goes beyond them.
+    """
+
+    def __init__(self, stream=None, display=True, interval=defaults.DEFAULT_PROGRESS_INTERVAL):
+        self._stream = stream if stream is not None else sys.stderr
+        self._display = display
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._previous_handler = None
+
+        self.total_files = None
+        self.total_bytes = None
+        self._local = threading.local()
+        self._counters = []     # [files, bytes] done by each thread - see _count
+
+        self._start = self._last = time.monotonic()
+        self._last_bytes = 0
+        self._rate = 0.0
+        self._next_display = self._start + self._interval
+
+    @property
+    def files_done(self):
+        """The number of files done - by all of the threads"""
+        return sum(counter[0] for counter in list(self._counters))
+
+    @property
+    def bytes_done(self):
+        """The number of bytes done - by all of the threads"""
+        return sum(counter[1] for counter in list(self._counters))
+
+    @property
+    def display(self):
+        """Whether the progress line is displayed as the run progresses"""
+        return self._display
+
+    def start(self, total_files=None, total_bytes=None):
+        """Start (or restart) tracking against the given totals"""
+        self.total_files, self.total_bytes = total_files, total_bytes
+        self._local, self._counters = threading.local(), []
+        self._start = self._last = time.monotonic()
+        self._last_bytes = 0
+        self._next_display = self._start + self._interval
+        self.install_signal_handler()
+
+    def update(self, bytes_read):
+        """Record a single file done - throttled so this is cheap per file"""
+        self._count(bytes_read)
+        if not self._display:
+            return
+        now = time.monotonic()
+        if now < self._next_display:
+            return
+        with self._lock:
+            if now < self._next_display:
+                return      # Another thread has just displayed the progress
+            self._next_display = now + self._interval
+            self._update_rate(now)
+        self._write(self.status_line(), final=False)
+
+    def _count(self, bytes_read):
+        """Count a file in this thread's own counter - so no lock is needed"""
+        counter = getattr(self._local, 'counter', None)
+        if counter is None:
+            counter = self._local.counter = [0, 0]
+            with self._lock:
+                self._counters.append(counter)
+        counter[0] += 1
+        counter[1] += bytes_read
+
+    def _update_rate(self, now):
+        """The current rate is measured since the last display"""
+        if now > self._last:
+            self._rate = (self.bytes_done - self._last_bytes) / (now - self._last)
+        self._last, self._last_bytes = now, self.bytes_done
+
+    def _estimated_totals(self):
+        total_files = max(self.total_files or 0, self.files_done)
+        if self.total_bytes is not None:
+            total_bytes = max(self.total_bytes, self.bytes_done)
+        elif self.total_files and self.files_done:
+            total_bytes = self.bytes_done * total_files // self.files_done
+        else:
+            total_bytes = None
+        return total_files, total_bytes
+
+    def eta(self):
+        """The estimated time to completion in seconds - None if unknown"""
+        total_files, total_bytes = self._estimated_totals()
+        elapsed = time.monotonic() - self._start
+        if total_bytes is not None and self.bytes_done:
+            return (total_bytes - self.bytes_done) * elapsed / self.bytes_done
+        if self.total_files and self.files_done:
+            return (total_files - self.files_done) * elapsed / self.files_done
+        return None
+
+    def status_line(self):
+        """The live statistics as a single line"""
+        total_files, total_bytes = self._estimated_totals()
+        eta = self.eta()
+        return '{done}/{total} files  {mb_done:.1f}/{mb_total} MB  {rate:.1f} MB/s  ETA {eta}'.format(
+            done=self.files_done,
+            total=total_files if self.total_files is not None else '?',
+            mb_done=self.bytes_done / 1e6,
+            mb_total='{:.1f}'.format(total_bytes / 1e6) if total_bytes is not None else '?',
+            rate=self._rate / 1e6,
+            eta=_format_duration(eta) if eta is not None else '?')
+
+    def _write(self, line, final):
+        try:
+            tty = self._stream.isatty()
+        except (AttributeError, ValueError):
+            tty = False
+        if tty:
+            self._stream.write('\r' + line + '\x1b[K' + ('\n' if final else ''))
+        else:
+            self._stream.write(line + '\n')
+        self._stream.flush()
+
+    def _on_signal(self, signum, frame):
+        # Runs in the main thread between bytecodes - so don't take the lock
+        self._update_rate(time.monotonic())
+        self._stream.write(self.status_line() + '\n')
+        self._stream.flush()
+
+    def install_signal_handler(self):
+        """Dump the live statistics to the stream on SIGUSR1 (if supported)"""
+        if self._previous_handler is not None or not can_dump():
+            return
+        self._previous_handler = signal.signal(signal.SIGUSR1, self._on_signal)
+
+    def finish(self):
+        """Display the final statistics and restore the SIGUSR1 handler"""
+        if self._display:
+            # The final rate is the average over the whole run
+            now = time.monotonic()
+            self._rate = self.bytes_done / (now - self._start) if now > self._start else 0.0
+            self._write(self.status_line(), final=True)
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGUSR1, self._previous_handler)
+            self._previous_handler = None
@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of readers.py
+
+Summary :
+    How file content is read for hashing - the I/O policies
+Use Case :
+    As an operator of a production host I want a check to leave the page
+    cache alone So that the application isn't slowed down by a check
+
+Testable Statements :
+    Can I read a file in chunks without updating its access time
+    Are the pages read for hashing dropped from the page cache afterwards
+    Can I ask the kernel to prefetch the next files to be hashed
+    Does each policy give the same signature
+    Is the memory used by the buffers of all of the workers held to a limit
+    Can I find where a file's data starts on the disk
+    Are the holes in a sparse file hashed without being read
+    Can I fingerprint a file from its size and a few of its blocks
+"""
+import errno
+import os
+import struct
+import threading
+import time
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+# posix_fadvise and O_NOATIME are not available on every platform - where they
+# are missing the policies still work, but without the hints.
+_fadvise = getattr(os, 'posix_fadvise', None)
+_O_NOATIME = getattr(os, 'O_NOATIME', 0)
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+_SEEK_DATA = getattr(os, 'SEEK_DATA', None)
+_SEEK_HOLE = getattr(os, 'SEEK_HOLE', None)
+
+# The Linux FIEMAP ioctl - used to find where a file's data is on the disk
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+_FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct('=QQLLLL')     # start, length, flags, mapped, count, reserved
+_FIEMAP_EXTENT = struct.Struct('=QQQQQLLLL')  # logical, physical, length, reserved x 2, flags, reserved x 3
+
+
+def advise(fd, advice_name, offset=0, length=0):
+    """Give the kernel an access hint for the open file - if it can be given
+
+       :param advice_name: The name of the os.POSIX_FADV_* constant - e.g. 'SEQUENTIAL'
+    """
+    advice = getattr(os, 'POSIX_FADV_' + advice_name, None)
+    if _fadvise is None or advice is None:
+        return
+    try:
+        _fadvise(fd, offset, length, advice)
+    except OSError:
+        pass    # A hint which can't be given is ignored
+
+
+def open_fd(path, noatime=False):
+    """Open the file for reading - returning the file descriptor
+
+       :param noatime: Whether to open the file without updating its access
+                time. O_NOATIME is only permitted for the owner of the file
+                (or a privileged user) - otherwise the file is opened normally.
+    """
+    flags = os.O_RDONLY | _O_BINARY
+    if noatime and _O_NOATIME:
+        try:
+            return os.open(path, flags | _O_NOATIME)
+        except PermissionError:
+            pass
+    return os.open(path, flags)
+
+
+def physical_offset(path):
+    """The physical offset on the disk of the start of the file's data
+
+       Uses the Linux FIEMAP ioctl - None if it isn't available (on another
+       platform, or a file system without it) or the file has no data.
+    """
+    if fcntl is None:
+        return None
+    request = bytearray(_FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_FIEMAP_EXTENT.size))
+    try:
+        fd = open_fd(path, noatime=True)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, _FS_IOC_FIEMAP, request)
+    except (OSError, ValueError):
+        return None
+    finally:
+        os.close(fd)
+    if not _FIEMAP_HEADER.unpack_from(request)[3]:
+        return None
+    return _FIEMAP_EXTENT.unpack_from(request, _FIEMAP_HEADER.size)[1]
+
+
+def prefetch(path):
+    """Ask the kernel to start reading the file into the page cache
+
+       Used for the next few files in the queue, so that the reads overlap
+       the hashing. Errors are ignored - the file will be reported when it is
+       hashed.
+    """
+    if _fadvise is None:
+        return
+    try:
+        fd = open_fd(path, noatime=True)
+    except OSError:
+        return
+    try:
+        advise(fd, 'WILLNEED')
+    finally:
+        os.close(fd)
+
+
+class BufferPool(object):
+    """A shared pool of reusable read buffers - a limit on the bytes in flight
+
+        :param max_bytes: The most bytes held in buffers at once, across
+                every worker using the pool
+        :param chunk_size: The size of each buffer - reduced to max_bytes if
+                it is larger
+
+        A worker acquires a buffer before each read and releases it once the
+        chunk has been hashed, waiting if every buffer is in use - so the
+        memory used for reading is never more than max_bytes. Each worker
+        holds at most one buffer at a time, so the workers can't deadlock.
+    """
+
+    def __init__(self, max_bytes, chunk_size=defaults.DEFAULT_CHUNK_SIZE):
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+        self._chunk_size = min(chunk_size, max_bytes)
+        self._count = max(1, max_bytes // self._chunk_size)
+        self._max_bytes = max_bytes
+        self._condition = threading.Condition()
+        self._free = []
+        self._created = 0
+        self._in_use = 0
+        self.peak_bytes = 0
+        self.waits = 0
+        self.waited = 0.0
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def acquire(self):
+        """A free buffer - waiting until one is released if they are all in use"""
+        with self._condition:
+            if not self._free and self._created >= self._count:
+                self.waits += 1
+                started = time.monotonic()
+                while not self._free:
+                    self._condition.wait()
+                self.waited += time.monotonic() - started
+            if self._free:
+                buffer = self._free.pop()
+            else:
+                buffer = bytearray(self._chunk_size)
+                self._created += 1
+            self._in_use += 1
+            self.peak_bytes = max(self.peak_bytes, self._in_use * self._chunk_size)
+            return buffer
+
+    def release(self, buffer):
+        """Return a buffer to the pool"""
+        with self._condition:
+            self._in_use -= 1
+            self._free.append(buffer)
+            self._condition.notify()
+
+    def summary(self):
+        """The limit, and the use made of it - as a dictionary"""
+        return {'max_inflight_bytes': self._max_bytes,
+                'peak_inflight_bytes': self.peak_bytes,
+                'buffer_waits': self.waits,
+                'buffer_wait_seconds': round(self.waited, 6)}
+
+
+def read_chunks(fd, chunk_size=defaults.DEFAULT_CHUNK_SIZE, buffers=None, length=None):
+    """Read the open file in chunks - yielding a memoryview of each chunk
+
+       The same buffer is reused for every chunk, so each chunk must be
+       consumed before the next is read. With a BufferPool each chunk is
+       read into a buffer from the pool, which is released once the chunk
+       has been consumed (and chunk_size is the pool's).
+
+       :param length: The most bytes to read from the current position -
+                None to read to the end of the file
+    """
+    remaining = length
+    with os.fdopen(fd, 'rb', buffering=0, closefd=False) as f:
+        if buffers is not None:
+            while remaining is None or remaining > 0:
+                buffer = buffers.acquire()
+                try:
+                    view = memoryview(buffer)
+                    count = f.readinto(view if remaining is None else view[:remaining])
+                    if not count:
+                        return
+                    if remaining is not None:
+                        remaining -= count
+                    yield view[:count]
+                finally:
+                    buffers.release(buffer)
+            return
+
+        view = memoryview(bytearray(chunk_size))
+        while remaining is None or remaining > 0:
+            count = f.readinto(view if remaining is None else view[:remaining])
+            if not count:
+                return
+            if remaining is not None:
+                remaining -= count
+            yield view[:count]
+
+
+def _zeros():
+    """The shared, read only buffer of zeros fed to the hash for holes"""
+    global _zero_buffer
+    if _zero_buffer is None:
+        _zero_buffer = memoryview(bytes(defaults.DEFAULT_CHUNK_SIZE))
+    return _zero_buffer
+
+_zero_buffer = None
+
+
+def is_sparse(fd):
+    """True if the open file has fewer blocks allocated than its size needs"""
+    stat = os.fstat(fd)
+    blocks = getattr(stat, 'st_blocks', None)
+    return _SEEK_DATA is not None and blocks is not None and blocks * 512 < stat.st_size
+
+
+def regions(fd):
+    """The data and holes of the open file - yielding (offset, length, is_data)
+
+       Found with lseek SEEK_DATA and SEEK_HOLE. Where these aren't supported
+       the whole file is a single data region. The regions cover the file
+       from 0 to its size when this is called.
+    """
+    size = os.fstat(fd).st_size
+    offset = 0
+    while offset < size:
+        try:
+            data = min(os.lseek(fd, offset, _SEEK_DATA), size)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                yield offset, size - offset, True
+                return
+            data = size     # There is no more data - the rest is a hole
+        if data > offset:
+            yield offset, data - offset, False
+        if data >= size:
+            return
+        try:
+            hole = min(os.lseek(fd, data, _SEEK_HOLE), size)
+        except OSError:
+            hole = size
+        yield data, hole - data, True
+        offset = hole
+
+
+def _sparse_chunks(fd, chunk_size, buffers, limiter):
+    """The chunks of a sparse file - only the data regions are read from the disk
+
+       Yields (chunk, is_data) - is_data is False for the zeros of a hole.
+    """
+    zeros = _zeros()
+    for offset, length, is_data in regions(fd):
+        if not is_data:
+            while length > 0:
+                count = min(length, len(zeros))
+                yield zeros[:count], False
+                length -= count
+            continue
+        os.lseek(fd, offset, os.SEEK_SET)
+        read = 0
+        for chunk in read_chunks(fd, chunk_size, buffers=buffers, length=length):
+            read += len(chunk)
+            if limiter is not None:
+                limiter.consume(len(chunk))
+            yield chunk, True
+        if read < length:
+            return      # The file was truncated while it was read
+
+
+def fingerprint_blocks(size, samples=defaults.DEFAULT_PARTIAL_SAMPLES,
+                       block_size=defaults.DEFAULT_PARTIAL_BLOCK_SIZE):
+    """The (offset, length) of the blocks read for a partial fingerprint
+
+       The head and tail blocks, and samples blocks evenly spaced between
+       them. A file too small for the blocks to be apart is read in full.
+    """
+    if size <= (samples + 4) * block_size:
+        return [(0, size)] if size else []
+    span = size - 3 * block_size
+    middle = [(block_size + span * index // (samples + 1), block_size) for index in range(1, samples + 1)]
+    return [(0, block_size)] + middle + [(size - block_size, block_size)]
+
+
+def hash_fingerprint(path, update, samples=defaults.DEFAULT_PARTIAL_SAMPLES,
+                     block_size=defaults.DEFAULT_PARTIAL_BLOCK_SIZE, policy=defaults.DEFAULT_IO_POLICY,
+                     limiter=None, buffers=None):
+    """Feed a partial fingerprint of the file to update - returning the bytes read
+
+       The fingerprint is the size of the file, followed by the blocks from
+       fingerprint_blocks - so a change to the size, or to any of those
+       blocks, changes the signature. The other parameters are as for
+       hash_file.
+    """
+    if limiter is not None:
+        limiter.start_file()
+    nocache = policy == 'nocache'
+    fd = open_fd(path, noatime=nocache)
+    try:
+        size = os.fstat(fd).st_size
+        update('{}\n'.format(size).encode('ascii'))
+        total = 0
+        for offset, length in fingerprint_blocks(size, samples, block_size):
+            os.lseek(fd, offset, os.SEEK_SET)
+            for chunk in read_chunks(fd, min(length, defaults.DEFAULT_CHUNK_SIZE), buffers=buffers,
+                                     length=length):
+                update(chunk)
+                total += len(chunk)
+                if limiter is not None:
+                    limiter.consume(len(chunk))
+        if nocache:
+            advise(fd, 'DONTNEED')
+        return total
+    finally:
+        os.close(fd)
+
+
+def hash_file(path, update, policy=defaults.DEFAULT_IO_POLICY,
+              chunk_size=defaults.DEFAULT_CHUNK_SIZE, limiter=None, buffers=None, sparse=False):
+    """Feed the content of the file to update - returning the bytes read from it
+
+       :param update: Called with each chunk of the file - e.g. hash.update
+       :param policy: One of defaults.ALL_IO_POLICIES :
+                normal - the file is read in chunks with no hints
+                nocache - the file is opened with O_NOATIME (where
+                permitted), read with a sequential access hint, and its pages
+                are dropped from the page cache once it has been hashed
+       :param limiter: A throttle.ReadLimiter - which is told of the file
+                before it is opened, and of each chunk as it is read
+       :param buffers: A BufferPool to read the chunks into - limiting the
+                bytes in flight across all of the workers
+       :param sparse: Whether the holes in a sparse file are skipped - only
+                its data regions are read, and the hash is fed zeros for the
+                holes, so the signature is the same as a full read. The zeros
+                fed for the holes aren't counted in the bytes read.
+    """
+    if limiter is not None:
+        limiter.start_file()
+    nocache = policy == 'nocache'
+    fd = open_fd(path, noatime=nocache)
+    try:
+        if nocache:
+            advise(fd, 'SEQUENTIAL')
+        total = 0
+        if sparse and is_sparse(fd):
+            for chunk, is_data in _sparse_chunks(fd, chunk_size, buffers, limiter):
+                update(chunk)
+                if is_data:
+                    total += len(chunk)
+        else:
+            for chunk in read_chunks(fd, chunk_size, buffers=buffers):
+                update(chunk)
+                total += len(chunk)
+                if limiter is not None:
+                    limiter.consume(len(chunk))
+        if nocache:
+            advise(fd, 'DONTNEED')
+        return total
+    finally:
+        os.close(fd)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of reports.py
+
+Summary :
+    Machine readable reporting of the results of a create or check command
+Use Case :
+    As a monitoring pipeline I want each result as it is recorded
+    So that I don't have to scrape the human readable report
+
+Testable Statements :
+    Can I stream one JSON object per file result
+    Can I finish the stream with a single summary object
+    Can I format the directory table rows without the template filters
+    Can I report the results of a check-many with a per root breakdown
+"""
+import sys
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+# The columns of the directory tables in the final reports
+# Each column is a 2-tuple : [0] = key in the directory summary, [1] = format spec
+CHECK_COLUMNS = (('path', '<40s'), ('processed', '^9d'), ('missing', '^9d'),
+                 ('mismatch', '^10d'), ('extra', '^7d'), ('excluded', '^8d'))
+CREATE_COLUMNS = (('path', '<40s'), ('added', '^7d'), ('excluded', '^8d'))
+
+
+class RowFormatter(object):
+    """A precompiled formatter for a row of a directory table
+
+        Equivalent to applying the ``format`` modifier to every cell : each
+        value is formatted with its spec, and an empty (or zero) value is
+        rendered as blank space of the same width. The blank cells are
+        computed once when the formatter is created.
+    """
+
+    def __init__(self, columns):
+        self._columns = tuple((key, spec, format(' ', self._blank_spec(spec)))
+                              for key, spec in columns)
+
+    @staticmethod
+    def _blank_spec(spec):
+        """The string format spec used to render a blank cell"""
+        if spec[-1] == 'd':
+            return spec[:-1] + 's'
+        return spec
+
+    def __call__(self, row):
+        return '| ' + ' | '.join(format(row[key], spec) if row[key] else blank
+                                  for key, spec, blank in self._columns) + ' |'
+
+
+_row_formatters = {}
+
+
+def _row_formatter(columns):
+    formatter = _row_formatters.get(columns)
+    if formatter is None:
+        formatter = _row_formatters.setdefault(columns, RowFormatter(columns))
+    return formatter
+
+
+def directory_rows(env, columns):
+    """Generate (directory summary, formatted table row) for each directory"""
+    formatter = _row_formatter(columns)
+    for directory in env.catalog_summary_by_directory:
+        yield directory, formatter(directory)
+
+
+def root_summary(check):
+    """The status counts for a single root of a check-many - as a table row"""
+    summary = {'path': check.root}
+    summary.update((status, check.cataloger.status_count(status) if check.cataloger else 0)
+                   for status in defaults.ALL_STATUSES)
+    return summary
+
+
+def root_rows(checks, columns):
+    """Generate (root summary, formatted table row) for each root of a check-many"""
+    formatter = _row_formatter(columns)
+    for check in checks:
+        summary = root_summary(check)
+        yield summary, formatter(summary)
+
+
+class NDJSONWriter(object):
+    """Write results as newline delimited JSON
+
+        One JSON object is written for each file result, followed by a final
+        summary object. Lines are buffered and written in chunks of at least
+        ``chunk_size`` characters so that large trees don't pay for a write
+        (and flush) per file.
+    """
+
+    def __init__(self, output=None, chunk_size=defaults.DEFAULT_NDJSON_CHUNK_SIZE):
+        self._output = output if output is not None else sys.stdout
+        self._chunk_size = chunk_size
+        self._buffer = []
+        self._buffered = 0
+        import json     # Only needed for machine readable output
+        self._encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def _write_line(self, obj):
+        line = self._encode(obj) + '\n'
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self._chunk_size:
+            self.flush()
+
+    def write_result(self, result, root=None):
+        """Write a single file result - suitable for use as ``on_result``
+
+            :param root: The root the result is from - only given by check-many
+        """
+        record = {'type': 'file'}
+        if root is not None:
+            record['root'] = root
+        record.update(result)
+        self._write_line(record)
+
+    def write_summary(self, env, root=None):
+        """Write the final summary object for a completed command
+
+            :param root: The root the summary is for - only given by check-many
+        """
+        summary = {'type': 'summary'}
+        if root is not None:
+            summary['root'] = root
+        summary.update({'processed_count': env.processed_count,
+                        'status_counts': {status: env.status_count(status)
+                                          for status in defaults.ALL_STATUSES},
+                        'extensions': dict(env.extension_counts),
+                        'directories': list(env.catalog_summary_by_directory)})
+        if env.stats is not None:
+            env.stats.stop()
+            summary['stats'] = env.stats.as_dict()
+        if env.read_limiter is not None:
+            summary['read_rate'] = env.read_limiter.summary()
+        if env.first_failure is not None:
+            summary['stopped_at'] = env.first_failure.path
+        if env.deadline:
+            summary['coverage'] = env.coverage
+            summary['resume_token'] = env.resume_token
+            summary['below_min_coverage'] = env.below_min_coverage
+        self._write_line(summary)
+
+    def write_error(self, root, catalog, error):
+        """Write an error object for a root of a check-many which couldn't be checked"""
+        self._write_line({'type': 'error', 'root': root, 'catalog': catalog, 'error': str(error)})
+
+    def write_batch_summary(self, checks):
+        """Write the combined summary object for a completed check-many"""
+        self._write_line({'type': 'batch_summary',
+                          'roots': len(checks),
+                          'errors': sum(1 for check in checks if check.error is not None),
+                          'status_counts': {status: sum(check.cataloger.status_count(status)
+                                                        for check in checks if check.cataloger)
+                                            for status in defaults.ALL_STATUSES}})
+
+    def flush(self):
+        """Write any buffered lines to the output"""
+        if self._buffer:
+            self._output.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+        try:
+            self._output.flush()
+        except AttributeError:
+            pass
+
+    def close(self):
+        """Write any remaining lines - the output itself is left open"""
+        self.flush()
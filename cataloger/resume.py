@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of resume.py
+
+Summary :
+    Resume tokens - the catalog entries already verified by a check with a deadline
+Use Case :
+    As a deploy gate with a time budget I want a check to carry on where the
+    last one stopped So that the whole catalog is verified over a few runs
+
+Testable Statements :
+    Can I encode the verified entries of a catalog as a short token
+    Can I decode a token back into the verified entries
+    Is a token for a different catalog rejected
+    Is a damaged token rejected
+"""
+import base64
+import binascii
+import struct
+import zlib
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+TOKEN_VERSION = 1
+
+# version, number of catalog entries, checksum of the catalog entries
+_HEADER = struct.Struct('>BII')
+
+
+def encode_token(count, checksum, verified):
+    """The resume token for a catalog - a URL safe string
+
+       :param count: The number of entries in the catalog
+       :param checksum: The checksum of the catalog's entries
+       :param verified: The indexes (in catalog order) of the entries verified
+
+       The token is a compressed bitmap of the entries - so it stays small
+       however the verified entries are spread through the catalog.
+    """
+    bitmap = bytearray((count + 7) // 8)
+    for index in verified:
+        bitmap[index // 8] |= 1 << (index % 8)
+    payload = _HEADER.pack(TOKEN_VERSION, count, checksum & 0xFFFFFFFF) + bytes(bitmap)
+    return base64.urlsafe_b64encode(zlib.compress(payload, 9)).decode('ascii').rstrip('=')
+
+
+def decode_token(token, count, checksum):
+    """The set of verified entry indexes from a token - raises ValueError if the
+       token is damaged, or is for a catalog with a different count or checksum
+    """
+    try:
+        payload = zlib.decompress(base64.urlsafe_b64decode(token.strip() + '=' * (-len(token.strip()) % 4)))
+        version, token_count, token_checksum = _HEADER.unpack_from(payload)
+    except (binascii.Error, zlib.error, struct.error, ValueError):
+        raise ValueError('Invalid resume token')
+    bitmap = payload[_HEADER.size:]
+    if version != TOKEN_VERSION or len(bitmap) != (token_count + 7) // 8:
+        raise ValueError('Invalid resume token')
+    if (token_count, token_checksum) != (count, checksum & 0xFFFFFFFF):
+        raise ValueError('The resume token is for a different catalog')
+    return {index for index in range(count) if bitmap[index // 8] & (1 << (index % 8))}
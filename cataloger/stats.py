@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of stats.py
+
+Summary :
+    Per phase timing and throughput instrumentation of a create or check
+Use Case :
+    As an operator I want to know where the time of a slow check is spent
+    So that I can tell loading, walking, hashing and rendering apart
+
+Testable Statements :
+    Can I record the wall and CPU time of each phase
+    Can I record the bytes read and files hashed
+    Can I record the bytes which didn't need to be read - hard links and holes
+    Can I report the statistics as a table or as a dictionary
+    Can I combine the statistics of several runs - e.g. a check-many
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+class RunStats(object):
+    """The statistics for a single create or check run
+
+        Each phase records the number of calls, and the accumulated wall and
+        CPU time. Nested phases are accumulated independently - so for
+        instance the ``walk`` phase includes the time in
+        ``_is_file_to_be_processed``. When hashing runs in parallel the phase
+        times are summed across the workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = OrderedDict()
+        self._start = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._end = None
+        self._end_cpu = None
+        self.bytes_read = 0
+        self.files_hashed = 0
+        self.bytes_deduplicated = 0     # Files not read - their inode was already hashed
+        self.files_deduplicated = 0
+        self.bytes_in_holes = 0         # Hashed as zeros - the holes of sparse files aren't read
+        self.settings = OrderedDict()   # The settings chosen for the run - e.g. jobs
+
+    def reset(self):
+        """Discard all the statistics - ready for another run"""
+        with self._lock:
+            self._phases = OrderedDict()
+            self._start = time.perf_counter()
+            self._start_cpu = time.process_time()
+            self._end = self._end_cpu = None
+            self.bytes_read = 0
+            self.files_hashed = 0
+            self.bytes_deduplicated = 0
+            self.files_deduplicated = 0
+            self.bytes_in_holes = 0
+            self.settings = OrderedDict()
+
+    @classmethod
+    def merge(cls, runs):
+        """The statistics of several runs combined into one
+
+            The phases and counts are summed, and the run spans from the
+            first start to the last stop - so the runs of a check-many (which
+            run one after another) are reported as a single run. The settings
+            are those of the last run where they differ.
+        """
+        merged = cls()
+        runs = list(runs)
+        if not runs:
+            return merged
+        for run in runs:
+            with run._lock:
+                for name, (calls, wall, cpu) in run._phases.items():
+                    data = merged._phases.setdefault(name, [0, 0.0, 0.0])
+                    data[0] += calls
+                    data[1] += wall
+                    data[2] += cpu
+                merged.bytes_read += run.bytes_read
+                merged.files_hashed += run.files_hashed
+                merged.bytes_deduplicated += run.bytes_deduplicated
+                merged.files_deduplicated += run.files_deduplicated
+                merged.bytes_in_holes += run.bytes_in_holes
+                merged.settings.update(run.settings)
+        merged._start = min(run._start for run in runs)
+        merged._start_cpu = min(run._start_cpu for run in runs)
+        if all(run._end is not None for run in runs):
+            merged._end = max(run._end for run in runs)
+            merged._end_cpu = max(run._end_cpu for run in runs)
+        return merged
+
+    def add(self, phase, wall, cpu):
+        """Accumulate a single call of a phase"""
+        with self._lock:
+            data = self._phases.setdefault(phase, [0, 0.0, 0.0])
+            data[0] += 1
+            data[1] += wall
+            data[2] += cpu
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager to time a block of code as the named phase"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def timed(self, name, func):
+        """Wrap a callable so that every call is timed as the named phase"""
+        @wraps(func)
+        def _wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return _wrapper
+
+    def timed_iter(self, name, iterable):
+        """Time each step of an iterator - excluding the consumer's time"""
+        iterator = iter(iterable)
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+                return
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+            yield item
+
+    def count_hashed(self, bytes_read, holes=0):
+        """Record a single hashed file - and the bytes of its holes, which weren't read"""
+        with self._lock:
+            self.files_hashed += 1
+            self.bytes_read += bytes_read
+            self.bytes_in_holes += holes
+
+    def count_deduplicated(self, size):
+        """Record a single file whose signature was reused - rather than hashed"""
+        with self._lock:
+            self.files_deduplicated += 1
+            self.bytes_deduplicated += size
+
+    def stop(self):
+        """Mark the end of the run - further phases are still recorded"""
+        self._end, self._end_cpu = time.perf_counter(), time.process_time()
+
+    @property
+    def elapsed(self):
+        """The total wall time of the run so far"""
+        return (self._end if self._end is not None else time.perf_counter()) - self._start
+
+    @property
+    def cpu(self):
+        """The total CPU time of the run so far"""
+        return (self._end_cpu if self._end_cpu is not None else time.process_time()) - self._start_cpu
+
+    def phase_time(self, name):
+        """The wall time accumulated for the named phase"""
+        return self._phases.get(name, [0, 0.0, 0.0])[1]
+
+    @property
+    def hash_rate(self):
+        """The hashing throughput in MB/s - based on the get_signature time"""
+        hashing = self.phase_time('get_signature')
+        return self.bytes_read / hashing / 1e6 if hashing else 0.0
+
+    @property
+    def file_rate(self):
+        """The number of files hashed per second of the run"""
+        return self.files_hashed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        """The statistics as a JSON serialisable dictionary"""
+        return {'elapsed': self.elapsed,
+                'cpu': self.cpu,
+                'phases': OrderedDict((name, {'calls': calls, 'wall': wall, 'cpu': cpu})
+                                      for name, (calls, wall, cpu) in self._phases.items()),
+                'bytes_read': self.bytes_read,
+                'files_hashed': self.files_hashed,
+                'bytes_deduplicated': self.bytes_deduplicated,
+                'files_deduplicated': self.files_deduplicated,
+                'bytes_in_holes': self.bytes_in_holes,
+                'mb_per_second': self.hash_rate,
+                'files_per_second': self.file_rate,
+                'settings': dict(self.settings)}
+
+    def summary_table(self):
+        """The statistics as a human readable table"""
+        lines = ['{:<28} {:>10} {:>12} {:>12}'.format('Phase', 'Calls', 'Wall (s)', 'CPU (s)')]
+        for name, (calls, wall, cpu) in self._phases.items():
+            lines.append('{:<28} {:>10d} {:>12.4f} {:>12.4f}'.format(name, calls, wall, cpu))
+        lines.append('{:<28} {:>10} {:>12.4f} {:>12.4f}'.format('total', '', self.elapsed, self.cpu))
+        lines.append('')
+        lines.append('{} files hashed, {} bytes read'.format(self.files_hashed, self.bytes_read))
+        lines.append('{:.2f} MB/s, {:.1f} files/s'.format(self.hash_rate, self.file_rate))
+        if self.files_deduplicated:
+            lines.append('{} files not hashed again, {} bytes saved (hard links)'.format(
+                self.files_deduplicated, self.bytes_deduplicated))
+        if self.bytes_in_holes:
+            lines.append('{} bytes of holes hashed without reading them (sparse files)'.format(
+                self.bytes_in_holes))
+        for name, value in self.settings.items():
+            if not isinstance(value, (list, dict)):
+                lines.append('{} : {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of throttle.py
+
+Summary :
+    Limits on the rate at which files are read for hashing
+Use Case :
+    As an operator of a live server I want to cap the I/O used by a check
+    So that the application's disk isn't starved while it runs
+
+Testable Statements :
+    Is the read rate held to the limit across all of the hashing workers
+    Can a short burst above the limit be allowed
+    Can the number of files opened per second be limited as well
+    Can I report the throughput achieved, and the time spent throttled
+"""
+import threading
+import time
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+class TokenBucket(object):
+    """A thread safe token bucket
+
+        :param rate: The tokens added per second
+        :param burst: The most tokens which can be held - i.e. the largest
+                burst above the rate. Default is one second's worth.
+
+        A caller asking for more tokens than are available reserves them and
+        sleeps until they would have been added, so callers are served in the
+        order they ask, and a request larger than the burst is still allowed.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        self._rate = float(rate)
+        self._burst = float(burst) if burst else self._rate
+        self._tokens = self._burst
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def acquire(self, amount=1):
+        """Take amount tokens - sleeping until they are available
+
+            Returns the time slept.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class ReadLimiter(object):
+    """The read limits shared by every hashing worker of a run
+
+        :param bytes_per_second: The maximum read rate - None for no limit
+        :param files_per_second: The maximum rate at which files are opened -
+                None for no limit
+        :param burst: The largest burst of bytes above the read rate - default
+                is one second's worth
+
+        start_file is called before each file is opened, and consume after
+        each chunk is read.
+    """
+
+    def __init__(self, bytes_per_second=None, files_per_second=None, burst=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self._bytes = TokenBucket(bytes_per_second, burst, clock, sleep) if bytes_per_second else None
+        self._files = TokenBucket(files_per_second, max(1.0, files_per_second), clock, sleep) \
+            if files_per_second else None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._start = None
+        self._end = None
+        self.bytes_read = 0
+        self.files_read = 0
+        self.throttled = 0.0
+
+    @property
+    def bytes_per_second(self):
+        """The read rate limit - None if the read rate isn't limited"""
+        return self._bytes.rate if self._bytes is not None else None
+
+    @property
+    def files_per_second(self):
+        """The file rate limit - None if the file rate isn't limited"""
+        return self._files.rate if self._files is not None else None
+
+    def start_file(self):
+        """Wait until another file can be opened"""
+        wait = self._files.acquire() if self._files is not None else 0.0
+        with self._lock:
+            if self._start is None:
+                self._start = self._clock()
+            self.files_read += 1
+            self.throttled += wait
+
+    def consume(self, amount):
+        """Account for a chunk of amount bytes - waiting if over the limit"""
+        wait = self._bytes.acquire(amount) if self._bytes is not None else 0.0
+        with self._lock:
+            self.bytes_read += amount
+            self.throttled += wait
+            self._end = self._clock()
+
+    @property
+    def elapsed(self):
+        """The time from the first file being started to the last chunk read"""
+        if self._start is None or self._end is None:
+            return 0.0
+        return self._end - self._start
+
+    def summary(self):
+        """The limits, and the throughput achieved - as a dictionary"""
+        elapsed = self.elapsed
+        return {'limit_bytes_per_second': self.bytes_per_second,
+                'limit_files_per_second': self.files_per_second,
+                'bytes_read': self.bytes_read,
+                'files_read': self.files_read,
+                'elapsed': elapsed,
+                'bytes_per_second': self.bytes_read / elapsed if elapsed else 0.0,
+                'files_per_second': self.files_read / elapsed if elapsed else 0.0,
+                'throttled_seconds': self.throttled}
+
+    def summary_line(self):
+        """The throughput achieved - as a line of text"""
+        summary = self.summary()
+        limits = []
+        if summary['limit_bytes_per_second']:
+            limits.append('{:.1f} MB/s'.format(summary['limit_bytes_per_second'] / 1e6))
+        if summary['limit_files_per_second']:
+            limits.append('{:.1f} files/s'.format(summary['limit_files_per_second']))
+        return 'Read rate : {:.1f} MB/s, {:.1f} files/s (limit {}) - throttled for {:.1f}s\n'.format(
+            summary['bytes_per_second'] / 1e6, summary['files_per_second'],
+            ', '.join(limits), summary['throttled_seconds'])
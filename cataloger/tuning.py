@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+# cataloger : Implementation of tuning.py
+
+Summary :
+    Choosing the number of hashing workers - for --jobs auto
+Use Case :
+    As an operator of many different hosts I want the number of hashing
+    threads chosen for each host So that NVMe hosts, spinning disks and
+    CPU limited containers all hash as fast as they can
+
+Testable Statements :
+    Are the CPU affinity and the cgroup CPU quota both taken into account
+    Does the number of workers climb while the throughput improves
+    Is the number of workers cut back when it stops helping or latency soars
+    Can I report the settings that were chosen
+"""
+import math
+import os
+import threading
+import time
+
+from cataloger import defaults
+
+__version__ = "0.1"
+__author__ = 'Tony Flury : anthony.flury@btinternet.com'
+__created__ = '19 Oct 2026'
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as fp:
+            return fp.readline().strip()
+    except (IOError, OSError):
+        return None
+
+
+def cgroup_cpu_limit(root='/sys/fs/cgroup'):
+    """The CPU limit from the cgroup quota - None if there is no quota
+
+       Reads cpu.max (cgroup v2), or cpu.cfs_quota_us and cpu.cfs_period_us
+       (cgroup v1). The limit is rounded up - a quota of 1.5 CPUs is 2.
+    """
+    line = _read_first_line(os.path.join(root, 'cpu.max'))
+    if line:
+        quota, _, period = line.partition(' ')
+        if quota == 'max':
+            return None
+    else:
+        quota = _read_first_line(os.path.join(root, 'cpu', 'cpu.cfs_quota_us'))
+        period = _read_first_line(os.path.join(root, 'cpu', 'cpu.cfs_period_us'))
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, int(math.ceil(quota / float(period))))
+
+
+def available_cpus(cgroup_root='/sys/fs/cgroup'):
+    """The number of CPUs this process can use - its affinity and cgroup quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(cgroup_root)
+    return min(cpus, limit) if limit else cpus
+
+
+class AutoTuner(object):
+    """Tune the number of active hashing workers from the measured throughput
+
+        :param max_jobs: The most workers which can be active
+        :param start: The number of workers to start with - default is the
+                number of available CPUs (within max_jobs)
+        :param interval: The seconds between each adjustment
+
+        Hill climbing : after each interval the throughput is compared with
+        the previous interval. While it improves the workers keep moving in
+        the same direction (more, or fewer); when it gets worse the direction
+        is reversed, and while it is unchanged the workers are held. If the
+        mean time to hash a file soars (more than
+        defaults.DEFAULT_AUTO_LATENCY_FACTOR times the best seen) without any
+        gain in throughput, the workers are halved - the disks are being
+        swamped.
+    """
+
+    def __init__(self, max_jobs, start=None, interval=defaults.DEFAULT_AUTO_INTERVAL,
+                 clock=time.monotonic, cpus=None):
+        self._cpus = cpus if cpus is not None else available_cpus()
+        self._max_jobs = max(1, max_jobs)
+        self._jobs = min(self._max_jobs, max(1, start if start else self._cpus))
+        self._interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._direction = 1
+        self._last_rate = None
+        self._best_latency = None
+        self._window_start = clock()
+        self._bytes = 0
+        self._files = 0
+        self._latency = 0.0
+        self._listeners = []
+        self.history = []   # (seconds since start, jobs, bytes per second)
+        self._start = self._window_start
+
+    @property
+    def jobs(self):
+        """The number of workers which should be active"""
+        return self._jobs
+
+    @property
+    def max_jobs(self):
+        return self._max_jobs
+
+    def on_change(self, listener):
+        """Call listener(jobs) whenever the number of workers is changed"""
+        self._listeners.append(listener)
+
+    def record(self, bytes_read, latency):
+        """Record a single hashed file - adjusting the workers if it is time"""
+        changed = None
+        with self._lock:
+            self._bytes += bytes_read
+            self._files += 1
+            self._latency += latency
+            now = self._clock()
+            if now - self._window_start >= self._interval:
+                changed = self._adjust(now)
+        if changed is not None:
+            for listener in self._listeners:
+                listener(changed)
+
+    def _adjust(self, now):
+        """Move the number of workers - returns the new number if it changed"""
+        elapsed = now - self._window_start
+        rate = (self._bytes or self._files) / elapsed
+        latency = self._latency / self._files if self._files else 0.0
+        self._window_start, self._bytes, self._files, self._latency = now, 0, 0, 0.0
+
+        previous = self._jobs
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+
+        tolerance = defaults.DEFAULT_AUTO_TOLERANCE
+        if (self._last_rate is not None and rate <= self._last_rate and
+                latency > self._best_latency * defaults.DEFAULT_AUTO_LATENCY_FACTOR):
+            # More workers are just queueing on the disks - back off sharply
+            self._jobs = max(1, self._jobs // 2)
+            self._direction = 1
+        elif self._last_rate is None or rate > self._last_rate * (1 + tolerance):
+            self._jobs = self._step()
+        elif rate < self._last_rate * (1 - tolerance):
+            self._direction = -self._direction
+            self._jobs = self._step()
+        # Otherwise the throughput is unchanged - so hold steady
+
+        self._last_rate = rate
+        self.history.append((round(now - self._start, 3), previous, rate))
+        return self._jobs if self._jobs != previous else None
+
+    def _step(self):
+        """The number of workers after a step in the current direction"""
+        jobs = self._jobs + self._direction
+        if not 1 <= jobs <= self._max_jobs:
+            self._direction = -self._direction
+            jobs = self._jobs + self._direction
+        return min(self._max_jobs, max(1, jobs))
+
+    def summary(self):
+        """The settings chosen - as a dictionary"""
+        return {'jobs': 'auto',
+                'cpus': self._cpus,
+                'max_jobs': self._max_jobs,
+                'final_jobs': self._jobs,
+                'adjustments': len(self.history),
+                'history': [{'at': at, 'jobs': jobs, 'bytes_per_second': rate}
+                            for at, jobs, rate in self.history]}
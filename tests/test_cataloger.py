@@ -25,6 +25,15 @@ import six
 import hashlib
 import os
 import errno
+import json
+import subprocess
+import signal
+import time
+import asyncio
+import functools
+import threading
+import tempfile
+import shutil
 
 # noinspection PyPackageRequirements
 # Only needed for testing see test35_requirements.txt & test27_requirements.txt
@@ -33,6 +42,16 @@ from pyfakefs.fake_filesystem_unittest import Patcher
 import cataloger.processor as processor
 import cataloger.defaults as defaults
 import cataloger.commands as commands
+import cataloger.reports as reports
+import cataloger.aio as aio
+import cataloger.pipeline as pipeline
+import cataloger.readers as readers
+import cataloger.throttle as throttle
+import cataloger.tuning as tuning
+import cataloger.hashbench as hashbench
+import cataloger.resume as resume
+import cataloger.progress as progress
+import cataloger.stats as stats
 import cataloger.main as cli_main
 
 from importlib.resources import files
@@ -1097,6 +1116,21 @@ class TestCatalogConfig(unittest.TestCase):
             self.assertEqual(cat._hash, 'md5')
             self.assertEqual(cat._root, 'src')
 
+    def test_050_030_config_argument(self):
+        """Test that the config file named by the config argument is read"""
+        with Patcher() as patcher:
+            os.chdir('/tmp')
+            patcher.fs.create_file(defaults.DEFAULT_CONFIG_FILE, contents="""
+    [catalog]
+    hash=sha1
+        """)
+            patcher.fs.create_file('other.cfg', contents="""
+    [catalog]
+    hash=md5
+        """)
+            cat = processor.Cataloger(config='other.cfg')
+            self.assertEqual(cat._hash, 'md5')
+
 class TestExtensionConfig(unittest.TestCase):
     def setUp(self):
         pass
@@ -1834,8 +1868,2246 @@ class TestCli(unittest.TestCase):
             self.assertRegex( result.output[m.end(0):], r'\.py : 2')
             self.assertRegex( result.output[m.end(0):], r'\.html : 1')
             self.assertRegex( result.output[m.end(0):], r'\.png : 1')
+    def test_200_002_config_option(self):
+        """Test that the config file given with -c is honoured"""
+        contents = {'./a.py':'a'*20,
+                    './b.py':'b'*20,
+                    './c.html':'c'*20}
+
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            os.chdir('/tmp')
+            self.make_files(fs=patcher.fs, fs_contents = contents)
+            patcher.fs.create_file('other.cfg', contents="""
+    [extensions]
+    =.py
+        """)
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['-c', 'other.cfg', '-r', '/tmp', 'create'])
+
+            self.assertIsNone(result.exception)
+            self.assertRegex( result.output, r'2 files processed')
+            self.assertNotRegex( result.output, r'\.html : ')
+
+    def test_200_003_config_hash(self):
+        """Test that the hash in the config file is used unless -h is given"""
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            os.chdir('/tmp')
+            self.make_files(fs=patcher.fs, fs_contents = {'./a.py':'a'*20})
+            patcher.fs.create_file('other.cfg', contents="""
+    [catalog]
+    hash=md5
+        """)
+            runner = click.testing.CliRunner()
+            for args, hash_name in [([], 'md5'), (['-h', 'sha1'], 'sha1')]:
+                result = runner.invoke(cli_main.main, ['-c', 'other.cfg', '-r', '/tmp'] + args + ['create'])
+                self.assertIsNone(result.exception)
+
+                with open(defaults.DEFAULT_CATALOG_FILE, 'r') as man_fp:
+                    name, sig = man_fp.readline().split('\t')
+                self.assertEqual(sig.strip(), hashlib.new(hash_name, b'a' * 20).hexdigest())
+
+class TestNDJSON(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def make_tree(self, fs):
+        contents = {'/data/a.py':'a'*20,
+                    '/data/b.py':'b'*20,
+                    '/data/src/f.png':'f' * 20,
+                    '/data/src/g.pyc':'g' * 20}
+        for file_name, data in contents.items():
+            fs.create_file(file_name, contents=data)
+        commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+
+    def test_300_000_on_result_streams_each_file(self):
+        """on_result is called for each file as it is recorded"""
+        with Patcher() as patcher:
+            self.make_tree(patcher.fs)
+            os.remove('/data/b.py')
+            patcher.fs.create_file('/data/c.py', contents='c'*20)
+
+            results = []
+            cat = commands.check_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True,
+                                         on_result=results.append, retain_results=False)
+
+            by_path = {r['path']:r for r in results}
+            self.assertEqual(by_path['a.py']['status'], 'processed')
+            self.assertEqual(by_path['a.py']['size'], 20)
+            self.assertEqual(by_path['a.py']['actual'], get_sig('a'*20))
+            self.assertEqual(by_path['b.py']['status'], 'missing')
+            self.assertEqual(by_path['b.py']['expected'], get_sig('b'*20))
+            self.assertEqual(by_path['c.py']['status'], 'extra')
+
+            # Extra files are counted but not retained
+            self.assertEqual(cat.status_count('extra'), 1)
+            self.assertEqual(cat.extra_files, [])
+
+    def test_300_010_cli_ndjson_check(self):
+        """--format ndjson writes a JSON line per file and a summary"""
+        with Patcher() as patcher:
+            self.make_tree(patcher.fs)
+            with open('/data/a.py', 'w') as fp:
+                fp.write('x')
+
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['-r', '/data', '-m', '/tmp/catalog.cat',
+                                                   '--format', 'ndjson', 'check'])
+            self.assertEqual(result.exit_code, 1)
+
+            lines = [json.loads(line) for line in result.output.splitlines()]
+            self.assertTrue(all(line['type'] == 'file' for line in lines[:-1]))
+            self.assertIn({'type':'file', 'path':'a.py', 'status':'mismatch',
+                           'expected':get_sig('a'*20), 'actual':get_sig('x'), 'size':1}, lines)
+            summary = lines[-1]
+            self.assertEqual(summary['type'], 'summary')
+            self.assertEqual(summary['processed_count'], 3)
+            self.assertEqual(summary['status_counts']['mismatch'], 1)
+            self.assertEqual(summary['extensions'], {'.py':2, '.png':1})
+
+
+class TestReportTemplates(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_310_000_renderer_cached(self):
+        """Templates are compiled once and then reused"""
+        first = commands.get_renderer('final_check.tmpl')
+        self.assertIs(commands.get_renderer('final_check.tmpl'), first)
+        self.assertIsNot(commands.get_renderer('final_create.tmpl'), first)
+
+    def test_310_010_row_formatter_matches_format_modifier(self):
+        """The precompiled row formatter gives the same cells as the format modifier"""
+        row = {'path':'src', 'processed':3, 'missing':0, 'mismatch':12, 'extra':0, 'excluded':1}
+        expected = '| ' + ' | '.join(commands.format(row[key], spec)
+                                     for key, spec in reports.CHECK_COLUMNS) + ' |'
+        self.assertEqual(reports.RowFormatter(reports.CHECK_COLUMNS)(row), expected)
+
+
+class TestRunStats(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_320_000_stats_disabled_by_default(self):
+        """No statistics are recorded unless requested"""
+        with Patcher() as patcher:
+            cat = processor.Cataloger(action='create', no_config=True)
+            self.assertIsNone(cat.stats)
+            self.assertNotIn('_file_signature', vars(cat))
+
+    def test_320_010_phases_recorded(self):
+        """Each phase, the bytes read and the files hashed are recorded"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/src/b.py', contents='b'*30)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            cat = commands.check_catalog(root='/data', catalog='/tmp/catalog.cat',
+                                         no_config=True, stats=True)
+
+            stats = cat.stats.as_dict()
+            self.assertEqual(stats['files_hashed'], 2)
+            self.assertEqual(stats['bytes_read'], 50)
+            self.assertEqual(stats['phases']['_load_catalog']['calls'], 1)
+            self.assertEqual(stats['phases']['get_signature']['calls'], 2)
+            self.assertEqual(stats['phases']['_is_file_to_be_processed']['calls'], 2)
+            self.assertIn('walk', stats['phases'])
+            self.assertRegex(cat.stats.summary_table(), r'2 files hashed, 50 bytes read')
+
+    def test_320_020_merge(self):
+        """The statistics of several runs are combined into one"""
+        first, second = stats.RunStats(), stats.RunStats()
+        first.add('walk', 1.0, 0.5)
+        second.add('walk', 2.0, 1.0)
+        second.add('get_signature', 1.0, 1.0)
+        first.count_hashed(10)
+        second.count_hashed(20)
+        second.count_deduplicated(5)
+        first.settings['jobs'] = 2
+        first.stop()
+        second.stop()
+
+        merged = stats.RunStats.merge([first, second]).as_dict()
+        self.assertEqual(merged['phases']['walk'], {'calls': 2, 'wall': 3.0, 'cpu': 1.5})
+        self.assertEqual(merged['phases']['get_signature']['calls'], 1)
+        self.assertEqual((merged['files_hashed'], merged['bytes_read']), (2, 30))
+        self.assertEqual((merged['files_deduplicated'], merged['bytes_deduplicated']), (1, 5))
+        self.assertEqual(merged['settings'], {'jobs': 2})
+        self.assertAlmostEqual(merged['elapsed'], second._end - first._start)
+        self.assertEqual(stats.RunStats.merge([]).files_hashed, 0)
+
+
+class TestMetricsFile(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_330_000_cli_metrics_file(self):
+        """--metrics-file writes the status and extension counts and timings"""
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/c.py', contents='c'*10)
+            patcher.fs.create_file('/data/src/b.png', contents='b'*30)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            os.remove('/data/a.py')
+
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['-r', '/data', '-m', '/tmp/catalog.cat',
+                                                   '--metrics-file', '/tmp/catalog.prom', 'check'])
+            self.assertEqual(result.exit_code, 1)
+
+            with open('/tmp/catalog.prom') as fp:
+                content = fp.read()
+            self.assertIn('catalog_files{command="check",root="/data",status="missing"} 1\n', content)
+            self.assertIn('catalog_files{command="check",root="/data",status="processed"} 2\n', content)
+            self.assertIn('catalog_extension_files{command="check",extension=".png",root="/data"} 1\n', content)
+            self.assertIn('catalog_bytes_hashed{command="check",root="/data"} 40\n', content)
+            self.assertRegex(content, r'catalog_load_duration_seconds\{.*\} \d+\.\d+\n')
+            self.assertCountEqual(os.listdir('/tmp'), ['catalog.cat', 'catalog.prom'])
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_340_000_progress_create(self):
+        """A create pre-counts the tree and reports the final totals"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/src/b.py', contents='b'*30)
+            patcher.fs.create_file('/data/src/c.pyc', contents='c'*30)
+            stream = StringIO()
+            reporter = progress.ProgressReporter(stream=stream)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True,
+                                    progress=reporter)
+            self.assertEqual((reporter.total_files, reporter.total_bytes), (2, 50))
+            self.assertRegex(stream.getvalue(), r'^2/2 files  0\.0/0\.0 MB  .* ETA 0:00:00\n$')
+
+    def test_340_010_progress_check_estimates_bytes(self):
+        """A check takes the file total from the catalog and estimates the bytes"""
+        reporter = progress.ProgressReporter(stream=StringIO(), display=False)
+        reporter.start(total_files=4)
+        reporter.update(1000)
+        self.assertEqual(reporter._estimated_totals(), (4, 4000))
+        reporter.update(1000)
+        self.assertIsNotNone(reporter.eta())
+        reporter.finish()
+        self.assertEqual(reporter._stream.getvalue(), '')
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), 'SIGUSR1 not supported')
+    def test_340_020_sigusr1_dumps_statistics(self):
+        """SIGUSR1 dumps the live statistics even when the display is off"""
+        stream = StringIO()
+        reporter = progress.ProgressReporter(stream=stream, display=False)
+        reporter.start(total_files=10, total_bytes=10000)
+        try:
+            reporter.update(1000)
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.01)
+        finally:
+            reporter.finish()
+        self.assertRegex(stream.getvalue(), r'^1/10 files  0\.0/0\.0 MB')
+        self.assertEqual(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
+
+    def test_340_030_counted_without_lock(self):
+        """Each thread counts its files in its own counter - the lock is only taken to register it"""
+        class CountingLock(object):
+            def __init__(self):
+                self.lock, self.entered = threading.Lock(), 0
+
+            def __enter__(self):
+                self.entered += 1
+                return self.lock.__enter__()
+
+            def __exit__(self, *args):
+                return self.lock.__exit__(*args)
+
+        reporter = progress.ProgressReporter(stream=StringIO(), display=False)
+        reporter.start(total_files=400)
+        reporter._lock = CountingLock()
+
+        def work():
+            for _ in range(100):
+                reporter.update(10)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((reporter.files_done, reporter.bytes_done), (400, 4000))
+        self.assertEqual(reporter._lock.entered, 4)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), 'SIGUSR1 not supported')
+    def test_340_040_reporter_only_when_needed(self):
+        """A command only tracks progress when it is displayed, or can be dumped with SIGUSR1"""
+        self.assertTrue(commands._run_options({'progress': True})['progress'].display)
+        self.assertFalse(commands._run_options({'progress': False})['progress'].display)
+        reporters = []
+        thread = threading.Thread(target=lambda: reporters.append(commands._run_options({})['progress']))
+        thread.start()
+        thread.join()
+        self.assertEqual(reporters, [None])
+
+
+class TestLazyStartup(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_350_000_cli_import_is_lazy(self):
+        """Loading the command line doesn't import the processor or templates"""
+        lazy = ['hashlib', 'templatelite', 'importlib.metadata',
+                'cataloger.processor', 'cataloger.commands']
+        result = subprocess.run([sys.executable, '-c',
+                                 'import sys, cataloger.main;'
+                                 'print(",".join(m for m in {!r} if m in sys.modules))'.format(lazy)],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_350_010_lazy_subcommands(self):
+        """The subcommands are still listed and loaded on demand"""
+        self.assertEqual(cli_main.main.list_commands(None), ['bench-hash', 'check', 'check-many', 'create', 'test'])
+        self.assertIs(cli_main.main.get_command(None, 'check'), commands.check)
+
+
+class TestIterApi(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_360_000_iter_create(self):
+        """iter_create yields a result per file and writes the catalog"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/src/b.py', contents='b'*20)
+            patcher.fs.create_file('/data/src/c.pyc', contents='c'*20)
+            env = processor.Cataloger(action='create', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            results = list(env.iter_create())
+            self.assertCountEqual([(r.path, r.status) for r in results if r.status == 'added'],
+                                  [('a.py', 'added'), ('src/b.py', 'added')])
+            self.assertIn(processor.Result('src/b.py', 'added', None, get_sig('b'*20)), results)
+            self.assertEqual(env.status_count('excluded'), 1)
+            self.assertEqual(env.excluded_files, [])
+            self.assertTrue(os.path.exists('/tmp/catalog.cat'))
+
+    def test_360_010_iter_check(self):
+        """iter_check yields each result and retains nothing by default"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/b.py', contents='b'*20)
+            patcher.fs.create_file('/data/c.py', contents='c'*20)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            os.remove('/data/b.py')
+            patcher.fs.create_file('/data/d.py', contents='d'*20)
+            with open('/data/c.py', 'w') as fp:
+                fp.write('x')
+
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            results = {r.path: r for r in env.iter_check()}
+            self.assertEqual(results['a.py'], processor.Result('a.py', 'processed', get_sig('a'*20), get_sig('a'*20)))
+            self.assertEqual(results['b.py'], processor.Result('b.py', 'missing', get_sig('b'*20), None))
+            self.assertEqual(results['c.py'], processor.Result('c.py', 'mismatch', get_sig('c'*20), get_sig('x')))
+            self.assertEqual(results['d.py'], processor.Result('d.py', 'extra', None, None))
+            self.assertEqual(env.extra_files, [])
+            self.assertEqual(env.status_count('extra'), 1)
+
+    def test_360_020_iter_check_wrong_action(self):
+        """iter_check raises rather than exiting when misused"""
+        with Patcher() as patcher:
+            env = processor.Cataloger(action='create', no_config=True)
+            with self.assertRaises(ValueError):
+                env.iter_check()
+
+
+class TestReusableCataloger(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_370_000_repeated_check_reuses_catalog(self):
+        """A second check resets the status but doesn't reload an unchanged catalog"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/b.py', contents='b'*20)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            patcher.fs.create_file('/data/c.py', contents='c'*20)
+
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            first = sorted(env.iter_check(retain=True))
+            catalog_data = env._catalog_data
+
+            with patch.object(env, '_load_catalog') as load:
+                second = sorted(env.iter_check(retain=True))
+                load.assert_not_called()
+
+            self.assertEqual(first, second)
+            self.assertIs(env._catalog_data, catalog_data)
+            self.assertEqual(env.extra_files, ['c.py'])
+            self.assertEqual(env.status_count('processed'), 2)
+            self.assertEqual(env.extension_counts, {'.py': 3})
+
+    def test_370_010_repeated_check_reloads_changed_catalog(self):
+        """A changed catalog file is reloaded before the next check"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            patcher.fs.create_file('/data/b.py', contents='b'*20)
+
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            self.assertEqual(env.status_count('extra'), 0)
+            self.assertIn(('b.py', 'extra'), [(r.path, r.status) for r in env.iter_check()])
+
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            results = [(r.path, r.status) for r in env.iter_check()]
+            self.assertCountEqual(results, [('a.py', 'processed'), ('b.py', 'processed')])
+            self.assertEqual(env.processed_count, 2)
+
+    def test_370_020_compiled_filters(self):
+        """The filters are compiled once and match as fnmatch does"""
+        with Patcher() as patcher:
+            env = processor.Cataloger(no_config=True, root='/data',
+                                      exclude_filter=['*wibble*', 'src/a?.*'], include_filter=['src/*'])
+            self.assertTrue(env._exclude_re.match('src/ab.py'))
+            self.assertFalse(env._exclude_re.match('src/abc.py'))
+            self.assertTrue(env._include_re.match('src/abc.py'))
+            self.assertFalse(env._include_re.match('test/abc.py'))
+
 
 # noinspection PyMissingOrEmptyDocstring,PyUnusedLocal
+class TestAsyncApi(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @staticmethod
+    async def collect_async(agen):
+        return [result async for result in agen]
+
+    def collect(self, agen):
+        return asyncio.run(self.collect_async(agen))
+
+    def test_380_000_acreate(self):
+        """acreate yields the same results as iter_create and writes the catalog"""
+        with Patcher() as patcher:
+            patcher.fs.shuffle_listdir_results = False
+            for index in range(10):
+                patcher.fs.create_file('/data/src{}/f{}.py'.format(index % 3, index), contents=str(index)*20)
+            patcher.fs.create_file('/data/src0/g.pyc', contents='g')
+            expected = list(processor.Cataloger(action='create', root='/data', catalog='/tmp/sync.cat',
+                                                no_config=True).iter_create())
+
+            pool = aio.HashPool(max_workers=2, max_in_flight=3)
+            results = self.collect(aio.acreate(pool=pool, root='/data', catalog='/tmp/catalog.cat',
+                                               no_config=True))
+            pool.shutdown()
+            self.assertEqual(results, expected)
+            with open('/tmp/sync.cat') as sync_fp, open('/tmp/catalog.cat') as async_fp:
+                self.assertEqual(sync_fp.read(), async_fp.read())
+
+    def test_380_010_acheck(self):
+        """acheck yields the same results, in the same order, as iter_check"""
+        with Patcher() as patcher:
+            patcher.fs.shuffle_listdir_results = False
+            for index in range(10):
+                patcher.fs.create_file('/data/src{}/f{}.py'.format(index % 3, index), contents=str(index)*20)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            os.remove('/data/src1/f4.py')
+            patcher.fs.create_file('/data/src2/new.py', contents='new')
+            with open('/data/src0/f3.py', 'w') as fp:
+                fp.write('x')
+
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            expected = list(env.iter_check())
+            results = self.collect(aio.acheck(cataloger=env, pool=aio.HashPool(max_in_flight=1)))
+            self.assertEqual(results, expected)
+            self.assertEqual(env.status_count('missing'), 1)
+            self.assertEqual(env.status_count('mismatch'), 1)
+            self.assertEqual(env.status_count('extra'), 1)
+
+    def test_380_020_in_flight_limit(self):
+        """The pool never hashes more files at once than its limit"""
+        with Patcher() as patcher:
+            for index in range(12):
+                patcher.fs.create_file('/data/f{}.py'.format(index), contents=str(index))
+            env = processor.Cataloger(action='create', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+            active, peak = [0], [0]
+            lock = threading.Lock()
+            signature = env.get_signature
+
+            def slow_signature(rel_path):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+                return signature(rel_path)
+
+            env.get_signature = slow_signature
+            pool = aio.HashPool(max_workers=8, max_in_flight=2)
+            results = self.collect(aio.acreate(cataloger=env, pool=pool))
+            pool.shutdown()
+            self.assertEqual(len(results), 12)
+            self.assertLessEqual(peak[0], 2)
+
+    def test_380_030_wrong_action(self):
+        """acheck raises rather than exiting when given a create Cataloger"""
+        with Patcher() as patcher:
+            env = processor.Cataloger(action='create', no_config=True)
+            with self.assertRaises(ValueError):
+                self.collect(aio.acheck(cataloger=env))
+
+    def make_checked_tree(self, fs):
+        fs.shuffle_listdir_results = False
+        for index in range(6):
+            fs.create_file('/data/f{}.py'.format(index), contents=str(index)*20)
+        commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+
+    def test_380_040_file_timeout(self):
+        """acheck honours the Cataloger's file timeout"""
+        with Patcher() as patcher:
+            self.make_checked_tree(patcher.fs)
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True, jobs=2, file_timeout=0.1)
+            original, release = env._file_signature, threading.Event()
+
+            def signature(abs_path, *args):
+                if abs_path.endswith('f3.py'):
+                    release.wait(10)
+                return original(abs_path, *args)
+
+            try:
+                with patch.object(env, '_file_signature', side_effect=signature):
+                    results = {result.path: result.status for result in self.collect(aio.acheck(cataloger=env))}
+            finally:
+                release.set()
+            self.assertEqual(results.pop('f3.py'), 'timeout')
+            self.assertEqual(set(results.values()), {'processed'})
+
+    def test_380_050_fail_fast(self):
+        """acheck stops at the first failure of a fail fast check"""
+        with Patcher() as patcher:
+            self.make_checked_tree(patcher.fs)
+            with open('/data/f2.py', 'w') as fp:
+                fp.write('x')
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True, fail_fast=True)
+            results = self.collect(aio.acheck(cataloger=env))
+            self.assertEqual(results[-1].path, 'f2.py')
+            self.assertEqual(env.first_failure.status, 'mismatch')
+            self.assertLess(len(results), 6)
+
+    def test_380_060_in_flight_limit_jobs(self):
+        """The in flight limit covers the Cataloger's own hashing threads, across concurrent runs"""
+        with Patcher() as patcher:
+            for index in range(12):
+                patcher.fs.create_file('/data{}/f{}.py'.format(index % 2, index), contents=str(index))
+            active, peak = [0], [0]
+            lock = threading.Lock()
+            envs = [processor.Cataloger(action='create', root='/data{}'.format(index), jobs=4, batch_files=1,
+                                        catalog='/tmp/catalog{}.cat'.format(index), no_config=True)
+                    for index in range(2)]
+
+            def slow(signature, *args):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+                return signature(*args)
+
+            for env in envs:
+                env._file_signature = functools.partial(slow, env._file_signature)
+            pool = aio.HashPool(max_workers=4, max_in_flight=3)
+
+            async def run_both():
+                return await asyncio.gather(*[
+                    asyncio.ensure_future(self.collect_async(aio.acreate(cataloger=env, pool=pool)))
+                    for env in envs])
+
+            results = asyncio.run(run_both())
+            pool.shutdown()
+            self.assertEqual([len(result) for result in results], [6, 6])
+            self.assertLessEqual(peak[0], 3)
+            self.assertGreater(peak[0], 1)
+
+    def test_380_070_abandoned(self):
+        """A run which is abandoned part way through is stopped and tidied up"""
+        with Patcher() as patcher:
+            self.make_checked_tree(patcher.fs)
+            env = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                      no_config=True)
+
+            async def first():
+                agen = aio.acheck(cataloger=env, pool=aio.HashPool(max_in_flight=1))
+                result = await agen.__anext__()
+                await agen.aclose()
+                return result
+
+            self.assertEqual(asyncio.run(first()).status, 'processed')
+            self.assertIsNone(env._pending)
+
+
+class TestCheckMany(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def make_roots(self, fs):
+        fs.shuffle_listdir_results = False
+        fs.create_file('/r1/a.py', contents='a'*20)
+        fs.create_file('/r1/src/b.py', contents='b'*20)
+        fs.create_file('/r2/c.py', contents='c'*20)
+        os.link('/r1/a.py', '/r2/a.py')
+        commands.create_catalog(root='/r1', catalog='/tmp/r1.cat', no_config=True)
+        commands.create_catalog(root='/r2', catalog='/tmp/r2.cat', no_config=True)
+
+    def test_390_000_worker_pool_keeps_order(self):
+        """The pool yields results in the order of the work - within its window"""
+        pool = pipeline.WorkerPool(jobs=4, window=3)
+        in_progress, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work(value):
+            with lock:
+                in_progress[0] += 1
+                peak[0] = max(peak[0], in_progress[0])
+            time.sleep(0.001 * (value % 3))
+            with lock:
+                in_progress[0] -= 1
+            return value * 2
+
+        items = [(value, functools.partial(work, value) if value % 4 else None) for value in range(40)]
+        results = list(pool.imap(items))
+        pool.shutdown()
+        self.assertEqual([item for item, _ in results], list(range(40)))
+        self.assertEqual([result for _, result in results],
+                         [value * 2 if value % 4 else None for value in range(40)])
+        self.assertLessEqual(peak[0], 3)
+
+    def test_390_010_parallel_check_same_results(self):
+        """A check with several jobs records the same results in the same order"""
+        with Patcher() as patcher:
+            patcher.fs.shuffle_listdir_results = False
+            for index in range(30):
+                patcher.fs.create_file('/data/src{}/f{}.py'.format(index % 4, index), contents=str(index)*20)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            os.remove('/data/src1/f5.py')
+            with open('/data/src2/f6.py', 'w') as fp:
+                fp.write('x')
+
+            serial = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                         no_config=True)
+            parallel = processor.Cataloger(action='check', root='/data', catalog='/tmp/catalog.cat',
+                                           no_config=True, jobs=4)
+            self.assertEqual(list(parallel.iter_check()), list(serial.iter_check()))
+
+    def test_390_020_check_many_shares_cache(self):
+        """check_many_catalogs checks each root - hashing a shared file once"""
+        with Patcher() as patcher:
+            self.make_roots(patcher.fs)
+            with open('/r1/src/b.py', 'w') as fp:
+                fp.write('x')
+
+            cache = pipeline.SignatureCache()
+            checks = commands.check_many_catalogs([('/r1', '/tmp/r1.cat'), ('/r2', '/tmp/r2.cat')],
+                                                  no_config=True, jobs=2, signature_cache=cache)
+            self.assertEqual([check.root for check in checks], ['/r1', '/r2'])
+            self.assertEqual(checks[0].cataloger.mismatched_files, ['src/b.py'])
+            self.assertEqual(checks[1].cataloger.status_count('processed'), 2)
+            self.assertEqual(cache.hits, 1)
+
+    def test_390_030_check_many_continues_after_error(self):
+        """A root which can't be checked is reported without stopping the others"""
+        with Patcher() as patcher:
+            self.make_roots(patcher.fs)
+            checks = commands.check_many_catalogs([('/r1', '/tmp/none.cat'), ('/r2', '/tmp/r2.cat')],
+                                                  no_config=True)
+            self.assertIsNone(checks[0].cataloger)
+            self.assertIsInstance(checks[0].error, processor.CatalogError)
+            self.assertEqual(checks[1].cataloger.status_count('processed'), 2)
+
+    def test_390_035_check_many_root_not_a_directory(self):
+        """A root which isn't an existing directory can't be checked - or a catalog which isn't a file"""
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            self.make_roots(patcher.fs)
+            checks = commands.check_many_catalogs([('/none', '/tmp/r1.cat'), ('/r1/a.py', '/tmp/r1.cat'),
+                                                   ('/r1', '/r2'), ('/r2', '/tmp/r2.cat')], no_config=True)
+            self.assertEqual([check.cataloger is None for check in checks], [True, True, True, False])
+            self.assertIn('not an existing directory', str(checks[0].error))
+            self.assertIsInstance(checks[2].error, processor.CatalogError)
+
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['check-many', '-p', '/none', '/tmp/r1.cat'])
+            self.assertEqual(result.exit_code, 1)
+
+    def test_390_040_cli_manifest_ndjson(self):
+        """check-many reads a manifest and streams results tagged with their root"""
+        with Patcher() as patcher:
+            self.make_roots(patcher.fs)
+            patcher.fs.create_file('/data/new.py', contents='new')
+            patcher.fs.create_file('/tmp/roots.txt', contents='/r1\t/tmp/r1.cat\n# comment\n\n/r2\t/tmp/r2.cat\n')
+            patcher.fs.create_file('/r2/new.py', contents='new')
+
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['-r', '/data', '--format', 'ndjson', '-j', '2',
+                                                   'check-many', '--manifest', '/tmp/roots.txt'])
+            self.assertEqual(result.exit_code, 1)
+
+            lines = [json.loads(line) for line in result.output.splitlines()]
+            self.assertIn({'type': 'file', 'root': '/r2', 'path': 'new.py', 'status': 'extra',
+                           'expected': None, 'actual': None, 'size': 3}, lines)
+            self.assertEqual([(line['root'], line['status_counts']['extra'])
+                              for line in lines if line['type'] == 'summary'],
+                             [('/r1', 0), ('/r2', 1)])
+            self.assertEqual(lines[-1]['type'], 'batch_summary')
+            self.assertEqual(lines[-1]['status_counts']['processed'], 4)
+
+    def test_390_050_cli_text_report(self):
+        """check-many reports a row for each root and the roots which couldn't be checked"""
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            self.make_roots(patcher.fs)
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['check-many', '-p', '/r1', '/tmp/r1.cat',
+                                                   '-p', '/r2', '/tmp/none.cat'])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn('2 roots checked - 1 with differences or errors', result.output)
+            self.assertRegex(result.output, r'\| /r1 +\| +2 +\|')
+            self.assertIn("Unable to check /r2 against '/tmp/none.cat'", result.output)
+
+    def test_390_060_cli_stats_and_metrics(self):
+        """check-many reports the statistics for each root and for all of the roots"""
+        with Patcher() as patcher:
+            patcher.fs.add_real_directory(str(files('cataloger')))
+            self.make_roots(patcher.fs)
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['--stats', '--metrics-file', '/tmp/catalog.prom',
+                                                   'check-many', '-p', '/r1', '/tmp/r1.cat',
+                                                   '-p', '/r2', '/tmp/r2.cat'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertRegex(result.stderr, r'All roots\n')
+            total = result.stderr.split('All roots')[1]
+            self.assertIn('3 files hashed, 60 bytes read', total)
+            self.assertIn('1 files not hashed again', total)
+            with open('/tmp/catalog.prom') as fp:
+                metrics = fp.read()
+            self.assertIn('catalog_files{command="check-many",root="/r1",status="processed"} 2', metrics)
+            self.assertIn('catalog_files{command="check-many",root="/r2",status="processed"} 2', metrics)
+
+
+class TestReadPolicy(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'tree')
+        os.mkdir(self.root)
+        for name, size in [('a.py', 10), ('b.py', 3 * 1024 * 1024 + 7), ('c.py', 0)]:
+            with open(os.path.join(self.root, name), 'wb') as fp:
+                fp.write(bytes(range(256)) * (size // 256) + b'x' * (size % 256))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_400_000_nocache_same_signatures(self):
+        """Both I/O policies give the same signatures"""
+        normal = processor.Cataloger(action='create', root=self.root, catalog=os.path.join(self.tmp.name, 'n.cat'),
+                                     no_config=True)
+        nocache = processor.Cataloger(action='create', root=self.root, catalog=os.path.join(self.tmp.name, 'c.cat'),
+                                      no_config=True, io_policy='nocache')
+        self.assertEqual(list(nocache.iter_create()), list(normal.iter_create()))
+        for name in ['a.py', 'b.py', 'c.py']:
+            with open(os.path.join(self.root, name), 'rb') as fp:
+                self.assertEqual(nocache.get_signature(name), hashlib.sha224(fp.read()).hexdigest())
+
+    def test_400_010_nocache_hints(self):
+        """A nocache read is hinted as sequential, and dropped from the cache afterwards"""
+        with patch('cataloger.readers._fadvise') as fadvise:
+            size = readers.hash_file(os.path.join(self.root, 'b.py'), hashlib.sha224().update,
+                                     policy='nocache')
+        self.assertEqual(size, 3 * 1024 * 1024 + 7)
+        advice = [args[3] for args, _ in fadvise.call_args_list]
+        self.assertEqual(advice, [os.POSIX_FADV_SEQUENTIAL, os.POSIX_FADV_DONTNEED])
+
+    def test_400_020_normal_no_hints(self):
+        """A normal read gives no hints"""
+        with patch('cataloger.readers._fadvise') as fadvise:
+            readers.hash_file(os.path.join(self.root, 'a.py'), hashlib.sha224().update)
+        fadvise.assert_not_called()
+
+    def test_400_030_noatime_not_permitted(self):
+        """A file which can't be opened with O_NOATIME is opened normally"""
+        real_open = os.open
+
+        def fake_open(path, flags, *args):
+            if flags & readers._O_NOATIME:
+                raise PermissionError(errno.EPERM, 'Operation not permitted')
+            return real_open(path, flags, *args)
+
+        with patch('cataloger.readers._O_NOATIME', 0o1000000), \
+                patch('cataloger.readers.os.open', side_effect=fake_open) as opened:
+            fd = readers.open_fd(os.path.join(self.root, 'a.py'), noatime=True)
+            os.close(fd)
+        self.assertEqual(opened.call_count, 2)
+
+    def test_400_040_prefetch_ahead(self):
+        """With nocache the next files to be hashed are prefetched"""
+        env = processor.Cataloger(action='create', root=self.root, catalog=os.path.join(self.tmp.name, 'c.cat'),
+                                  no_config=True, io_policy='nocache')
+        with patch('cataloger.readers._fadvise') as fadvise:
+            list(env.iter_create())
+        self.assertEqual(sum(1 for args, _ in fadvise.call_args_list
+                             if args[3] == os.POSIX_FADV_WILLNEED), 3)
+
+    def test_400_050_invalid_config_policy(self):
+        """An unknown io_policy in the config file is an error"""
+        with Patcher() as patcher:
+            patcher.fs.create_file(defaults.DEFAULT_CONFIG_FILE, contents='[catalog]\nio_policy = fast\n')
+            with self.assertRaises(processor.ConfigError):
+                processor.Cataloger()
+
+
+class TestReadThrottle(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.slept = []
+
+    def tearDown(self):
+        pass
+
+    def clock(self):
+        return self.now[0]
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now[0] += seconds
+
+    def test_410_000_bucket_burst_then_rate(self):
+        """The burst is available at once, and then the rate applies"""
+        bucket = throttle.TokenBucket(100, burst=50, clock=self.clock, sleep=self.sleep)
+        self.assertEqual(bucket.acquire(50), 0)
+        self.assertAlmostEqual(bucket.acquire(25), 0.25)
+        self.now[0] += 10
+        self.assertEqual(bucket.acquire(50), 0)     # Refilled - but only to the burst
+        self.assertAlmostEqual(bucket.acquire(10), 0.1)
+
+    def test_410_010_bucket_larger_than_burst(self):
+        """A request larger than the burst waits for the excess"""
+        bucket = throttle.TokenBucket(1000, clock=self.clock, sleep=self.sleep)
+        self.assertAlmostEqual(bucket.acquire(3000), 2.0)
+        self.assertEqual(self.slept, [2.0])
+
+    def test_410_020_limiter_shared_by_threads(self):
+        """The read rate is held across all of the threads using the limiter"""
+        limiter = throttle.ReadLimiter(bytes_per_second=2000000, burst=100000)
+
+        def reader():
+            limiter.start_file()
+            for _ in range(5):
+                limiter.consume(25000)
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+        summary = limiter.summary()
+        self.assertEqual(summary['bytes_read'], 500000)
+        self.assertEqual(summary['files_read'], 4)
+        self.assertGreater(summary['throttled_seconds'], 0)
+
+    def test_410_030_file_rate(self):
+        """The rate at which files are opened can be limited"""
+        limiter = throttle.ReadLimiter(files_per_second=2, clock=self.clock, sleep=self.sleep)
+        for _ in range(6):
+            limiter.start_file()
+        self.assertAlmostEqual(sum(self.slept), 2.0)
+        self.assertIsNone(limiter.bytes_per_second)
+
+    def test_410_040_throttled_check(self):
+        """A throttled check reads in chunks and reports the rate achieved"""
+        with Patcher() as patcher:
+            patcher.fs.create_file('/data/a.py', contents='a'*20)
+            patcher.fs.create_file('/data/b.py', contents='b'*2000)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            runner = click.testing.CliRunner()
+            result = runner.invoke(cli_main.main, ['-r', '/data', '-m', '/tmp/catalog.cat', '--format', 'ndjson',
+                                                   '--max-read-rate', '1M', '--max-file-rate', '100',
+                                                   'check'])
+            self.assertEqual(result.exit_code, 0)
+            summary = json.loads(result.output.splitlines()[-1])
+            self.assertEqual(summary['status_counts']['processed'], 2)
+            self.assertEqual(summary['read_rate']['bytes_read'], 2020)
+            self.assertEqual(summary['read_rate']['limit_bytes_per_second'], 1024 * 1024)
+            self.assertEqual(summary['read_rate']['limit_files_per_second'], 100)
+
+    def test_410_050_size_option(self):
+        """Sizes can be given with a K, M, G or T suffix"""
+        self.assertEqual(cli_main.validate_size(None, None, '50M'), 50 * 1024 * 1024)
+        self.assertEqual(cli_main.validate_size(None, None, '1.5k'), 1536)
+        self.assertEqual(cli_main.validate_size(None, None, '2GB'), 2 * 1024 ** 3)
+        self.assertEqual(cli_main.validate_size(None, None, '4096'), 4096)
+        with self.assertRaises(click.BadParameter):
+            cli_main.validate_size(None, None, 'fast')
+
+
+class TestAutoJobs(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def clock(self):
+        return self.now[0]
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(content)
+
+    def test_420_000_cgroup_v2_quota(self):
+        """The cgroup v2 quota is rounded up to whole CPUs"""
+        self.write('cpu.max', '150000 100000\n')
+        self.assertEqual(tuning.cgroup_cpu_limit(self.tmp), 2)
+        self.write('cpu.max', 'max 100000\n')
+        self.assertIsNone(tuning.cgroup_cpu_limit(self.tmp))
+
+    def test_420_010_cgroup_v1_quota(self):
+        """The cgroup v1 quota is used if there is no cpu.max"""
+        self.write('cpu/cpu.cfs_quota_us', '300000\n')
+        self.write('cpu/cpu.cfs_period_us', '100000\n')
+        self.assertEqual(tuning.cgroup_cpu_limit(self.tmp), 3)
+        self.write('cpu/cpu.cfs_quota_us', '-1\n')
+        self.assertIsNone(tuning.cgroup_cpu_limit(self.tmp))
+        self.assertGreaterEqual(tuning.available_cpus(self.tmp), 1)
+
+    def test_420_020_tuner_climbs_and_reverses(self):
+        """The workers climb while the throughput improves, and reverse when it drops"""
+        tuner = tuning.AutoTuner(8, start=2, interval=1, clock=self.clock, cpus=2)
+        changes = []
+        tuner.on_change(changes.append)
+        for rate in (100, 200, 100):
+            self.now[0] += 1
+            tuner.record(rate, 0.1)
+        self.assertEqual(changes, [3, 4, 3])
+        self.assertEqual(tuner.jobs, 3)
+        summary = tuner.summary()
+        self.assertEqual(summary['jobs'], 'auto')
+        self.assertEqual(summary['final_jobs'], 3)
+        self.assertEqual(summary['adjustments'], 3)
+
+    def test_420_030_tuner_backs_off_when_swamped(self):
+        """The workers are halved when the latency soars without any gain"""
+        tuner = tuning.AutoTuner(16, start=8, interval=1, clock=self.clock, cpus=8)
+        self.now[0] += 1
+        tuner.record(1000, 0.01)
+        self.assertEqual(tuner.jobs, 9)
+        self.now[0] += 1
+        tuner.record(1000, 0.5)
+        self.assertEqual(tuner.jobs, 4)
+
+    def test_420_040_active_limit(self):
+        """No more than the limit are active at once - and the limit can change"""
+        limit = pipeline.ActiveLimit(2)
+        active, most = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with limit:
+                with lock:
+                    active[0] += 1
+                    most[0] = max(most[0], active[0])
+                time.sleep(0.01)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        limit.set_limit(3)
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(most[0], 3)
+        self.assertEqual(limit.limit, 3)
+
+    def test_420_050_auto_jobs_check(self):
+        """A check with auto jobs gives the same results, and records the settings"""
+        with Patcher() as patcher:
+            patcher.fs.shuffle_listdir_results = False
+            for index in range(20):
+                patcher.fs.create_file('/data/file{:02}.py'.format(index), contents='x' * index)
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            serial = [(r.path, r.status) for r in
+                      processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                          no_config=True).iter_check(retain=True)]
+            cataloger = processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                            no_config=True, jobs='auto', stats=True)
+            auto = [(r.path, r.status) for r in cataloger.iter_check(retain=True)]
+            self.assertEqual(auto, serial)
+            self.assertEqual(cataloger.stats.settings['jobs'], 'auto')
+            self.assertIn('final_jobs', cataloger.stats.as_dict()['settings'])
+            self.assertIn('jobs : auto', cataloger.stats.summary_table())
+
+    def test_420_060_jobs_option(self):
+        """The jobs option is a number of at least 1, or auto"""
+        self.assertEqual(cli_main.validate_jobs(None, None, 'auto'), 'auto')
+        self.assertEqual(cli_main.validate_jobs(None, None, '4'), 4)
+        for value in ('0', 'many'):
+            with self.assertRaises(click.BadParameter):
+                cli_main.validate_jobs(None, None, value)
+
+
+class TestLargestFirst(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_430_000_largest_started_first(self):
+        """The largest work in the lookahead is started first - the results stay in order"""
+        sizes = [1, 5, 3, 9, 2, 7]
+        started = []
+        lock = threading.Lock()
+
+        def work(index):
+            with lock:
+                started.append(index)
+            time.sleep(0.01)
+            return index * 10
+
+        pool = pipeline.WorkerPool(jobs=2, schedule='largest', lookahead=10)
+        try:
+            results = list(pool.imap(((index, functools.partial(work, index)) for index in range(6)),
+                                     size=lambda index: sizes[index]))
+        finally:
+            pool.shutdown()
+        self.assertEqual(results, [(index, index * 10) for index in range(6)])
+        self.assertEqual(set(started[:2]), {3, 5})
+        self.assertEqual(set(started[-2:]), {0, 4})
+
+    def test_430_010_lookahead_bounds_reading(self):
+        """No more than the lookahead is read ahead of the consumer"""
+        read = []
+
+        def work():
+            for index in range(50):
+                read.append(index)
+                yield index, functools.partial(lambda value: value, index)
+
+        pool = pipeline.WorkerPool(jobs=2, schedule='largest', lookahead=5)
+        try:
+            results = pool.imap(work(), size=lambda index: index)
+            self.assertEqual(next(results), (0, 0))
+            self.assertLessEqual(len(read), 6)
+            self.assertEqual([item for item, _ in results], list(range(1, 50)))
+        finally:
+            pool.shutdown()
+
+    def test_430_020_items_without_work(self):
+        """Items with no work pass through in order with the largest schedule"""
+        pool = pipeline.WorkerPool(jobs=3, schedule='largest')
+        work = [(index, functools.partial(lambda value: value, index) if index % 2 else None)
+                for index in range(10)]
+        try:
+            results = list(pool.imap(work, size=lambda index: index))
+        finally:
+            pool.shutdown()
+        self.assertEqual(results, [(index, index if index % 2 else None) for index in range(10)])
+        self.assertEqual(pool.settings()['schedule'], 'largest')
+
+    def test_430_030_largest_check_unchanged(self):
+        """A check with the largest schedule gives the same results as the walk"""
+        with Patcher() as patcher:
+            patcher.fs.shuffle_listdir_results = False
+            for index in range(30):
+                patcher.fs.create_file('/data/d{}/file{:02}.py'.format(index % 3, index),
+                                       contents='x' * ((index * 37) % 101))
+            commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+            patcher.fs.create_file('/data/d1/extra.py', contents='extra')
+            os.remove('/data/d2/file05.py')
+            expected = [(r.path, r.status) for r in
+                        processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                            no_config=True).iter_check(retain=True)]
+            largest = [(r.path, r.status) for r in
+                       processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                           no_config=True, jobs=4, schedule='largest',
+                                           lookahead=8).iter_check(retain=True)]
+            self.assertEqual(largest, expected)
+
+    def test_430_040_invalid_schedule(self):
+        """An unknown schedule is rejected"""
+        with self.assertRaises(ValueError):
+            pipeline.WorkerPool(jobs=2, schedule='smallest')
+
+
+class TestSmallFileBatches(unittest.TestCase):
+    def setUp(self):
+        self.patcher = Patcher()
+        self.patcher.setUp()
+        self.patcher.fs.shuffle_listdir_results = False
+        for index in range(40):
+            self.patcher.fs.create_file('/data/d{}/small{:02}.py'.format(index % 2, index), contents='s' * index)
+        self.patcher.fs.create_file('/data/d0/large.py', contents='L' * 5000)
+        self.patcher.fs.create_file('/data/d1/notes.doc', contents='excluded')
+        commands.create_catalog(root='/data', catalog='/tmp/catalog.cat', no_config=True)
+
+    def tearDown(self):
+        self.patcher.tearDown()
+
+    def check(self, **kwargs):
+        cataloger = processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                        no_config=True, **kwargs)
+        return cataloger, [tuple(result) for result in cataloger.iter_check(retain=True)]
+
+    def test_440_000_batches_formed(self):
+        """Small files are grouped into batches - large files are sent on their own"""
+        cataloger = processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                        no_config=True, jobs=2, batch_threshold=1000, batch_files=8)
+        cataloger._prepare_run()
+        work = list(cataloger._batched(cataloger._tasks()))
+        batches = [item for item in work if isinstance(item, processor.Batch)]
+        self.assertTrue(batches)
+        self.assertTrue(all(sum(task.kind == 'hash' for task in batch.tasks) <= 8 for batch in batches))
+        singles = [item for item in work if isinstance(item, processor.Task) and item.kind == 'hash']
+        self.assertEqual([task.path for task in singles], ['d0/large.py'])
+        flattened = [task for item in work
+                     for task in (item.tasks if isinstance(item, processor.Batch) else [item])]
+        self.assertEqual(flattened, list(cataloger._tasks()))
+
+    def test_440_010_batch_bytes(self):
+        """A batch is closed once its files reach the target bytes"""
+        cataloger = processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                        no_config=True, jobs=2, batch_threshold=1000, batch_bytes=100)
+        cataloger._prepare_run()
+        for item in cataloger._batched(cataloger._tasks()):
+            if isinstance(item, processor.Batch):
+                hashed = [task for task in item.tasks if task.kind == 'hash']
+                self.assertLess(item.size - os.path.getsize('/data/' + hashed[-1].path), 100)
+
+    def test_440_020_batched_check_unchanged(self):
+        """A check with batching gives the same results as without"""
+        with open('/data/d1/small03.py', 'w') as fp:
+            fp.write('changed')
+        os.remove('/data/d0/small10.py')
+        _, expected = self.check()
+        cataloger, batched = self.check(jobs=3, batch_files=4, stats=True)
+        self.assertEqual(batched, expected)
+        self.assertGreater(cataloger.stats.settings['batches'], 0)
+        self.assertEqual(cataloger.stats.settings['batched_files'], 40)
+        _, unbatched = self.check(jobs=3, batch_files=1)
+        self.assertEqual(unbatched, expected)
+
+    def test_440_030_batched_create(self):
+        """A catalog created with batching is the same as one created without"""
+        commands.create_catalog(root='/data', catalog='/tmp/batched.cat', no_config=True,
+                                jobs=2, batch_files=5)
+        with open('/tmp/catalog.cat') as expected, open('/tmp/batched.cat') as batched:
+            self.assertEqual(batched.read(), expected.read())
+
+    def test_440_040_batch_of_other_tasks(self):
+        """Excluded and extra files count towards batch_files - so a long run of them can't grow a batch"""
+        self.patcher.fs.create_file('/data/d2/first.py', contents='first')
+        for index in range(50):
+            self.patcher.fs.create_file('/data/d2/excluded{:02}.doc'.format(index), contents='x')
+            self.patcher.fs.create_file('/data/d2/extra{:02}.py'.format(index), contents='x')
+        cataloger = processor.Cataloger(root='/data', catalog='/tmp/catalog.cat', action='check',
+                                        no_config=True, jobs=2, batch_threshold=1000, batch_files=8)
+        cataloger._prepare_run()
+        work = list(cataloger._batched(cataloger._tasks()))
+        self.assertTrue(all(len(item.tasks) <= 8 for item in work if isinstance(item, processor.Batch)))
+        flattened = [task for item in work
+                     for task in (item.tasks if isinstance(item, processor.Batch) else [item])]
+        self.assertEqual(flattened, list(cataloger._tasks()))
+
+
+class TreeTestCase(unittest.TestCase):
+    """A temporary tree of real files - and its catalog
+
+        Each test gets a new temporary directory, holding the tree (at
+        self.root) with the files from tree_files, and the catalog of the
+        tree (at self.catalog) - unless create_tree_catalog is False.
+    """
+    create_tree_catalog = True
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'tree')
+        os.makedirs(self.root)
+        self.catalog = os.path.join(self.tmp, 'catalog.cat')
+        for name, content in self.tree_files().items():
+            self.write_file(name, content)
+        if self.create_tree_catalog:
+            commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def tree_files(self):
+        """The files in the tree - a dictionary of path (relative to the root) to content"""
+        return {}
+
+    def write_file(self, name, content):
+        """Write the file in the tree (creating its directory) - returning its absolute path"""
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb' if isinstance(content, (bytes, bytearray)) else 'w') as fp:
+            fp.write(content)
+        return path
+
+    def _check(self, **kwargs):
+        """Check the tree - returning the status of each file"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, **kwargs)
+        return {result.path: result.status for result in cataloger.iter_check()}
+
+
+class TestTimeouts(TreeTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        super().setUp()
+
+    def tree_files(self):
+        return {'file{}.py'.format(index): 'content {}'.format(index) for index in range(6)}
+
+    def tearDown(self):
+        self.release.set()
+        super().tearDown()
+
+    def hang(self, value):
+        self.release.wait(10)
+        return value
+
+    def test_450_000_straggler_abandoned(self):
+        """Work which runs past its timeout is abandoned - the rest is done"""
+        pool = pipeline.WorkerPool(jobs=2)
+        work = [(index, functools.partial(self.hang if index == 1 else (lambda value: value), index))
+                for index in range(6)]
+        start = time.monotonic()
+        try:
+            results = list(pool.imap(work, timeout=lambda item: 0.1))
+        finally:
+            pool.shutdown(wait=False)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(results, [(0, 0), (1, pipeline.TIMED_OUT), (2, 2), (3, 3), (4, 4), (5, 5)])
+        self.assertEqual(pool._executor, None)
+
+    def test_450_010_single_job_timeout(self):
+        """A single job is timed out too - the work runs in a worker thread"""
+        pool = pipeline.WorkerPool(jobs=1)
+        try:
+            results = list(pool.imap([('a', functools.partial(self.hang, 'a')), ('b', lambda: 'b')],
+                                     timeout=lambda item: 0.05))
+        finally:
+            pool.shutdown(wait=False)
+        self.assertEqual(results, [('a', pipeline.TIMED_OUT), ('b', 'b')])
+
+    def test_450_020_deadline(self):
+        """Once the deadline has passed no more work is started"""
+        started = []
+
+        def work(index):
+            started.append(index)
+            time.sleep(0.03)
+            return index
+
+        for schedule in defaults.ALL_SCHEDULES:
+            del started[:]
+            pool = pipeline.WorkerPool(jobs=2, schedule=schedule)
+            try:
+                results = list(pool.imap(((index, functools.partial(work, index)) for index in range(40)),
+                                         size=lambda index: index, deadline=time.monotonic() + 0.1))
+            finally:
+                pool.shutdown(wait=False)
+            self.assertEqual([item for item, _ in results], list(range(40)))
+            timed_out = [item for item, result in results if result is pipeline.TIMED_OUT]
+            self.assertTrue(timed_out)
+            self.assertLess(len(started), 40)
+            self.assertTrue(all(result == item for item, result in results if result is not pipeline.TIMED_OUT))
+
+    def test_450_030_timeout_status(self):
+        """A file which hangs is recorded as timed out, and the check completes"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog,
+                                        action='check', no_config=True, jobs=2, file_timeout=0.1)
+        original = cataloger._file_signature
+
+        def signature(abs_path, *args):
+            if abs_path.endswith('file3.py'):
+                self.release.wait(10)
+            return original(abs_path, *args)
+
+        with patch.object(cataloger, '_file_signature', side_effect=signature):
+            results = {result.path: result.status for result in cataloger.iter_check()}
+        self.assertEqual(results.pop('file3.py'), 'timeout')
+        self.assertEqual(set(results.values()), {'processed'})
+        self.assertEqual(cataloger.timed_out_files, ['file3.py'])
+        self.assertEqual(cataloger.status_count('timeout'), 1)
+        self.assertTrue(commands.has_failures(cataloger))
+
+    def test_450_040_run_timeout(self):
+        """Once the run timeout has passed the remaining files are timed out"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog,
+                                        action='check', no_config=True, run_timeout=0.15)
+        original = cataloger._file_signature
+
+        def signature(abs_path, *args):
+            time.sleep(0.1)
+            return original(abs_path, *args)
+
+        with patch.object(cataloger, '_file_signature', side_effect=signature):
+            results = [result.status for result in cataloger.iter_check()]
+        self.assertEqual(len(results), 6)
+        self.assertIn('timeout', results)
+        self.assertEqual(cataloger.status_count('missing'), 0)
+        self.assertEqual(cataloger.status_count('timeout') + cataloger.status_count('processed'), 6)
+
+    def test_450_050_timeout_cli(self):
+        """The timed out files are reported by the check command"""
+        original = processor.Cataloger._file_signature
+
+        def signature(env, abs_path, *args):
+            if abs_path.endswith('file0.py'):
+                self.release.wait(10)
+            return original(env, abs_path, *args)
+
+        runner = click.testing.CliRunner()
+        with patch.object(processor.Cataloger, '_file_signature', autospec=True, side_effect=signature):
+            result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog,
+                                                   '--format', 'ndjson', '--file-timeout', '0.1', 'check'])
+        self.assertEqual(result.exit_code, 1)
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        self.assertIn({'path': 'file0.py', 'status': 'timeout'},
+                      [{'path': line.get('path'), 'status': line.get('status')} for line in lines])
+        self.assertEqual(lines[-1]['status_counts']['timeout'], 1)
+
+    def test_450_060_timeout_create_cli(self):
+        """A create with timed out files exits with a failure - the catalog is incomplete"""
+        original = processor.Cataloger._file_signature
+
+        def signature(env, abs_path, *args):
+            if abs_path.endswith('file0.py'):
+                self.release.wait(10)
+            return original(env, abs_path, *args)
+
+        new_catalog = os.path.join(self.tmp, 'new.cat')
+        runner = click.testing.CliRunner()
+        for output_format in ('ndjson', 'text'):
+            with patch.object(processor.Cataloger, '_file_signature', autospec=True, side_effect=signature):
+                result = runner.invoke(cli_main.main, ['-r', self.root, '-m', new_catalog,
+                                                       '--format', output_format, '--file-timeout', '0.1',
+                                                       'create'])
+            self.assertEqual(result.exit_code, 1)
+            with open(new_catalog) as fp:
+                self.assertNotIn('file0.py', fp.read())
+
+
+class TestInflightBytes(TreeTestCase):
+    def tree_files(self):
+        return {'file{}.py'.format(index): os.urandom(50000 + index) for index in range(8)}
+
+    def test_460_000_buffers_limited(self):
+        """No more than the limit is held in buffers - however many threads want one"""
+        buffers = readers.BufferPool(4096, chunk_size=1024)
+        held, most = [0], [0]
+        lock = threading.Lock()
+
+        def worker():
+            for _ in range(20):
+                buffer = buffers.acquire()
+                with lock:
+                    held[0] += 1
+                    most[0] = max(most[0], held[0])
+                time.sleep(0.001)
+                with lock:
+                    held[0] -= 1
+                buffers.release(buffer)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(most[0], 4)
+        self.assertLessEqual(buffers.peak_bytes, 4096)
+        self.assertGreater(buffers.waits, 0)
+
+    def test_460_010_chunk_size_reduced(self):
+        """A limit smaller than a chunk reduces the chunk size"""
+        buffers = readers.BufferPool(1000)
+        self.assertEqual(buffers.chunk_size, 1000)
+        self.assertEqual(len(buffers.acquire()), 1000)
+        with self.assertRaises(ValueError):
+            readers.BufferPool(0)
+
+    def test_460_020_same_signature(self):
+        """A file read through the buffer pool has the same signature"""
+        path = os.path.join(self.root, 'file3.py')
+        buffers = readers.BufferPool(3000, chunk_size=1000)
+        digest = hashlib.sha224()
+        size = readers.hash_file(path, digest.update, buffers=buffers)
+        with open(path, 'rb') as fp:
+            self.assertEqual(digest.hexdigest(), hashlib.sha224(fp.read()).hexdigest())
+        self.assertEqual(size, 50003)
+        self.assertEqual(buffers.peak_bytes, 1000)
+
+    def test_460_030_limited_check(self):
+        """A parallel check within the limit has the same results, and reports the peak"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check', no_config=True,
+                                        jobs=4, batch_files=1, max_inflight_bytes=8192, stats=True)
+        statuses = [result.status for result in cataloger.iter_check()]
+        self.assertEqual(statuses, ['processed'] * 8)
+        settings = cataloger.stats.settings
+        self.assertEqual(settings['max_inflight_bytes'], 8192)
+        self.assertLessEqual(settings['peak_inflight_bytes'], 8192)
+        self.assertGreater(settings['peak_inflight_bytes'], 0)
+
+    def test_460_040_cli_option(self):
+        """The limit can be given on the command line - and is shared by check-many"""
+        runner = click.testing.CliRunner()
+        result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '-j', '3',
+                                               '--max-inflight-bytes', '16K', '--format', 'ndjson', 'check'])
+        self.assertEqual(result.exit_code, 0)
+        summary = json.loads(result.output.splitlines()[-1])
+        self.assertEqual(summary['status_counts']['processed'], 8)
+        checks = commands.check_many_catalogs([(self.root, self.catalog), (self.root, self.catalog)],
+                                              no_config=True, max_inflight_bytes=4096)
+        self.assertIs(checks[0].cataloger.buffer_pool, checks[1].cataloger.buffer_pool)
+
+    def test_460_050_check_many_chunk_size(self):
+        """The BufferPool shared by check-many uses the chunk_size"""
+        checks = commands.check_many_catalogs([(self.root, self.catalog), (self.root, self.catalog)],
+                                              no_config=True, max_inflight_bytes=64 * 1024, chunk_size=4096)
+        self.assertIs(checks[0].cataloger.buffer_pool, checks[1].cataloger.buffer_pool)
+        self.assertEqual(checks[0].cataloger.buffer_pool.chunk_size, 4096)
+
+
+class TestHardLinks(TreeTestCase):
+    create_tree_catalog = False
+
+    def setUp(self):
+        super().setUp()
+        self.asset = self.write_file('v1/asset.js', b'a' * 10000)
+        for directory in ('v2', 'v3'):
+            os.makedirs(os.path.join(self.root, directory))
+            os.link(self.asset, os.path.join(self.root, directory, 'asset.js'))
+            os.link(self.asset, os.path.join(self.root, directory, 'renamed.js'))
+        self.write_file('v1/single.js', 'single')
+
+    def test_470_000_cache_computes_once(self):
+        """Workers asking for the same key at once only compute it once"""
+        cache = pipeline.SignatureCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'signature'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.signature('key', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('signature', False)] * 4 + [('signature', True)])
+        self.assertEqual(cache.signature('key', compute), ('signature', False))
+
+    def test_470_010_failed_signature_not_cached(self):
+        """A file which can't be hashed isn't cached"""
+        cache = pipeline.SignatureCache()
+        self.assertEqual(cache.signature('key', lambda: None), (None, True))
+        self.assertEqual(cache.signature('key', lambda: 'signature'), ('signature', True))
+
+    def test_470_020_links_hashed_once(self):
+        """Every link to an inode has the same signature - but the inode is hashed once"""
+        for jobs in (1, 4):
+            cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create',
+                                            no_config=True, extensions=['.js'], jobs=jobs, stats=True)
+            results = {result.path: result.actual for result in cataloger.iter_create()}
+            self.assertEqual(len(results), 6)
+            self.assertEqual(len(set(results.values())), 2)
+            self.assertEqual(cataloger.stats.files_hashed, 2)
+            self.assertEqual(cataloger.stats.files_deduplicated, 4)
+            self.assertEqual(cataloger.stats.bytes_deduplicated, 40000)
+            self.assertIn('40000 bytes saved', cataloger.stats.summary_table())
+
+    def test_470_030_no_dedup(self):
+        """Deduplication can be turned off"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create',
+                                        no_config=True, extensions=['.js'], dedup_links=False, stats=True)
+        list(cataloger.iter_create())
+        self.assertEqual(cataloger.stats.files_hashed, 6)
+        self.assertEqual(cataloger.stats.bytes_deduplicated, 0)
+
+    def test_470_040_changed_link_detected(self):
+        """A check after an asset is changed reports every link to it"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, extensions=['.js'])
+        with open(self.asset, 'ab') as fp:
+            fp.write(b'changed')
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, extensions=['.js'], jobs=3)
+        list(cataloger.iter_check())
+        self.assertEqual(sorted(cataloger.mismatched_files),
+                         sorted(['v1/asset.js', 'v2/asset.js', 'v2/renamed.js', 'v3/asset.js', 'v3/renamed.js']))
+
+    def test_470_050_wait_bounded(self):
+        """A worker waiting for another worker's hash of the same key gives up after its timeout"""
+        cache = pipeline.SignatureCache()
+        started, release = threading.Event(), threading.Event()
+
+        def hang():
+            started.set()
+            release.wait(10)
+            return 'signature'
+
+        owner = threading.Thread(target=cache.signature, args=('key', hang))
+        owner.start()
+        started.wait(5)
+        try:
+            start = time.monotonic()
+            self.assertEqual(cache.signature('key', lambda: 'other', timeout=0.05), (pipeline.TIMED_OUT, False))
+            self.assertLess(time.monotonic() - start, 5)
+        finally:
+            release.set()
+            owner.join()
+        self.assertEqual(cache.signature('key', lambda: 'other', timeout=0.05), ('signature', False))
+
+    def test_470_060_wait_budget(self):
+        """The wait for a link being hashed elsewhere is bounded by the file timeout and the run"""
+        cache = pipeline.SignatureCache()
+        key = cache.stat_key('sha224', os.stat(self.asset))
+        cache._computing[key] = threading.Event()      # Never finished
+        for options in ({'file_timeout': 0.05}, {'run_timeout': 0.05}):
+            cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create', no_config=True,
+                                            extensions=['.js'], signature_cache=cache, **options)
+            start = time.monotonic()
+            results = {result.path: result.status for result in cataloger.iter_create()}
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(results['v1/asset.js'], 'timeout')
+            if 'file_timeout' in options:
+                # Only the file which waited is timed out - the run carries on
+                self.assertEqual(results['v1/single.js'], 'added')
+
+        # The worker itself gives up - it isn't left waiting once it is abandoned
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create', no_config=True,
+                                        signature_cache=cache, file_timeout=0.05)
+        self.assertIs(cataloger._file_signature(self.asset), pipeline.TIMED_OUT)
+
+
+class TestPhysicalOrder(TreeTestCase):
+    def tree_files(self):
+        return {'{}/file{}.py'.format(directory, index): '{} {}'.format(directory, index) * 100
+                for directory in ('b', 'a') for index in range(5)}
+
+    def test_480_000_sweep_single_job(self):
+        """With a single job each lookahead is done in position order - the results stay in order"""
+        positions = [5, 3, 9, 1, 8, 2, 7, 6]
+        started = []
+
+        def work(index):
+            started.append(index)
+            return index
+
+        pool = pipeline.WorkerPool(jobs=1, schedule='inode', lookahead=4)
+        results = list(pool.imap(((index, functools.partial(work, index)) for index in range(8)),
+                                 position=lambda index: positions[index]))
+        self.assertEqual(results, [(index, index) for index in range(8)])
+        self.assertEqual(started, [3, 1, 0, 2, 5, 7, 6, 4])
+
+    def test_480_010_sweep_with_workers(self):
+        """With workers each lookahead is started in position order"""
+        positions = [5, 3, 9, 1, 8, 2, 7, 6]
+        started = []
+
+        def work(index):
+            started.append(index)
+            return index
+
+        pool = pipeline.WorkerPool(jobs=1, schedule='physical', lookahead=4)
+        try:
+            results = list(pool.imap(((index, functools.partial(work, index)) for index in range(8)),
+                                     position=lambda index: positions[index], timeout=lambda item: 5))
+        finally:
+            pool.shutdown()
+        self.assertEqual(results, [(index, index) for index in range(8)])
+        self.assertEqual(started[:4], [3, 1, 0, 2])
+        self.assertEqual(sorted(started), list(range(8)))
+
+    def test_480_020_physical_offset(self):
+        """The physical offset is found where FIEMAP is available"""
+        offset = readers.physical_offset(os.path.join(self.root, 'a', 'file1.py'))
+        self.assertTrue(offset is None or offset >= 0)
+        self.assertIsNone(readers.physical_offset(os.path.join(self.root, 'nothing.py')))
+
+    def test_480_030_read_order(self):
+        """The files are read in inode order - and the results are unchanged"""
+        expected = [tuple(result) for result in
+                    processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True).iter_check()]
+        for schedule in ('inode', 'physical'):
+            for jobs in (1, 3):
+                cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                                no_config=True, schedule=schedule, jobs=jobs, batch_files=1)
+                read = []
+                original = cataloger._hash_file
+
+                def hash_file(abs_path, *args):
+                    read.append(abs_path)
+                    return original(abs_path, *args)
+
+                with patch.object(cataloger, '_hash_file', side_effect=hash_file):
+                    results = [tuple(result) for result in cataloger.iter_check()]
+                self.assertEqual(results, expected)
+                if schedule == 'inode' and jobs == 1:
+                    self.assertEqual(read, sorted(read, key=lambda path: os.stat(path).st_ino))
+
+    def test_480_040_batch_order(self):
+        """The files in a batch are hashed in position order"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, schedule='inode', jobs=2)
+        cataloger._prepare_run()
+        tasks = list(cataloger._tasks())
+        read = []
+        with patch.object(cataloger, 'get_signature', side_effect=lambda rel_path: read.append(rel_path)):
+            cataloger._batch_signatures(tasks)
+        self.assertEqual(read, sorted(read, key=lambda path: os.stat(cataloger.abs_path(path)).st_ino))
+
+    def test_480_050_batch_without_files(self):
+        """Tasks which need no hashing between large files are never a Batch of their own"""
+        shutil.rmtree(self.root)
+        for name in ('d1/big.py', 'd2/big2.py'):
+            self.write_file(name, os.urandom(200 * 1024))
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True)
+        self.write_file('d1/new.py', 'new')
+        for schedule in ('inode', 'physical'):
+            cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                            no_config=True, schedule=schedule, jobs=2, extensions=['.py'])
+            results = sorted(tuple(result[:2]) for result in cataloger.iter_check())
+            self.assertEqual(results, [('d1/big.py', 'processed'), ('d1/new.py', 'extra'),
+                                       ('d2/big2.py', 'processed')])
+
+
+class TestSparseFiles(TreeTestCase):
+    create_tree_catalog = False
+
+    def setUp(self):
+        super().setUp()
+        self.sparse = os.path.join(self.root, 'disk.img')
+        with open(self.sparse, 'wb') as fp:
+            fp.seek(3 * 1024 * 1024)
+            fp.write(b'data in the middle' * 1000)
+            fp.seek(8 * 1024 * 1024)
+            fp.write(b'more data')
+            fp.truncate(12 * 1024 * 1024)     # Ends in a hole
+        self.plain = self.write_file('plain.txt', 'not sparse at all' * 100)
+
+    def _is_sparse(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return readers.is_sparse(fd)
+        finally:
+            os.close(fd)
+
+    def _digest(self, path, **kwargs):
+        digest = hashlib.sha224()
+        total = readers.hash_file(path, digest.update, **kwargs)
+        return digest.hexdigest(), total
+
+    def test_490_000_regions_cover_file(self):
+        """The regions are contiguous and cover the whole file"""
+        fd = os.open(self.sparse, os.O_RDONLY)
+        try:
+            found = list(readers.regions(fd))
+        finally:
+            os.close(fd)
+        offset = 0
+        for start, length, is_data in found:
+            self.assertEqual(start, offset)
+            self.assertGreater(length, 0)
+            offset += length
+        self.assertEqual(offset, os.path.getsize(self.sparse))
+        self.assertTrue(any(is_data for _, _, is_data in found))
+
+    def test_490_010_same_digest(self):
+        """Skipping the holes gives the same signature as a full read"""
+        if not self._is_sparse(self.sparse):
+            self.skipTest('The file system does not support sparse files')
+        expected, size = self._digest(self.sparse)
+        self.assertEqual(size, os.path.getsize(self.sparse))
+        digest, read = self._digest(self.sparse, sparse=True)
+        self.assertEqual(digest, expected)
+        self.assertEqual(self._digest(self.sparse, sparse=True, policy='nocache'), (expected, read))
+        pool = readers.BufferPool(256 * 1024, chunk_size=64 * 1024)
+        self.assertEqual(self._digest(self.sparse, sparse=True, buffers=pool), (expected, read))
+        self.assertLessEqual(pool.peak_bytes, 256 * 1024)
+
+    def test_490_020_holes_not_read(self):
+        """Only the data regions are counted by the read limiter"""
+        if not self._is_sparse(self.sparse):
+            self.skipTest('The file system does not support sparse files')
+        limiter = throttle.ReadLimiter()
+        _, read = self._digest(self.sparse, sparse=True, limiter=limiter)
+        self.assertEqual(limiter.files_read, 1)
+        self.assertLess(limiter.bytes_read, os.path.getsize(self.sparse) // 2)
+        self.assertEqual(read, limiter.bytes_read)
+
+    def test_490_030_plain_file(self):
+        """A file without holes is read in full"""
+        self.assertFalse(self._is_sparse(self.plain))
+        limiter = throttle.ReadLimiter()
+        expected = self._digest(self.plain)
+        self.assertEqual(self._digest(self.plain, sparse=True, limiter=limiter), expected)
+        self.assertEqual(limiter.bytes_read, os.path.getsize(self.plain))
+
+    def test_490_040_check_sparse(self):
+        """A catalog created with a full read is matched when the holes are skipped"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, extensions=['.img', '.txt'])
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, extensions=['.img', '.txt'], sparse=True)
+        results = list(cataloger.iter_check())
+        self.assertEqual(sorted(result.path for result in results), ['disk.img', 'plain.txt'])
+        self.assertTrue(all(result.status == 'processed' for result in results))
+
+    def test_490_050_stats(self):
+        """The holes are counted apart from the bytes read"""
+        if not self._is_sparse(self.sparse):
+            self.skipTest('The file system does not support sparse files')
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create',
+                                        no_config=True, extensions=['.img'], sparse=True, stats=True)
+        list(cataloger.iter_create())
+        stats = cataloger.stats.as_dict()
+        self.assertLess(stats['bytes_read'], os.path.getsize(self.sparse) // 2)
+        self.assertEqual(stats['bytes_read'] + stats['bytes_in_holes'], os.path.getsize(self.sparse))
+        self.assertIn('bytes of holes hashed without reading them', cataloger.stats.summary_table())
+
+
+class TestMultipleHashes(TreeTestCase):
+    create_tree_catalog = False
+    content = {'a.py': b'print("a")\n', 'b.txt': b'some text\n'}
+
+    def tree_files(self):
+        return self.content
+
+    def test_490_100_create_several(self):
+        """Each entry carries a signature for each algorithm - from one read of each file"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='create',
+                                        no_config=True, hash='sha224,blake2b')
+        with patch('builtins.open', wraps=builtins.open) as opened:
+            list(cataloger.iter_create())
+        self.assertEqual(sorted(os.path.normpath(args[0]) for args, _ in opened.call_args_list
+                                if args[0].startswith(self.root)),
+                         sorted(os.path.join(self.root, name) for name in self.content))
+        cataloger.write_catalog()
+        with open(self.catalog) as fp:
+            entries = dict(line.rstrip('\n').split('\t') for line in fp)
+        entries = {os.path.normpath(path): signature for path, signature in entries.items()}
+        for name, content in self.content.items():
+            self.assertEqual(entries[name], 'sha224:{},blake2b:{}'.format(
+                hashlib.sha224(content).hexdigest(), hashlib.blake2b(content).hexdigest()))
+
+    def test_490_110_check_catalog_algorithms(self):
+        """A check uses the algorithms in the catalog - whichever are asked for"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, hash='sha224,blake2b')
+        for hash_name in ('sha224', 'blake2b', 'sha224,blake2b', 'sha256'):
+            self.assertEqual(self._check(hash=hash_name), {'a.py': 'processed', 'b.txt': 'processed'})
+        checker = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                      no_config=True, hash='blake2b')
+        self.assertEqual(checker._hashes, ['blake2b'])
+        self.assertEqual(checker.get_signature(os.path.join('.', 'a.py'), from_catalog=True),
+                         hashlib.blake2b(self.content['a.py']).hexdigest())
+
+    def test_490_120_check_mismatch(self):
+        """A changed file is a mismatch whichever algorithm is checked"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, hash='sha224,blake2b')
+        with open(os.path.join(self.root, 'a.py'), 'ab') as fp:
+            fp.write(b'# changed\n')
+        for hash_name in ('sha224', 'blake2b', 'md5'):
+            self.assertEqual(self._check(hash=hash_name), {'a.py': 'mismatch', 'b.txt': 'processed'})
+
+    def test_490_130_plain_catalog(self):
+        """A catalog of plain digests is still checked with the first algorithm asked for"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, hash='sha256')
+        with open(self.catalog) as fp:
+            self.assertNotIn(':', fp.read())
+        self.assertEqual(self._check(hash='sha256,blake2b'), {'a.py': 'processed', 'b.txt': 'processed'})
+        self.assertEqual(self._check(hash='sha224'), {'a.py': 'mismatch', 'b.txt': 'mismatch'})
+
+    def test_490_140_invalid_signatures(self):
+        """Invalid multi-algorithm signatures are rejected"""
+        for signature in ('sha224:xyz', ':abcd', 'sha224:', 'sha224:abcd,efgh'):
+            with open(self.catalog, 'w') as fp:
+                fp.write('a.py\t{}\n'.format(signature))
+            with self.assertRaises(processor.CatalogError):
+                processor.Cataloger(root=self.root, catalog=self.catalog, action='check', no_config=True)
+        with open(self.catalog, 'w') as fp:
+            fp.write('a.py\tnot_a_hash:abcd\n')
+        with self.assertRaisesRegex(processor.CatalogError, 'not_a_hash'):
+            processor.Cataloger(root=self.root, catalog=self.catalog, action='check', no_config=True)
+
+    def test_490_150_cli_hash_list(self):
+        """The command line accepts a list of algorithms"""
+        self.assertEqual(cli_main.validate_hash(None, None, ' sha224, blake2b '), 'sha224,blake2b')
+        param = click.Option(['--hash'], metavar='HASH_FUNCTION')
+        with self.assertRaises(click.BadParameter):
+            cli_main.validate_hash(None, param, 'sha224,nothing')
+
+
+class TestFingerprintPolicies(TreeTestCase):
+    create_tree_catalog = False
+
+    def setUp(self):
+        self.block = defaults.DEFAULT_PARTIAL_BLOCK_SIZE
+        self.large = bytearray(os.urandom(40 * self.block))
+        self.policies = {'.png': 'partial/2', '.gif': 'stat'}
+        super().setUp()
+
+    def tree_files(self):
+        return {'photo.png': self.large, 'anim.gif': b'GIF89a' * 100, 'code.py': b'print("hello")\n'}
+
+    def _entries(self):
+        with open(self.catalog) as fp:
+            return {os.path.normpath(path): signature
+                    for path, signature in (line.rstrip('\n').split('\t') for line in fp)}
+
+    def test_490_200_policy_names(self):
+        """Policies are validated and partial always records its number of samples"""
+        self.assertEqual(processor.normalise_policy('partial'),
+                         'partial/{}'.format(defaults.DEFAULT_PARTIAL_SAMPLES))
+        self.assertEqual(processor.normalise_policy(' partial/3 '), 'partial/3')
+        self.assertEqual(processor.normalise_policy('stat'), 'stat')
+        for spec in ('sampled', 'stat/3', 'partial/x', 'partial/'):
+            with self.assertRaises(ValueError):
+                processor.normalise_policy(spec)
+        with self.assertRaises(ValueError):
+            processor.Cataloger(no_config=True, policies={'.png': 'quick'})
+
+    def test_490_210_blocks(self):
+        """The head, tail and sampled blocks are apart - a small file is read in full"""
+        self.assertEqual(readers.fingerprint_blocks(0), [])
+        self.assertEqual(readers.fingerprint_blocks(600, 2, 100), [(0, 600)])
+        blocks = readers.fingerprint_blocks(10000, 3, 100)
+        self.assertEqual(len(blocks), 5)
+        self.assertEqual((blocks[0], blocks[-1]), ((0, 100), (9900, 100)))
+        self.assertTrue(all(a[0] + a[1] <= b[0] for a, b in zip(blocks, blocks[1:])))
+
+    def test_490_220_create(self):
+        """The policy is recorded in each entry - and only the sampled blocks are read"""
+        env = commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True,
+                                      policies=self.policies, stats=True)
+        entries = self._entries()
+        self.assertEqual(entries['code.py'], hashlib.sha224(b'print("hello")\n').hexdigest())
+        self.assertTrue(entries['photo.png'].startswith('partial/2='))
+        self.assertTrue(entries['anim.gif'].startswith('stat='))
+        self.assertEqual(env.stats.bytes_read, 4 * self.block + len(b'print("hello")\n'))
+
+    def test_490_230_check_uses_recorded_policy(self):
+        """A check fingerprints each file with the policy in its catalog entry"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, policies=self.policies)
+        expected = {'photo.png': 'processed', 'anim.gif': 'processed', 'code.py': 'processed'}
+        self.assertEqual(self._check(), expected)
+        self.assertEqual(self._check(policies={'.png': 'stat', '.py': 'partial'}), expected)
+
+    def test_490_240_partial_changes(self):
+        """A change to the size, or a sampled block, is a mismatch - other changes aren't seen"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, policies=self.policies)
+        blocks = readers.fingerprint_blocks(len(self.large), 2, self.block)
+        unsampled = blocks[1][0] + self.block
+        self.large[unsampled] ^= 0xFF
+        self.write_file('photo.png', self.large)
+        self.assertEqual(self._check()['photo.png'], 'processed')
+        self.large[blocks[1][0]] ^= 0xFF
+        self.write_file('photo.png', self.large)
+        self.assertEqual(self._check()['photo.png'], 'mismatch')
+        self.write_file('photo.png', self.large[:-1])
+        self.assertEqual(self._check()['photo.png'], 'mismatch')
+
+    def test_490_250_stat_changes(self):
+        """The stat policy sees a change of modification time"""
+        commands.create_catalog(root=self.root, catalog=self.catalog, no_config=True, policies=self.policies)
+        path = os.path.join(self.root, 'anim.gif')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self._check()['anim.gif'], 'mismatch')
+
+    def test_490_260_config(self):
+        """Policies can be given in the [policies] section of the config"""
+        config = os.path.join(self.tmp, 'catalog.cfg')
+        with open(config, 'w') as fp:
+            fp.write('[policies]\n.png, .jpg = partial/16\n.gif = stat\n')
+        cataloger = processor.Cataloger(config=config, policies={'.jpg': 'full'})
+        self.assertEqual(cataloger._policies, {'.png': 'partial/16', '.jpg': 'full', '.gif': 'stat'})
+        self.assertEqual(processor.Cataloger(no_config=True)._policies, {})
+        for line in ('png = stat', '.png = quick', '.png'):
+            with open(config, 'w') as fp:
+                fp.write('[policies]\n{}\n'.format(line))
+            with self.assertRaises(processor.ConfigError):
+                processor.Cataloger(config=config)
+
+    def test_490_270_invalid_catalog_policy(self):
+        """A catalog entry with an unknown policy is an error"""
+        with open(self.catalog, 'w') as fp:
+            fp.write('photo.png\tquick={}\n'.format(hashlib.sha224(b'').hexdigest()))
+        with self.assertRaises(processor.CatalogError):
+            processor.Cataloger(root=self.root, catalog=self.catalog, action='check', no_config=True)
+
+
+class TestHashBench(TreeTestCase):
+    create_tree_catalog = False
+
+    def setUp(self):
+        super().setUp()
+        self.config = os.path.join(self.tmp, 'catalog.cfg')
+
+    def test_500_000_candidates(self):
+        """Every candidate can be used for a catalog - the shake algorithms are skipped"""
+        candidates = hashbench.candidate_algorithms()
+        self.assertIn('sha224', candidates)
+        self.assertFalse(any(name.startswith('shake') for name in candidates))
+        self.assertEqual(candidates, sorted(candidates))
+
+    def test_500_010_run_benchmark(self):
+        """Each combination is measured - chunks larger than the file are only measured once"""
+        seen = []
+        results = hashbench.run_benchmark(['sha224', 'md5'], file_sizes=[1024, 300 * 1024],
+                                          chunk_sizes=[64 * 1024, 1024 * 1024], threads=[1, 2],
+                                          duration=0.001, directory=self.root, on_measurement=seen.append)
+        self.assertEqual(results, seen)
+        self.assertEqual(len(results), 2 * 2 * (1 + 2))
+        self.assertTrue(all(result.bytes_per_second > 0 for result in results))
+        self.assertEqual({result.chunk_size for result in results if result.file_size == 1024}, {64 * 1024})
+        self.assertEqual(os.listdir(self.root), [])
+
+    def test_500_020_rank_and_recommend(self):
+        """The algorithms are ranked by throughput, and weak ones are only recommended if allowed"""
+        M = hashbench.Measurement
+        rankings = hashbench.rank([M('md5', 100, 64, 1, 900.0), M('md5', 100, 1024, 1, 800.0),
+                                   M('sha256', 100, 64, 1, 300.0), M('sha256', 100, 1024, 1, 500.0),
+                                   M('sha256', 100, 1024, 4, 700.0), M('sha224', 100, 64, 1, 100.0)])
+        self.assertEqual([r.algorithm for r in rankings], ['md5', 'sha256', 'sha224'])
+        self.assertEqual(rankings[1], hashbench.Ranking('sha256', 500.0, 700.0, 1024))
+        self.assertEqual(rankings[0].multi, rankings[0].single)
+        self.assertEqual(hashbench.recommend(rankings).algorithm, 'sha256')
+        self.assertEqual(hashbench.recommend(rankings, allow_weak=True).algorithm, 'md5')
+        self.assertIsNone(hashbench.recommend([]))
+        self.assertIn('Recommended : hash = sha256, chunk_size = 1K',
+                      hashbench.format_table(rankings, hashbench.recommend(rankings)))
+
+    def test_500_030_write_new_config(self):
+        """The recommendation is written to a new config file"""
+        hashbench.write_recommendation(self.config, 'blake2b', 1024 * 1024)
+        with open(self.config) as fp:
+            self.assertEqual(fp.read(), '[catalog]\nchunk_size = 1048576\nhash = blake2b\n')
+
+    def test_500_040_update_config(self):
+        """An existing config keeps its other options - and the recommendation is used"""
+        with open(self.config, 'w') as fp:
+            fp.write('[catalog]\n# The hash\nhash = md5\nio_policy = normal\n\n[extensions]\n+.img\n')
+        hashbench.write_recommendation(self.config, 'blake2b', 65536)
+        with open(self.config) as fp:
+            self.assertEqual(fp.read(), '[catalog]\n# The hash\nhash = blake2b\nio_policy = normal\n'
+                                        'chunk_size = 65536\n\n[extensions]\n+.img\n')
+        cataloger = processor.Cataloger(config=self.config)
+        self.assertEqual((cataloger._hash, cataloger._chunk_size), ('blake2b', 65536))
+        self.assertEqual(processor.Cataloger(config=self.config, hash='sha256')._hash, 'sha256')
+
+    def test_500_045_chunk_size_used(self):
+        """A configured chunk_size is used to read every file - otherwise files are read in one go"""
+        self.write_file('a.py', b'a' * 200000)
+        with open(self.config, 'w') as fp:
+            fp.write('[catalog]\nchunk_size = 65536\n')
+        expected = hashlib.sha224(b'a' * 200000).hexdigest()
+        for options, chunk_size in (({'config': self.config}, 65536), ({'chunk_size': 4096}, 4096),
+                                    ({'no_config': True}, None)):
+            cataloger = processor.Cataloger(root=self.root, **options)
+            with patch('cataloger.readers.hash_file', wraps=readers.hash_file) as hash_file:
+                self.assertEqual(cataloger.get_signature('a.py'), expected)
+            if chunk_size is None:
+                hash_file.assert_not_called()
+            else:
+                self.assertEqual(hash_file.call_args[1]['chunk_size'], chunk_size)
+
+    def test_500_050_invalid_chunk_size(self):
+        """An invalid chunk_size in the config is an error"""
+        with open(self.config, 'w') as fp:
+            fp.write('[catalog]\nchunk_size = big\n')
+        with self.assertRaises(processor.ConfigError):
+            processor.Cataloger(config=self.config)
+
+    def test_500_060_command(self):
+        """bench-hash prints the ranking, and writes the recommendation when asked"""
+        runner = click.testing.CliRunner()
+        result = runner.invoke(cli_main.main, ['-c', self.config, 'bench-hash', '-a', 'sha224,sha256',
+                                               '--file-size', '8K', '--chunk-size', '4K', '--threads', '1',
+                                               '--duration', '0.001', '--directory', self.tmp, '--write-config'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('sha224', result.output)
+        self.assertIn('Recommended : hash = ', result.output)
+        with open(self.config) as fp:
+            self.assertIn('chunk_size = 4096\n', fp.read())
+        result = runner.invoke(cli_main.main, ['bench-hash', '-a', 'no-such-hash'])
+        self.assertEqual(result.exit_code, 2)
+
+
+class TestDeadline(TreeTestCase):
+    names = ['old.txt', 'new.txt', 'sub/code.py', 'middle.png', 'sub/app.js', 'ancient.css']
+
+    def setUp(self):
+        super().setUp()
+        now = time.time()
+        for age, name in zip([50, 10, 40, 20, 5, 60], self.names):
+            os.utime(os.path.join(self.root, name), (now - age * 60, now - age * 60))
+
+    def tree_files(self):
+        return {name: name * 10 for name in self.names}
+
+    def _check(self, delay=0.0, **kwargs):
+        """Check the tree - returning the Cataloger, the results and the files hashed in order"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, **kwargs)
+        original = cataloger._file_signature
+        hashed = []
+
+        def signature(abs_path, *args):
+            hashed.append(os.path.relpath(abs_path, self.root))
+            time.sleep(delay)
+            return original(abs_path, *args)
+
+        with patch.object(cataloger, '_file_signature', side_effect=signature):
+            results = {result.path: result.status for result in cataloger.iter_check()}
+        return cataloger, results, hashed
+
+    def test_510_000_priority_order(self):
+        """Code files are hashed first, then the most recently modified"""
+        cataloger, results, hashed = self._check(deadline=30)
+        self.assertEqual(hashed, ['sub/app.js', 'sub/code.py', 'ancient.css',
+                                  'new.txt', 'middle.png', 'old.txt'])
+        self.assertEqual(set(results.values()), {'processed'})
+        self.assertEqual(cataloger.coverage, 1.0)
+        self.assertIsNone(cataloger.resume_token)
+
+    def test_510_010_deadline_reached(self):
+        """At the deadline the rest of the files are unverified - which isn't a failure"""
+        cataloger, results, hashed = self._check(delay=0.1, deadline=0.25)
+        verified = [path for path, status in results.items() if status == 'processed']
+        self.assertTrue(verified)
+        self.assertEqual(len(verified) + len(cataloger.unverified_files), 6)
+        self.assertTrue(cataloger.unverified_files)
+        self.assertIn('sub/app.js', verified)
+        self.assertAlmostEqual(cataloger.coverage, len(verified) / 6.0)
+        self.assertEqual(cataloger.status_count('missing'), 0)
+        self.assertFalse(commands.has_failures(cataloger))
+        self.assertIsNotNone(cataloger.resume_token)
+
+    def test_510_020_resume(self):
+        """A resumed check only hashes the files which weren't verified"""
+        first, results, _ = self._check(delay=0.1, deadline=0.25)
+        verified = {path for path, status in results.items() if status == 'processed'}
+        second, results, hashed = self._check(deadline=30, resume=first.resume_token)
+        self.assertEqual(set(hashed), set(self.names) - verified)
+        self.assertEqual(set(results), set(self.names) - verified)
+        self.assertEqual(second.coverage, 1.0)
+        self.assertEqual(second.status_count('missing'), 0)
+        self.assertIsNone(second.resume_token)
+
+    def test_510_030_mismatch_checked_again(self):
+        """A mismatched file isn't counted as verified by the resume token"""
+        with open(os.path.join(self.root, 'sub', 'app.js'), 'a') as fp:
+            fp.write('changed')
+        first, results, _ = self._check(delay=0.1, deadline=0.25)
+        self.assertEqual(results['sub/app.js'], 'mismatch')
+        self.assertTrue(commands.has_failures(first))
+        second, results, hashed = self._check(resume=first.resume_token)
+        self.assertEqual(hashed[0], 'sub/app.js')
+        self.assertEqual(results['sub/app.js'], 'mismatch')
+
+    def test_510_040_tokens(self):
+        """Tokens round trip - and are rejected for another catalog, or if damaged"""
+        token = resume.encode_token(20, 1234, [0, 5, 19])
+        self.assertEqual(resume.decode_token(token, 20, 1234), {0, 5, 19})
+        for count, checksum in ((21, 1234), (20, 4321)):
+            with self.assertRaises(ValueError):
+                resume.decode_token(token, count, checksum)
+        for damaged in ('', 'not a token', token[:-4]):
+            with self.assertRaises(ValueError):
+                resume.decode_token(damaged, 20, 1234)
+        with self.assertRaises(processor.ResumeError):
+            processor.Cataloger(root=self.root, catalog=self.catalog, action='check', no_config=True,
+                                deadline=1, resume=token)
+
+    def test_510_050_cli(self):
+        """The coverage and the resume token are reported"""
+        runner = click.testing.CliRunner()
+        with patch.object(processor.Cataloger, '_file_signature', autospec=True,
+                          side_effect=lambda env, abs_path, *args: time.sleep(0.1) or 'x'):
+            result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '--deadline', '0.15',
+                                                   'check'])
+            ndjson = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '--deadline', '0.15',
+                                                   '--format', 'ndjson', 'check'])
+        self.assertRegex(result.output, r'Deadline of 0.15s - \d+\.\d% of the catalog verified, \d files not verified')
+        self.assertIn('Resume token : ', result.output)
+        summary = json.loads(ndjson.output.splitlines()[-1])
+        self.assertLess(summary['coverage'], 1.0)
+        self.assertTrue(summary['resume_token'])
+        self.assertGreater(summary['status_counts']['unverified'], 0)
+        result = runner.invoke(cli_main.main, ['--resume', 'abc', 'check-many', '-p', self.root, self.catalog])
+        self.assertEqual(result.exit_code, 2)
+        result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '--resume', 'abc', 'check'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('Invalid --resume token : Invalid resume token', result.stderr)
+        self.assertNotIn('Unable to read catalog file', result.stderr)
+        result = runner.invoke(cli_main.main, ['--deadline', '5', 'check-many', '-p', self.root, self.catalog])
+        self.assertEqual(result.exit_code, 2)
+
+    def test_510_060_coverage_gate(self):
+        """Unverified files aren't counted as processed - and a check which verified too little fails"""
+        cataloger, _, _ = self._check(delay=0.3, deadline=0.01)
+        self.assertEqual(cataloger.coverage, 0)
+        self.assertEqual(cataloger.processed_count, 0)
+        self.assertTrue(cataloger.below_min_coverage)
+        self.assertTrue(commands.has_failures(cataloger))
+
+        cataloger, results, _ = self._check(delay=0.1, deadline=0.25)
+        verified = sum(status == 'processed' for status in results.values())
+        self.assertEqual(cataloger.processed_count, verified)
+        self.assertEqual(sum(cataloger.extension_counts.values()), verified)
+        self.assertFalse(cataloger.below_min_coverage)
+        self.assertFalse(commands.has_failures(cataloger))
+        for min_coverage, below in ((0.01, False), (0.99, True)):
+            cataloger, _, _ = self._check(delay=0.1, deadline=0.25, min_coverage=min_coverage)
+            self.assertEqual(cataloger.below_min_coverage, below)
+
+
+class TestFailFast(TreeTestCase):
+    names = ['file{:02}.txt'.format(index) for index in range(40)] + ['sub/code.py']
+
+    def tree_files(self):
+        return {name: name * 10 for name in self.names}
+
+    def _check(self, delay=0.0, signature=None, **kwargs):
+        """Check the tree with fail fast - returning the Cataloger, the results and the number of files hashed"""
+        cataloger = processor.Cataloger(root=self.root, catalog=self.catalog, action='check',
+                                        no_config=True, fail_fast=True, **kwargs)
+        original = cataloger._file_signature
+        hashed = []
+
+        def file_signature(abs_path, *args):
+            hashed.append(abs_path)
+            time.sleep(delay)
+            return signature if signature is not None else original(abs_path, *args)
+
+        with patch.object(cataloger, '_file_signature', side_effect=file_signature):
+            results = [(result.path, result.status) for result in cataloger.iter_check()]
+        return cataloger, results, len(hashed)
+
+    def test_520_000_no_failures(self):
+        """A check without any failures runs to the end"""
+        cataloger, results, hashed = self._check()
+        self.assertIsNone(cataloger.first_failure)
+        self.assertEqual(hashed, 41)
+        self.assertEqual(cataloger.status_count('processed'), 41)
+        self.assertFalse(commands.has_failures(cataloger))
+
+    def test_520_010_extra_before_hashing(self):
+        """An extra file stops the check before any file is hashed"""
+        with open(os.path.join(self.root, 'sub', 'new.py'), 'w') as fp:
+            fp.write('new')
+        cataloger, results, hashed = self._check()
+        self.assertEqual(hashed, 0)
+        self.assertEqual(results, [('sub/new.py', 'extra')])
+        self.assertEqual(cataloger.first_failure.status, 'extra')
+        self.assertTrue(commands.has_failures(cataloger))
+
+    def test_520_020_missing_before_hashing(self):
+        """A missing file stops the check before any file is hashed"""
+        os.remove(os.path.join(self.root, 'file05.txt'))
+        cataloger, results, hashed = self._check()
+        self.assertEqual(hashed, 0)
+        self.assertEqual(results, [('file05.txt', 'missing')])
+        self.assertIsNotNone(cataloger.first_failure.expected)
+        self.assertEqual(cataloger.missing_files, ['file05.txt'])
+
+    def test_520_030_mismatch_cancels_hashing(self):
+        """The first mismatch stops the check - the hashing still pending is cancelled"""
+        cataloger, results, hashed = self._check(delay=0.02, signature='0' * 64, jobs=4)
+        self.assertEqual(cataloger.first_failure.status, 'mismatch')
+        self.assertEqual(results[-1], (cataloger.first_failure.path, 'mismatch'))
+        self.assertLess(hashed, 41)
+        self.assertEqual(cataloger.status_count('mismatch'), 1)
+
+    def test_520_040_unreported_not_a_failure(self):
+        """A category which isn't reported doesn't stop the check"""
+        with open(os.path.join(self.root, 'sub', 'new.py'), 'w') as fp:
+            fp.write('new')
+        cataloger, results, hashed = self._check(report_extra=False)
+        self.assertIsNone(cataloger.first_failure)
+        self.assertEqual(hashed, 41)
+
+    def test_520_050_cli(self):
+        """Only the first failure is reported - and the check exits with a failure"""
+        os.remove(os.path.join(self.root, 'file07.txt'))
+        runner = click.testing.CliRunner()
+        result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '--fail-fast', 'check'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.output, 'Check stopped at the first failure - missing : file07.txt\n')
+        result = runner.invoke(cli_main.main, ['-r', self.root, '-m', self.catalog, '--fail-fast',
+                                               '--format', 'ndjson', 'check'])
+        self.assertEqual(result.exit_code, 1)
+        summary = json.loads(result.output.splitlines()[-1])
+        self.assertEqual(summary['stopped_at'], 'file07.txt')
+
+    def test_520_060_check_many(self):
+        """The first root with a failure stops a check of many roots"""
+        os.remove(os.path.join(self.root, 'file00.txt'))
+        checks = commands.check_many_catalogs([(self.root, self.catalog), (self.root, self.catalog)],
+                                              no_config=True, fail_fast=True)
+        self.assertEqual(len(checks), 1)
+        self.assertEqual(checks[0].cataloger.first_failure.path, 'file00.txt')
+
+
 def load_tests(loader, tests=None, patterns=None,excludes=None):
     """Load tests from all of the relevant classes, and order them"""
     classes = [cls for name, cls in inspect.getmembers(sys.modules[__name__],